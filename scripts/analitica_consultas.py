@@ -0,0 +1,160 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+import numpy as np
+import threading
+import time
+
+COLECCION_LOG = "log_consultas"
+COLECCION_FRECUENCIA = "frecuencia_consultas"
+TAMANO_LOG_BYTES = 50 * 1024 * 1024
+
+_medicion_actual = ContextVar("medicion_consulta", default=None)
+
+
+def sumar_documentos(n):
+    """Suma documentos leídos a la medición en curso (si hay una)."""
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion["documentos"] += n
+
+
+def marcar_cache(hit):
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion["cache_hit"] = hit
+
+
+class RegistroConsultas:
+    """
+    Log de consultas append-only con escritura en lotes.
+
+    Cada request solo agrega un dict a un buffer en memoria; un hilo aparte
+    lo vacía cada `intervalo_segundos` (o antes si se llena) con un
+    insert_many a una colección capped y un bulk_write de contadores por
+    RUT en `frecuencia_consultas` (que usa el precalentamiento). Si Mongo
+    falla, el lote se descarta: es telemetría, no puede frenar la consulta.
+    """
+
+    def __init__(self, db, intervalo_segundos=10, tamano_lote=500):
+        self.db = db
+        self.intervalo_segundos = intervalo_segundos
+        self.tamano_lote = tamano_lote
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._evento = threading.Event()
+        self._hilo = None
+        self._coleccion_lista = False
+
+    @contextmanager
+    def medir(self, endpoint, rut):
+        medicion = {"documentos": 0, "cache_hit": False}
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            yield medicion
+        finally:
+            _medicion_actual.reset(token)
+            self.registrar(endpoint, rut, (time.perf_counter() - inicio) * 1000, **medicion)
+
+    def registrar(self, endpoint, rut, latencia_ms, documentos=0, cache_hit=False):
+        with self._lock:
+            self._buffer.append({
+                "endpoint": endpoint,
+                "rut": rut,
+                "latencia_ms": round(latencia_ms, 2),
+                "documentos": documentos,
+                "cache_hit": cache_hit,
+                "fecha": datetime.now(),
+            })
+            lleno = len(self._buffer) >= self.tamano_lote
+        self._iniciar_hilo()
+        if lleno:
+            self._evento.set()
+
+    def _iniciar_hilo(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._bucle, daemon=True)
+            self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            self._evento.wait(self.intervalo_segundos)
+            self._evento.clear()
+            self.vaciar()
+
+    def _asegurar_coleccion(self):
+        if self._coleccion_lista:
+            return
+        if COLECCION_LOG not in self.db.list_collection_names():
+            self.db.create_collection(COLECCION_LOG, capped=True, size=TAMANO_LOG_BYTES)
+        self.db[COLECCION_FRECUENCIA].create_index("rut", unique=True)
+        self.db[COLECCION_FRECUENCIA].create_index([("consultas", -1)])
+        self._coleccion_lista = True
+
+    def vaciar(self):
+        with self._lock:
+            lote, self._buffer = self._buffer, []
+        if not lote:
+            return 0
+
+        conteos = {}
+        for r in lote:
+            if r["rut"]:
+                conteos[r["rut"]] = conteos.get(r["rut"], 0) + 1
+
+        try:
+            self._asegurar_coleccion()
+            self.db[COLECCION_LOG].insert_many(lote, ordered=False)
+            if conteos:
+                ahora = datetime.now()
+                self.db[COLECCION_FRECUENCIA].bulk_write([
+                    UpdateOne(
+                        {"rut": rut},
+                        {"$inc": {"consultas": n}, "$set": {"ultima_consulta": ahora}},
+                        upsert=True
+                    )
+                    for rut, n in conteos.items()
+                ], ordered=False)
+        except Exception as e:
+            print(f"⚠ No se pudo guardar el log de consultas ({len(lote)} registros):", e)
+        return len(lote)
+
+
+def resumen_por_rut(db, dias=7, limite=20, endpoint=None):
+    """
+    Top RUTs por cantidad de consultas y por latencia p95 en los últimos
+    `dias`, leyendo solo el log capped (acotado por tamaño).
+    """
+    filtro = {"fecha": {"$gte": datetime.now() - timedelta(days=dias)}}
+    if endpoint:
+        filtro["endpoint"] = endpoint
+
+    grupos = db[COLECCION_LOG].aggregate([
+        {"$match": filtro},
+        {"$group": {
+            "_id": "$rut",
+            "consultas": {"$sum": 1},
+            "latencias": {"$push": "$latencia_ms"},
+            "documentos": {"$avg": "$documentos"},
+            "cache_hits": {"$sum": {"$cond": ["$cache_hit", 1, 0]}},
+        }},
+    ], allowDiskUse=True)
+
+    filas = []
+    for g in grupos:
+        latencias = np.asarray(g["latencias"], dtype=np.float64)
+        filas.append({
+            "rut": g["_id"],
+            "consultas": g["consultas"],
+            "latencia_p50_ms": float(np.percentile(latencias, 50)),
+            "latencia_p95_ms": float(np.percentile(latencias, 95)),
+            "documentos_promedio": float(g["documentos"] or 0),
+            "tasa_cache": g["cache_hits"] / g["consultas"],
+        })
+
+    return {
+        "por_consultas": sorted(filas, key=lambda f: f["consultas"], reverse=True)[:limite],
+        "por_latencia_p95": sorted(filas, key=lambda f: f["latencia_p95_ms"], reverse=True)[:limite],
+    }
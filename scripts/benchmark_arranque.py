@@ -0,0 +1,85 @@
+"""
+Mide cuánto tarda en importarse la API (lo que paga cada arranque en
+frío antes de abrir el puerto) y falla si se pasa del presupuesto o si
+el import trae módulos que deberían cargarse recién al usarse.
+
+Cada medición es un proceso nuevo (`python -X importtime`), así no hay
+módulos en cache; se resta lo que tarda un intérprete vacío.
+
+Uso: python -m scripts.benchmark_arranque [presupuesto_ms] [repeticiones]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODULO = "scripts.consultor_api"
+
+# Se importan dentro de las funciones que los usan (cargas, validación)
+PROHIBIDOS = ["pandas", "pyarrow", "openpyxl"]
+
+PRESUPUESTO_MS = 900
+REPETICIONES = 5
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def ejecutar(codigo):
+    entorno = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    inicio = time.perf_counter()
+    salida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=RAIZ, env=entorno, capture_output=True, text=True, check=True,
+    )
+    return (time.perf_counter() - inicio) * 1000, salida
+
+
+def modulos_mas_lentos(importtime, cantidad=10):
+    """[(ms acumulados, módulo)] de primer nivel según -X importtime."""
+    filas = []
+    for linea in importtime.splitlines():
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        _, acumulado, nombre = linea.split("|")
+        # Primer nivel: importado directamente por el módulo medido
+        if nombre.startswith("   ") and not nombre.startswith("    "):
+            filas.append((int(acumulado) / 1000, nombre.strip()))
+    return sorted(filas, reverse=True)[:cantidad]
+
+
+if __name__ == "__main__":
+    presupuesto = float(sys.argv[1]) if len(sys.argv) > 1 else PRESUPUESTO_MS
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else REPETICIONES
+
+    # Calentar la cache de disco del sistema antes de medir
+    ejecutar(f"import {MODULO}")
+
+    vacio = statistics.median(ejecutar("pass")[0] for _ in range(repeticiones))
+    tiempos = []
+    for _ in range(repeticiones):
+        ms, salida = ejecutar(
+            f"import sys, {MODULO}; print('cargados:' + ','.join(m for m in {PROHIBIDOS!r} if m in sys.modules))"
+        )
+        tiempos.append(ms - vacio)
+
+    # Última línea; lo que imprima el import queda antes
+    cargados = [m for m in salida.stdout.strip().splitlines()[-1].removeprefix("cargados:").split(",") if m]
+    mediana = statistics.median(tiempos)
+
+    print(f"Import de {MODULO} ({repeticiones} procesos, descontado intérprete vacío {vacio:.0f} ms)")
+    print(f"  mediana: {mediana:.0f} ms   mínimo: {min(tiempos):.0f} ms   máximo: {max(tiempos):.0f} ms")
+    print(f"  presupuesto: {presupuesto:.0f} ms")
+    print("Módulos de primer nivel más lentos (ms acumulados, última medición):")
+    for ms, nombre in modulos_mas_lentos(salida.stderr):
+        print(f"  {ms:8.1f}  {nombre}")
+
+    errores = []
+    if mediana > presupuesto:
+        errores.append(f"el import tarda {mediana:.0f} ms (presupuesto {presupuesto:.0f} ms)")
+    if cargados:
+        errores.append(f"el import carga módulos pesados: {', '.join(cargados)}")
+    for error in errores:
+        print(f"❌ {error}")
+    if errores:
+        sys.exit(1)
+    print("✅ Arranque dentro del presupuesto")
@@ -0,0 +1,69 @@
+"""
+Compara el costo de serializar una respuesta tipo /historico-pagos con
+el camino por defecto de FastAPI (jsonable_encoder + json.dumps) versus
+RespuestaRapida, y el tamaño en bytes con y sin gzip.
+
+Uso: python -m scripts.benchmark_serializacion [cantidad_registros]
+"""
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+import gzip
+import json
+import numpy as np
+import sys
+import time
+
+from scripts.respuestas import orjson, serializar
+
+
+def generar_payload(n):
+    base = datetime(2022, 1, 1)
+    pagos = []
+    for i in range(n):
+        emision = base + timedelta(days=i % 700)
+        pagos.append({
+            "fecha_ces": emision,
+            "fecha_emision": emision,
+            "fecha_pago": emision + timedelta(days=30 + i % 90),
+            "plazo": np.int32(30 + i % 90),
+            "monto": 1000 * i,
+            "clave_normalizada": (str(i), str(1000 + i)),
+            "clave_original": {"factura_doc": i, "factura_ope": 1000 + i, "pago_doc": str(i), "pago_ope": f"{1000 + i}.0"},
+        })
+    return {
+        "nombre_deudor": "MUNICIPALIDAD DE PRUEBA",
+        "cantidad": n,
+        "promedio_plazo": np.float64(74.5),
+        "pagos": pagos,
+    }
+
+
+def medir(funcion, repeticiones=5):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        salida = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, salida
+
+
+def por_defecto(payload):
+    # Lo que hace FastAPI con un dict devuelto por el endpoint
+    return json.dumps(
+        jsonable_encoder(payload, custom_encoder={np.generic: lambda v: v.item()}),
+        ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+    ).encode("utf-8")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    payload = generar_payload(n)
+
+    t_defecto, bytes_defecto = medir(lambda: por_defecto(payload))
+    t_rapida, bytes_rapida = medir(lambda: serializar(payload))
+
+    print(f"Registros: {n} | orjson: {'sí' if orjson else 'no (json estándar)'}")
+    print(f"jsonable_encoder + json: {t_defecto * 1000:8.1f} ms  {len(bytes_defecto):>10} bytes")
+    print(f"RespuestaRapida        : {t_rapida * 1000:8.1f} ms  {len(bytes_rapida):>10} bytes")
+    print(f"Con gzip               :             {len(gzip.compress(bytes_rapida)):>10} bytes")
+    print(f"Aceleración            : {t_defecto / t_rapida:8.1f}x")
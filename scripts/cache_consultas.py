@@ -0,0 +1,57 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class CacheConsultas:
+    """
+    Cache LRU en memoria con expiración, para resultados de /consultar-rut.
+
+    Los resultados dependen de la fecha (días vencidos, temporada de
+    verano), así que además del tamaño máximo cada entrada vence tras
+    `ttl_segundos`. Las cargas de docs/pagos/empresas y los cambios de
+    reglas llaman a `limpiar()`.
+    """
+
+    def __init__(self, max_entradas=500, ttl_segundos=6 * 3600):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            guardado, valor = entrada
+            if time.monotonic() - guardado > self.ttl_segundos:
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (time.monotonic(), valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, claves):
+        """Saca las claves dadas y devuelve las que estaban en el cache."""
+        with self._lock:
+            return [c for c in claves if self._datos.pop(c, None) is not None]
+
+    def descartar_si(self, condicion):
+        """Saca las entradas cuyo valor cumple `condicion(valor)`."""
+        with self._lock:
+            for clave in [c for c, (_, valor) in self._datos.items() if condicion(valor)]:
+                del self._datos[clave]
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
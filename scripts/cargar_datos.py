@@ -1,10 +1,14 @@
 import pandas as pd
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
-import hashlib
 import os
 import shutil
 
+from scripts.esquema import guardar_archivo, separar
+from scripts.hash_filas import hash_fila, hashes_dataframe
+from scripts.rut import clave_rut
+
 # Configuración Mongo
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
@@ -12,11 +16,9 @@ client = MongoClient(MONGO_URI)
 db = client["mi_base_datos"]
 coleccion = db["docs"]
 
-# Calcular hash por campos clave únicamente
+# Hash de la clave natural, canónico (scripts/hash_filas.py)
 def calcular_hash(fila):
-    claves_relevantes = ["RUT DEUDOR", "Nº DCTO", "Nº OPE"]
-    datos = tuple((clave, fila.get(clave)) for clave in claves_relevantes)
-    return hashlib.sha256(str(sorted(datos)).encode("utf-8")).hexdigest()
+    return hash_fila(fila, "docs")
 
 # Leer archivo Excel
 def cargar_excel(path):
@@ -33,45 +35,82 @@ def cargar_excel(path):
             print(f"❌ Error leyendo {path}: {e2}")
             return pd.DataFrame()
 
-# Insertar datos en MongoDB con control de duplicados y actualización si cambia estado
-def insertar_documentos(df, nombre_archivo):
-    total, nuevos, duplicados, actualizados = len(df), 0, 0, 0
-    coleccion.create_index("_hash", unique=True)
-
-    for _, fila in df.iterrows():
-        doc = fila.to_dict()
-        doc["_hash"] = calcular_hash(doc)
-        doc["origen_archivo"] = nombre_archivo
-        doc["origen_tipo"] = "docs"
+# Fila del Excel → (documento a guardar, columnas extra para el archivo).
+# El _hash puede venir ya calculado para todo el chunk (hashes_dataframe).
+def preparar_documento(fila, nombre_archivo, valor_hash=None):
+    fila["_hash"] = valor_hash or calcular_hash(fila)
+    fila["origen_archivo"] = nombre_archivo
+    fila["origen_tipo"] = "docs"
+    fila["rut_num"] = clave_rut(fila.get("RUT DEUDOR"))
+    return separar("docs", fila)
 
-        criterio = {
-            "RUT DEUDOR": doc.get("RUT DEUDOR"),
-            "Nº DCTO": doc.get("Nº DCTO"),
-            "Nº OPE": doc.get("Nº OPE")
-        }
+# Escribir un lote de documentos ya preparados. Mismo criterio que fila a
+# fila: existe (RUT, doc, ope) → se actualiza solo si cambió el ESTADO;
+# no existe → se inserta. Una consulta y dos escrituras por lote.
+# El _hash es justamente esa clave (scripts/hash_filas.py), así que se
+# busca por _hash con el índice único en vez de un $or por fila (las
+# filas con el _hash sha256 anterior no se encuentran: la API rechaza
+# las cargas hasta que se pasa scripts/migrar_hash.py).
+def escribir_lote(documentos, destino=None):
+    destino = coleccion if destino is None else destino
+    nuevos, duplicados, actualizados = 0, 0, 0
+    if not documentos:
+        return {"nuevos": 0, "duplicados": 0, "actualizados": 0}
 
-        existente = coleccion.find_one(criterio)
+    existentes = {
+        e["_hash"]: e
+        for e in destino.find(
+            {"_hash": {"$in": list({doc["_hash"] for doc in documentos})}},
+            {"_hash": 1, "ESTADO": 1}
+        )
+    }
 
-        if existente:
-            if existente.get("ESTADO") != doc.get("ESTADO"):
-                coleccion.update_one({"_id": existente["_id"]}, {"$set": doc})
+    # En orden, como si fueran fila a fila: una fila repetida dentro del
+    # lote se compara contra la anterior
+    estados, insertar, cambiar = {}, {}, {}
+    for doc in documentos:
+        k = doc["_hash"]
+        if k in existentes or k in insertar:
+            previo = estados.get(k, existentes[k].get("ESTADO") if k in existentes else None)
+            if previo != doc.get("ESTADO"):
                 actualizados += 1
+                (insertar if k in insertar else cambiar)[k] = doc
             else:
                 duplicados += 1
         else:
-            try:
-                coleccion.insert_one(doc)
-                nuevos += 1
-            except:
-                duplicados += 1
+            nuevos += 1
+            insertar[k] = doc
+        estados[k] = doc.get("ESTADO")
 
-    print(f"✅ Insertados: {nuevos} | 🔁 Duplicados: {duplicados} | 🔄 Actualizados: {actualizados}")
+    if insertar:
+        try:
+            destino.insert_many(list(insertar.values()), ordered=False)
+        except BulkWriteError as e:
+            fallidos = len(e.details.get("writeErrors", []))
+            nuevos -= fallidos
+            duplicados += fallidos
+    if cambiar:
+        destino.bulk_write([
+            UpdateOne({"_id": existentes[k]["_id"]}, {"$set": doc}) for k, doc in cambiar.items()
+        ], ordered=False)
 
-    return {
-        "nuevos": nuevos,
-        "duplicados": duplicados,
-        "actualizados": actualizados
-    }
+    return {"nuevos": nuevos, "duplicados": duplicados, "actualizados": actualizados}
+
+# Insertar datos en MongoDB con control de duplicados y actualización si cambia estado
+def insertar_documentos(df, nombre_archivo):
+    coleccion.create_index("_hash", unique=True)
+    coleccion.create_index("rut_num")
+    para_archivo = [
+        preparar_documento(fila, nombre_archivo, valor_hash)
+        for fila, valor_hash in zip(df.to_dict("records"), hashes_dataframe(df, "docs"))
+    ]
+
+    resumen = escribir_lote([doc for doc, _ in para_archivo])
+    guardar_archivo(db[f"{coleccion.name}_archivo"], para_archivo)
+
+    print(f"✅ Insertados: {resumen['nuevos']} | 🔁 Duplicados: {resumen['duplicados']} | 🔄 Actualizados: {resumen['actualizados']}")
+
+    return resumen
 
 
 # --------------------------
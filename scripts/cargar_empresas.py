@@ -1,19 +1,58 @@
+import numpy as np
 import pandas as pd
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
 
+from scripts.validacion_archivos import COLUMNAS_EMPRESAS as COLUMNAS
+
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 
-COLUMNAS = [
-    "Año comercial", "RUT", "DV", "Razón social",
-    "Tramo según ventas", "Rubro económico"
-]
+# Con EMPRESAS_COLUMNAR=<directorio> la carga escribe el almacén columnar
+# (scripts/empresas_columnar.py) en vez de la colección 'empresas'.
+DIRECTORIO_COLUMNAR = os.getenv("EMPRESAS_COLUMNAR")
 
 CHUNKSIZE = 20000
 
 
+def leer_chunks(ruta):
+    """Chunks del TXT del SII ya filtrados al año comercial 2023."""
+    for chunk in pd.read_csv(ruta, sep="\t", encoding="utf-8", usecols=COLUMNAS, chunksize=CHUNKSIZE):
+        chunk = chunk[chunk["Año comercial"] == 2023]
+        if not chunk.empty:
+            yield chunk
+
+
+def procesar_txt_columnar(ruta, directorio):
+    """
+    Igual que procesar_txt pero al almacén columnar: se acumulan las
+    columnas de todos los chunks y se escribe una sola vez, en secuencia.
+    El dedup es por cuerpo del RUT (la clave del almacén), quedando la
+    primera aparición.
+    """
+    from scripts.empresas_columnar import escribir_almacen
+
+    columnas = {"rut_num": [], "dv": [], "nombre": [], "rubro": [], "tramo": []}
+    for chunk in leer_chunks(ruta):
+        columnas["rut_num"].append(chunk["RUT"].to_numpy(dtype=np.int64))
+        columnas["dv"].append(chunk["DV"].astype(str).str.strip().str.upper().to_numpy())
+        columnas["nombre"].append(chunk["Razón social"].astype(str).str.strip().to_numpy())
+        columnas["rubro"].append(chunk["Rubro económico"].astype(str).str.strip().to_numpy())
+        columnas["tramo"].append(chunk["Tramo según ventas"].astype(str).str.strip().to_numpy())
+
+    if not columnas["rut_num"]:
+        raise ValueError("El archivo no contiene registros válidos para el año comercial 2023.")
+
+    columnas = {k: np.concatenate(v) for k, v in columnas.items()}
+    _, primeras = np.unique(columnas["rut_num"], return_index=True)
+    columnas = {k: v[primeras] for k, v in columnas.items()}
+
+    total = escribir_almacen(directorio, **columnas)
+    print(f"{total} empresas escritas al almacén columnar {directorio} desde archivo: {ruta}")
+    return total
+
+
 def procesar_txt(ruta):
     """
     Reemplaza por completo la colección 'empresas' a partir del TXT del SII.
@@ -34,6 +73,9 @@ def procesar_txt(ruta):
     Devuelve la cantidad de empresas cargadas. Lanza una excepción si el
     archivo no se pudo procesar o no contiene registros válidos.
     """
+    if DIRECTORIO_COLUMNAR:
+        return procesar_txt_columnar(ruta, DIRECTORIO_COLUMNAR)
+
     client = MongoClient(MONGO_URI)
     db = client["mi_base_datos"]
     staging = db["empresas_staging"]
@@ -43,11 +85,7 @@ def procesar_txt(ruta):
     total = 0
 
     try:
-        for chunk in pd.read_csv(ruta, sep="\t", encoding="utf-8", usecols=COLUMNAS, chunksize=CHUNKSIZE):
-            chunk = chunk[chunk["Año comercial"] == 2023]
-            if chunk.empty:
-                continue
-
+        for chunk in leer_chunks(ruta):
             chunk["rut"] = chunk["RUT"].astype(str) + "-" + chunk["DV"].astype(str)
 
             registros = []
@@ -58,6 +96,7 @@ def procesar_txt(ruta):
                 ruts_vistos.add(rut)
                 registros.append({
                     "rut": rut,
+                    "rut_num": int(row["RUT"]),
                     "nombre": str(row["Razón social"]).strip(),
                     "tramo_ventas": str(row["Tramo según ventas"]).strip(),
                     "rubro": str(row["Rubro económico"]).strip()
@@ -74,6 +113,8 @@ def procesar_txt(ruta):
         staging.drop()
         raise ValueError("El archivo no contiene registros válidos para el año comercial 2023.")
 
+    staging.create_index("rut_num")
+    staging.create_index([("rubro", 1), ("tramo_ventas", 1)])
     staging.rename("empresas", dropTarget=True)
     print(f"{total} empresas insertadas desde archivo: {ruta}")
     return total
@@ -1,10 +1,15 @@
 import pandas as pd
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
-import hashlib
 import os
 import shutil
 
+from scripts.esquema import guardar_archivo, separar
+from scripts.hash_filas import hash_fila, hashes_dataframe
+from scripts.rut import clave_rut
+from scripts.validacion_archivos import COLUMNAS_PAGOS, FILA_ENCABEZADO_PAGOS, hoja_pagos, normalizar_columnas
+
 # Conexión MongoDB
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
@@ -12,29 +17,26 @@ client = MongoClient(MONGO_URI)
 db = client["mi_base_datos"]
 coleccion = db["pagos"]
 
-# Crear hash único por fila
+# Hash de la clave natural, canónico (scripts/hash_filas.py)
 def calcular_hash(fila):
-    fila_str = str(sorted(fila.items()))
-    return hashlib.sha256(fila_str.encode("utf-8")).hexdigest()
+    return hash_fila(fila, "pagos")
 
 # Cargar y limpiar archivo Excel
 def cargar_y_limpiar_excel(path):
     try:
         xls = pd.ExcelFile(path)
-        hojas = xls.sheet_names
-        hoja_objetivo = next((h for h in hojas if "cartola" in h.lower()), hojas[0])
-        df = pd.read_excel(xls, sheet_name=hoja_objetivo, header=4)
+        hoja_objetivo = hoja_pagos(xls.sheet_names)
+        df = pd.read_excel(xls, sheet_name=hoja_objetivo, header=FILA_ENCABEZADO_PAGOS)
 
         # ✅ Limpiar y normalizar nombres de columnas
-        df.columns = df.columns.str.strip().str.replace(r'\s+', ' ', regex=True)
+        df.columns = normalizar_columnas(df.columns)
 
     except Exception as e:
         print(f"❌ Error al leer {path}: {e}")
         return pd.DataFrame()
 
     # Validar columnas requeridas
-    columnas_requeridas = ["Tipo Pago", "Det. Pago", "Tipo Prod.", "Rut Cliente", "Rut Deudor", "Fecha Pago", "Mto.Pagado"]
-    for col in columnas_requeridas:
+    for col in COLUMNAS_PAGOS:
         if col not in df.columns:
             print(f"⚠️ Faltan columnas requeridas en {path}. Columna ausente: '{col}'")
             return pd.DataFrame()
@@ -48,31 +50,48 @@ def cargar_y_limpiar_excel(path):
     print(f"\n📄 {path} cargado con {len(df)} filas válidas")
     return df
 
-# Insertar documentos en MongoDB
-def insertar_documentos(df, nombre_archivo):
-    total, nuevos, duplicados = len(df), 0, 0
-    coleccion.create_index("_hash", unique=True)
-
-    for _, fila in df.iterrows():
-        doc = fila.to_dict()
-        doc["_hash"] = calcular_hash(doc)
-        doc["origen_archivo"] = nombre_archivo
-        doc["origen_tipo"] = "pagos"
-
+# Fila del Excel → (documento a guardar, columnas extra para el archivo).
+# El _hash puede venir ya calculado para todo el chunk (hashes_dataframe).
+def preparar_documento(fila, nombre_archivo, valor_hash=None):
+    fila["_hash"] = valor_hash or calcular_hash(fila)
+    fila["origen_archivo"] = nombre_archivo
+    fila["origen_tipo"] = "pagos"
+    fila["rut_num"] = clave_rut(fila.get("Rut Deudor"))
+    return separar("pagos", fila)
+
+# Escribir un lote de documentos ya preparados: los que ya existen
+# (mismo _hash) rebotan en el índice único y cuentan como duplicados.
+def escribir_lote(documentos, destino=None):
+    destino = coleccion if destino is None else destino
+    nuevos, duplicados = len(documentos), 0
+    if documentos:
         try:
-            coleccion.insert_one(doc)
-            nuevos += 1
-        except:
-            duplicados += 1
-
-    print(f"✅ Insertados: {nuevos} | 🔁 Duplicados: {duplicados}")
-
+            destino.insert_many(documentos, ordered=False)
+        except BulkWriteError as e:
+            duplicados = len(e.details.get("writeErrors", []))
+            nuevos -= duplicados
     return {
         "nuevos": nuevos,
         "duplicados": duplicados,
         "actualizados": 0  # Pagos no se actualizan
     }
 
+# Insertar documentos en MongoDB
+def insertar_documentos(df, nombre_archivo):
+    coleccion.create_index("_hash", unique=True)
+    coleccion.create_index("rut_num")
+    para_archivo = [
+        preparar_documento(fila, nombre_archivo, valor_hash)
+        for fila, valor_hash in zip(df.to_dict("records"), hashes_dataframe(df, "pagos"))
+    ]
+
+    resumen = escribir_lote([doc for doc, _ in para_archivo])
+    guardar_archivo(db[f"{coleccion.name}_archivo"], para_archivo)
+
+    print(f"✅ Insertados: {resumen['nuevos']} | 🔁 Duplicados: {resumen['duplicados']}")
+
+    return resumen
+
 
 # Mover archivo procesado
 def mover_a_procesados(path):
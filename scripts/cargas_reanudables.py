@@ -0,0 +1,209 @@
+from datetime import datetime
+import hashlib
+import os
+
+# ------------------------------------------------------------
+# Cargas de docs/pagos por chunks con checkpoint.
+#
+# El DataFrame ya parseado se inserta de a `tamano_chunk` filas por el
+# pipeline de scripts/pipeline_carga.py (preparar y escribir en hilos
+# distintos) y, después de cada chunk, se guarda en metadata (tipo
+# "checkpoint_<tipo>") el hash del archivo y cuántos chunks quedaron
+# escritos. Si el proceso
+# muere (Render recicla la instancia), al volver a procesar el mismo
+# archivo —al arrancar o porque se vuelve a subir— se sigue desde el
+# último chunk confirmado.
+#
+# Repetir un chunk a medias es seguro: pagos tiene índice único en _hash
+# y docs busca por (RUT, doc, ope) antes de insertar.
+#
+# Con staging=True los chunks se escriben en '<tipo>_staging_<hash>' y
+# solo al final se fusionan con un $merge, así la colección real nunca
+# ve una carga a medias.
+# ------------------------------------------------------------
+
+TAMANO_CHUNK = int(os.getenv("TAMANO_CHUNK_CARGA", "2000"))
+
+CODIGO_DUPLICADO = 11000
+
+# Chunks en vuelo entre etapas del pipeline (scripts/pipeline_carga.py)
+CAPACIDAD_COLA = int(os.getenv("COLA_CARGA", "4"))
+
+# Hilos escritores. docs va con uno solo: una fila repetida en dos chunks
+# tiene que aplicarse en orden (la última define el ESTADO). En pagos solo
+# se inserta y el índice único resuelve los choques.
+ESCRITORES = {"docs": 1, "pagos": int(os.getenv("ESCRITORES_PAGOS", "2"))}
+
+# $merge por _hash (de la clave natural, scripts/hash_filas.py): en docs
+# se actualiza solo si cambió el ESTADO (igual que insertar_documentos);
+# en pagos lo existente se conserva.
+MERGE = {
+    "docs": {
+        "into": "docs",
+        "on": "_hash",
+        "whenMatched": [{"$replaceWith": {"$cond": [
+            {"$eq": ["$ESTADO", "$$new.ESTADO"]},
+            "$$ROOT",
+            {"$mergeObjects": ["$$ROOT", "$$new"]},
+        ]}}],
+        "whenNotMatched": "insert",
+    },
+    "pagos": {
+        "into": "pagos",
+        "on": "_hash",
+        "whenMatched": "keepExisting",
+        "whenNotMatched": "insert",
+    },
+}
+
+
+def hash_archivo(ruta, bloque=1024 * 1024):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for parte in iter(lambda: f.read(bloque), b""):
+            h.update(parte)
+    return h.hexdigest()
+
+
+def leer_checkpoint(db, tipo):
+    return db["metadata"].find_one({"tipo": f"checkpoint_{tipo}"})
+
+
+def guardar_checkpoint(db, tipo, **campos):
+    db["metadata"].update_one(
+        {"tipo": f"checkpoint_{tipo}"},
+        {"$set": {**campos, "actualizado": datetime.now()}},
+        upsert=True
+    )
+
+
+def cargas_pendientes(db):
+    """Checkpoints de cargas que quedaron a medias y cuyo archivo sigue en disco."""
+    return [
+        c for c in db["metadata"].find({"tipo": {"$regex": "^checkpoint_"}, "estado": "en_curso"})
+        if c.get("ruta") and os.path.exists(c["ruta"])
+    ]
+
+
+def _sumar(total, resumen):
+    for k in ("nuevos", "duplicados", "actualizados"):
+        total[k] = total.get(k, 0) + resumen.get(k, 0)
+    return total
+
+
+def cargar_con_checkpoint(db, tipo, ruta, nombre_archivo, df, escribir, preparar,
+                          staging=False, tamano_chunk=TAMANO_CHUNK, progreso=None):
+    """
+    Inserta `df` por chunks con checkpoint y devuelve el resumen
+    {nuevos, duplicados, actualizados} de la carga completa (incluidos los
+    chunks hechos antes de un reinicio).
+
+    - escribir(documentos) -> resumen: el escribir_lote del loader.
+    - preparar(fila, nombre_archivo, valor_hash) -> (doc, extras): el preparar_documento del loader.
+    - progreso(filas_hechas, total_filas): opcional.
+    """
+    from scripts.esquema import guardar_archivo
+    from scripts.hash_filas import hashes_dataframe
+    from scripts.pipeline_carga import ejecutar_pipeline
+
+    hash_actual = hash_archivo(ruta)
+    checkpoint = leer_checkpoint(db, tipo)
+
+    if (checkpoint and checkpoint.get("hash") == hash_actual and checkpoint.get("estado") == "en_curso"
+            and checkpoint.get("tamano_chunk") == tamano_chunk and checkpoint.get("staging", False) == staging):
+        chunks_hechos = checkpoint.get("chunks_hechos", 0)
+        resumen = checkpoint.get("resumen") or {}
+        print(f"↩ Reanudando carga de {tipo} ({nombre_archivo}) desde el chunk {chunks_hechos}")
+    else:
+        chunks_hechos, resumen = 0, {}
+
+    total_filas = len(df)
+    total_chunks = (total_filas + tamano_chunk - 1) // tamano_chunk
+    staging_nombre = f"{tipo}_staging_{hash_actual[:12]}"
+    destino = db[staging_nombre] if staging else db[tipo]
+    archivo = db[f"{tipo}_archivo"]
+
+    guardar_checkpoint(
+        db, tipo,
+        hash=hash_actual, archivo=nombre_archivo, ruta=ruta, estado="en_curso",
+        tamano_chunk=tamano_chunk, total_chunks=total_chunks, chunks_hechos=chunks_hechos,
+        staging=staging, resumen=resumen,
+    )
+
+    destino.create_index("_hash", unique=True)
+    if not staging:
+        destino.create_index("rut_num")
+
+    def preparar_chunk(i, chunk):
+        # Los _hash del chunk completo de una vez, por columnas
+        return [
+            preparar(fila, nombre_archivo, valor_hash)
+            for fila, valor_hash in zip(chunk.to_dict("records"), hashes_dataframe(chunk, tipo))
+        ]
+
+    def escribir_chunk(i, filas):
+        # Las columnas extra van directo al archivo: no las lee la API
+        guardar_archivo(archivo, filas)
+        documentos = [doc for doc, _ in filas]
+        if staging:
+            escribir_staging(destino, documentos)
+            return {}
+        return escribir(documentos)
+
+    def confirmar(i, resultado):
+        _sumar(resumen, resultado)
+        guardar_checkpoint(db, tipo, chunks_hechos=i + 1, resumen=resumen)
+        if progreso:
+            progreso(min((i + 1) * tamano_chunk, total_filas), total_filas)
+
+    ejecutar_pipeline(
+        ((i, df.iloc[i * tamano_chunk:(i + 1) * tamano_chunk]) for i in range(chunks_hechos, total_chunks)),
+        preparar_chunk, escribir_chunk,
+        desde=chunks_hechos, escritores=ESCRITORES.get(tipo, 1), capacidad=CAPACIDAD_COLA,
+        al_confirmar=confirmar,
+    )
+
+    if staging:
+        resumen = fusionar_staging(db, tipo, db[staging_nombre])
+
+    guardar_checkpoint(db, tipo, estado="listo", resumen=resumen)
+    return resumen
+
+
+def escribir_staging(staging, documentos):
+    from pymongo.errors import BulkWriteError
+
+    if not documentos:
+        return
+    try:
+        staging.insert_many(documentos, ordered=False)
+    except BulkWriteError as e:
+        # Filas repetidas dentro del archivo, o el chunk ya estaba escrito.
+        # Cualquier otro error (validación, write concern) corta la carga
+        # antes de que avance el checkpoint.
+        detalles = e.details or {}
+        errores = detalles.get("writeErrors", [])
+        if detalles.get("writeConcernErrors") or any(err.get("code") != CODIGO_DUPLICADO for err in errores):
+            raise
+
+
+def fusionar_staging(db, tipo, staging):
+    """
+    Pasa la colección de staging a la real con $merge y la borra. Se
+    informan nuevos/duplicados por diferencia de conteo; las
+    actualizaciones de ESTADO en docs quedan contadas como duplicados.
+    """
+    destino = db[MERGE[tipo]["into"]]
+    destino.create_index("_hash", unique=True)
+
+    antes = destino.count_documents({})
+    staged = staging.count_documents({})
+    staging.aggregate([
+        {"$project": {"_id": 0}},
+        {"$merge": MERGE[tipo]},
+    ], allowDiskUse=True)
+    nuevos = destino.count_documents({}) - antes
+    staging.drop()
+
+    print(f"✅ Staging {staging.name} fusionado: {nuevos} nuevos de {staged}")
+    return {"nuevos": nuevos, "duplicados": staged - nuevos, "actualizados": 0}
@@ -0,0 +1,77 @@
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+import os
+
+from scripts.esquema import CAMPOS, CAMPOS_INTERNOS, guardar_archivo, separar
+
+TAMANO_LOTE = 1000
+
+
+def compactar_coleccion(db, nombre, progreso=None):
+    """
+    Lleva los documentos existentes de `nombre` al esquema compacto: las
+    columnas fuera del esquema pasan a '<nombre>_archivo' y se sacan con
+    $unset; los campos del esquema se reescriben con su tipo. Es
+    idempotente (un documento ya compacto queda igual) y se puede cortar
+    y volver a correr.
+    """
+    coleccion = db[nombre]
+    archivo = db[f"{nombre}_archivo"]
+    compactados = 0
+    operaciones, para_archivo = [], []
+
+    def escribir():
+        nonlocal compactados
+        guardar_archivo(archivo, para_archivo)
+        if operaciones:
+            compactados += coleccion.bulk_write(operaciones, ordered=False).modified_count
+        operaciones.clear()
+        para_archivo.clear()
+        if progreso:
+            progreso(nombre, compactados)
+
+    for doc in coleccion.find({}, batch_size=TAMANO_LOTE):
+        compacto, extras = separar(nombre, doc)
+        # Columnas fuera del esquema y nulos. Sin _hash no hay dónde archivar
+        # las columnas extra, así que en ese caso solo se sacan los nulos.
+        sobrantes = [c for c in doc if c not in compacto and (doc.get("_hash") or c not in extras)]
+        cambios = {
+            c: v for c, v in compacto.items()
+            if c not in CAMPOS_INTERNOS and (doc[c] != v or type(doc[c]) is not type(v))
+        }
+        if not sobrantes and not cambios:
+            continue
+
+        actualizacion = {}
+        if cambios:
+            actualizacion["$set"] = cambios
+        if sobrantes:
+            actualizacion["$unset"] = {c: "" for c in sobrantes}
+        operaciones.append(UpdateOne({"_id": doc["_id"]}, actualizacion))
+        para_archivo.append((doc, extras))
+
+        if len(operaciones) >= TAMANO_LOTE:
+            escribir()
+
+    escribir()
+    return compactados
+
+
+def compactar(db, progreso=None):
+    resumen = {nombre: compactar_coleccion(db, nombre, progreso) for nombre in CAMPOS}
+    db["metadata"].update_one(
+        {"tipo": "compactacion_esquema"},
+        {"$set": {"tipo": "compactacion_esquema", "estado": "listo", "resumen": resumen}},
+        upsert=True
+    )
+    return resumen
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    client = MongoClient(os.getenv("MONGO_URI"))
+    resumen = compactar(
+        client["mi_base_datos"],
+        progreso=lambda nombre, n: print(f"… {nombre}: {n} documentos compactados")
+    )
+    print(f"✅ Colecciones compactadas: {resumen}")
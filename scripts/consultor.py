@@ -1,9 +1,13 @@
-from pymongo import MongoClient
 from dotenv import load_dotenv
 from datetime import datetime
 import numpy as np
 import os
-import pandas as pd
+
+from scripts.esquema import FORMATOS_FECHA, proyeccion
+from scripts.estadisticas import TablaPagos
+from scripts.reglas import motor_reglas
+from scripts.migrar_rut_num import migracion_lista
+from scripts.rut import clave_rut, filtro_rut
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -13,27 +17,50 @@ PATH_SERVIU = os.path.join(BASE_DIR, "data", "listas_entidades", "serviu_minvu_r
 
 
 def cargar_ruts(path):
+    """Set de claves enteras (cuerpo del RUT) de una lista de entidades."""
     if not os.path.exists(path):
         print(f"⚠ Archivo no encontrado: {path}")
         return set()
     with open(path, "r", encoding="utf-8") as f:
-        return set(line.strip().upper() for line in f if line.strip())
-
-muni_ruts = cargar_ruts(PATH_MUNI)
-corp_ruts = cargar_ruts(PATH_CORP)
-serviu_ruts = cargar_ruts(PATH_SERVIU)
-
-print(f"📌 Cargados {len(muni_ruts)} RUTs de municipalidades")
-print(f"📌 Cargados {len(corp_ruts)} RUTs de corporaciones municipales")
-
-
-# Cargar configuración desde .env
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
-db = client["mi_base_datos"]
-docs = db["docs"]
-pagos = db["pagos"]
+        claves = (clave_rut(line) for line in f if line.strip())
+        return set(c for c in claves if c is not None)
+
+
+# Importar este módulo no lee archivos ni abre conexiones: las listas se
+# leen en el primer uso y el cliente de Mongo (solo para consultar_por_rut,
+# la API usa el suyo) se crea recién cuando se consulta.
+_listas = None
+_db = None
+_usar_rut_num = None
+
+
+def listas_entidades():
+    """(muni_ruts, corp_ruts, serviu_ruts), leídas una sola vez."""
+    global _listas
+    if _listas is None:
+        listas = (cargar_ruts(PATH_MUNI), cargar_ruts(PATH_CORP), cargar_ruts(PATH_SERVIU))
+        print(f"📌 Cargados {len(listas[0])} RUTs de municipalidades")
+        print(f"📌 Cargados {len(listas[1])} RUTs de corporaciones municipales")
+        _listas = listas
+    return _listas
+
+
+def base_datos():
+    global _db
+    if _db is None:
+        from pymongo import MongoClient
+        load_dotenv()
+        _db = MongoClient(os.getenv("MONGO_URI"))["mi_base_datos"]
+    return _db
+
+
+def usar_rut_num():
+    # Se consulta una sola vez y recién al primer uso, para que importar
+    # este módulo no haga I/O contra Mongo
+    global _usar_rut_num
+    if _usar_rut_num is None:
+        _usar_rut_num = migracion_lista(base_datos())
+    return _usar_rut_num
 
 # -----------------------------
 # Utilidades
@@ -41,7 +68,7 @@ pagos = db["pagos"]
 
 def parse_fecha(fecha):
     if isinstance(fecha, str):
-        for fmt in ("%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y"):
+        for fmt in FORMATOS_FECHA:
             try:
                 return datetime.strptime(fecha.strip(), fmt)
             except:
@@ -50,12 +77,6 @@ def parse_fecha(fecha):
         return fecha
     return None
 
-def es_outlier(valor, promedio, desviacion):
-    if desviacion == 0:
-        return False
-    z = (valor - promedio) / desviacion
-    return abs(z) > 2.0
-
 
 def normalizar_clave(n_doc, n_ope):
     """
@@ -95,13 +116,20 @@ def normalizar_clave(n_doc, n_ope):
 # Clasificación desde Excel
 # -----------------------------
 
+RUT_MOP = 61202000
+
+
 def obtener_tipo_entidad(rut):
-    rut = str(rut).replace(".", "").replace(" ", "").upper().strip()
+    rut = clave_rut(rut)
+    if rut is None:
+        return None
 
     # 1. MOP directo
-    if rut in ["61202000-0", "612020000"]:
+    if rut == RUT_MOP:
         return "MOP"
 
+    muni_ruts, corp_ruts, serviu_ruts = listas_entidades()
+
     # 2. Municipalidad por lista oficial
     if rut in muni_ruts:
         return "MUNICIPALIDAD"
@@ -122,56 +150,23 @@ def obtener_tipo_entidad(rut):
 # -----------------------------
 
 def aplicar_reglas_verano(rut, promedio_verano, promedio_anual, desv_verano, desv_anual):
-    mes = datetime.now().month
-    tipo = obtener_tipo_entidad(rut)
-
-    # Regla general (no es verano)
-    if mes not in [11, 12, 1, 2]:
-        return {
-            "plazo_recomendado": None,
-            "factor_dias": 15,  # 15 días por punto de anticipo = 2% mora
-            "tipo": tipo
-        }
-
-    # Si no es muni / corp / MOP → reglas normales
-    if tipo not in ["MUNICIPALIDAD", "CORP MUNICIPAL", "MOP"]:
-        return {
-            "plazo_recomendado": None,
-            "factor_dias": 15,
-            "tipo": tipo
-        }
-
-    # MOP
-    if tipo == "MOP":
-        return {
-            "plazo_recomendado": 60,
-            "factor_dias": 7.5,  # mora 4%
-            "tipo": tipo
-        }
+    """
+    Plazo y factor de días según la tabla de reglas (scripts/reglas.py).
 
-    if tipo == "SERVIU / MINVU":
-        return {
-            "plazo_recomendado": 180,
-            "factor_dias": 7.5,
-            "tipo": tipo
-        }
+    La base es promedio + 0.5 desviación del verano si hay pagos de verano,
+    y si no, la anual. Para tipos/temporadas sin regla el plazo queda en
+    None y se usa el factor por defecto (15 días por punto = 2% mora).
+    """
+    tipo = obtener_tipo_entidad(rut)
 
-    # Calcular promedio + desviación
     if not np.isnan(promedio_verano):
         base = promedio_verano + 0.5 * desv_verano
     else:
         base = promedio_anual + 0.5 * desv_anual
 
-    # Reglas municipalidades / corporaciones
-    if base <= 45:
-        return {"plazo_recomendado": 45, "factor_dias": 7.5, "tipo": tipo}
-    elif 46 <= base <= 70:
-        return {"plazo_recomendado": 90, "factor_dias": 7.5, "tipo": tipo}
-    elif 71 <= base <= 90:
-        return {"plazo_recomendado": 105, "factor_dias": 7.5, "tipo": tipo}
-    else:
-        # >90 se evalúan puntualmente
-        return {"plazo_recomendado": None, "factor_dias": 7.5, "tipo": tipo}
+    plazo, factor = motor_reglas().evaluar(tipo, base)
+    return {"plazo_recomendado": plazo, "factor_dias": factor, "tipo": tipo}
+
 
 # -----------------------------
 # Función principal
@@ -179,8 +174,10 @@ def aplicar_reglas_verano(rut, promedio_verano, promedio_anual, desv_verano, des
 
 def consultar_por_rut(rut_deudor):
     print(f"\n📋 Consultando información para RUT DEUDOR: {rut_deudor}")
+    db = base_datos()
+    docs, pagos = db["docs"], db["pagos"]
 
-    facturas = list(docs.find({"RUT DEUDOR": rut_deudor}))
+    facturas = list(docs.find(filtro_rut(rut_deudor, "RUT DEUDOR", usar_rut_num())))
 
     if not facturas:
         print("❌ No se encontraron documentos para este RUT.")
@@ -188,7 +185,7 @@ def consultar_por_rut(rut_deudor):
             "error": "No se encontraron documentos para este deudor."
         }
 
-    pagos_deudor = list(pagos.find({"Rut Deudor": rut_deudor}))
+    pagos_deudor = list(pagos.find(filtro_rut(rut_deudor, "Rut Deudor", usar_rut_num())))
 
     pagos_dict = {}
     for p in pagos_deudor:
@@ -232,36 +229,31 @@ def consultar_por_rut(rut_deudor):
             "error": "No se encontraron coincidencias entre documentos y pagos."
         }
 
+    registros_validos = TablaPagos.desde_registros(registros_validos)
+
     # --- Filtrar outliers ---
-    plazos = [r["plazo"] for r in registros_validos]
-    promedio_total = np.mean(plazos)
-    desviacion_total = np.std(plazos)
+    promedio_total = registros_validos.promedio()
+    desviacion_total = registros_validos.desviacion()
 
-    registros_limpios = [
-        r for r in registros_validos
-        if not es_outlier(r["plazo"], promedio_total, desviacion_total)
-    ]
+    registros_limpios = registros_validos.seleccionar(
+        ~registros_validos.mascara_outliers(promedio_total, desviacion_total)
+    )
 
     if not registros_limpios:
         return {"error": "Todos los registros fueron considerados outliers."}
 
-    # Ordenar del pago más nuevo al más antiguo
-    registros_limpios.sort(key=lambda x: x["fecha_pago"], reverse=True)
-
-    # Últimos 5 pagos
-    ultimos_5 = registros_limpios[:5]
-    promedio_ultimos = np.mean([r["plazo"] for r in ultimos_5])
+    # Últimos 5 pagos (del más nuevo al más antiguo)
+    idx_ultimos = registros_limpios.ultimos(5)
+    ultimos_5 = registros_limpios.a_registros(idx_ultimos)
+    promedio_ultimos = registros_limpios.promedio(idx_ultimos)
 
     # Factura más lenta
-    factura_lenta = max(registros_limpios, key=lambda x: x["plazo"])
+    factura_lenta = registros_limpios.registro(registros_limpios.mas_lentas(1)[0])
 
     # Registros de verano
-    registros_verano = [
-        r for r in registros_limpios
-        if r["fecha_pago"].month in [11, 12, 1, 2]
-    ]
-    promedio_verano = np.mean([r["plazo"] for r in registros_verano]) if registros_verano else np.nan
-    desviacion_verano = np.std([r["plazo"] for r in registros_verano]) if registros_verano else np.nan
+    mascara_verano = registros_limpios.mascara_verano()
+    promedio_verano = registros_limpios.promedio(mascara_verano)
+    desviacion_verano = registros_limpios.desviacion(mascara_verano)
 
     # Clasificar tipo de entidad
     reglas = aplicar_reglas_verano(
@@ -277,7 +269,7 @@ def consultar_por_rut(rut_deudor):
     tipo = reglas["tipo"]
 
     # Morosos
-    morosos = list(docs.find({"RUT DEUDOR": rut_deudor, "ESTADO": "MOROSO"}))
+    morosos = list(docs.find({**filtro_rut(rut_deudor, "RUT DEUDOR", usar_rut_num()), "ESTADO": "MOROSO"}, proyeccion("docs")))
 
     # RESULTADO COMPATIBLE CON FRONTEND
     return {
@@ -1,14 +1,36 @@
-from fastapi import FastAPI, Query, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, Query, UploadFile, File, BackgroundTasks, Body, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pymongo import MongoClient
 from dotenv import load_dotenv
-from datetime import datetime
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 import numpy as np
 import os
 import shutil
-
-from scripts.consultor import aplicar_reglas_verano, obtener_tipo_entidad, normalizar_clave
+import threading
+import time
+
+from scripts.analitica_consultas import RegistroConsultas, marcar_cache, resumen_por_rut, sumar_documentos
+from scripts.cache_consultas import CacheConsultas
+from scripts.empresas_columnar import AlmacenEmpresas
+from scripts.consultor import aplicar_reglas_verano, obtener_tipo_entidad, normalizar_clave, listas_entidades
+from scripts.esquema import proyeccion
+from scripts.lecturas import Lecturas
+from scripts.estadisticas import TablaPagos
+from scripts.migrar_rut_num import migracion_lista
+from scripts.reglas import instalar_reglas, motor_reglas
+from scripts.rut import rut_valido
+from scripts import rut as rut_utils
+from scripts import estadisticas_mensuales
+from scripts import indice_pares
+from scripts import pronostico_verano
+from scripts import exposicion
+from scripts.respuestas import RespuestaRapida
+from scripts.snapshot_local import FuenteSnapshot, generar_snapshot
+from scripts.validacion_archivos import ArchivoInvalido, validar_archivo
+from scripts.vigilante_cambios import VigilanteCambios
 
 
 # ============================================================
@@ -18,28 +40,218 @@ from scripts.consultor import aplicar_reglas_verano, obtener_tipo_entidad, norma
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 
-try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    client.server_info()
-    print("✅ Conexión con MongoDB Atlas OK")
-except Exception as e:
-    print("❌ Error al conectar con MongoDB:", e)
-    raise e
-
+# connect=False: crear el cliente no resuelve el SRV de Atlas ni lanza
+# los hilos de monitoreo; eso pasa en la primera operación. La conexión
+# (con reintentos) y las lecturas de configuración se hacen en el
+# arranque, fuera del import.
+client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, connect=False)
 db = client["mi_base_datos"]
 docs = db["docs"]
 pagos = db["pagos"]
 empresas_chile = db["empresas"]
 
+# Con LECTURAS_SECUNDARIAS=1 las lecturas analíticas y de lote van a
+# secundarias (scripts/lecturas.py tiene la tabla por ruta).
+lecturas = Lecturas(
+    db,
+    secundarias=os.getenv("LECTURAS_SECUNDARIAS", "0") == "1",
+    max_staleness=os.getenv("MAX_STALENESS_SEGUNDOS", "120"),
+)
+
+# Con EMPRESAS_COLUMNAR=<directorio> las empresas se leen del almacén
+# columnar mapeado en memoria (lo escribe scripts/cargar_empresas.py).
+almacen_empresas = AlmacenEmpresas(os.getenv("EMPRESAS_COLUMNAR")) if os.getenv("EMPRESAS_COLUMNAR") else None
+
+# Consultar por rut_num solo cuando todas las colecciones ya lo tienen
+# (scripts/migrar_rut_num.py o POST /admin/migrar-rut-num). Se lee al arrancar.
+USAR_RUT_NUM = False
+
 UPLOAD_FOLDER = "data"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 
+# ============================================================
+# 🚀 Arranque y precalentamiento
+# ============================================================
+
+# Render (plan free) duerme el servicio; la primera consulta después de
+# un deploy o de despertar pagaba la conexión a Atlas, la carga de las
+# listas y un cache vacío. El lifespan no bloquea: en un hilo aparte se
+# conecta (reintentando si Atlas no responde), se leen reglas y estado
+# de migración y se precalculan los RUTs más consultados. "/" responde
+# 503 hasta que termina (o se agota el presupuesto de tiempo), así el
+# health check no enruta tráfico antes.
+#
+# Importar este módulo no debe traer pandas ni hacer I/O: los módulos
+# pesados se importan dentro de las funciones que los usan. Se mide con
+# python -m scripts.benchmark_arranque.
+
+TOP_RUTS_PRECALENTAR = int(os.getenv("TOP_RUTS_PRECALENTAR", "50"))
+SEGUNDOS_MAX_PRECALENTAR = float(os.getenv("SEGUNDOS_MAX_PRECALENTAR", "60"))
+SEGUNDOS_MAX_REINTENTO_MONGO = float(os.getenv("SEGUNDOS_MAX_REINTENTO_MONGO", "30"))
+
+cache_consultas = CacheConsultas()
+registro_consultas = RegistroConsultas(db)
+
+estado_arranque = {"listo": False, "mongo": False, "intentos_mongo": 0, "precalentados": 0, "inicio": None, "fin": None}
+
+# PERFILADO=1 habilita el perfilado a pedido (scripts/perfilado.py);
+# sin la variable no se crea nada y las rutas no cambian.
+perfilador = None
+if os.getenv("PERFILADO", "0") == "1":
+    from scripts.perfilado import Perfilador
+    perfilador = Perfilador(db, muestreo=float(os.getenv("PERFILADO_MUESTREO", "0")))
+
+
+def cargar_configuracion():
+    global USAR_RUT_NUM
+
+    # Si se editó la tabla de reglas desde /admin/reglas, esa versión
+    # (guardada en metadata) manda por sobre la del repo.
+    registro_reglas = db["metadata"].find_one({"tipo": "reglas_plazos"})
+    if registro_reglas and registro_reglas.get("tabla"):
+        try:
+            instalar_reglas(registro_reglas["tabla"])
+        except Exception as e:
+            print("⚠ Tabla de reglas en metadata no válida, se usa la del repo:", e)
+
+    USAR_RUT_NUM = migracion_lista(db)
+    estado_indice_pares["listo"] = indice_pares.indice_disponible(db)
+    estado_pronosticos["listo"] = pronostico_verano.COLECCION in db.list_collection_names()
+    if estado_pronosticos["listo"]:
+        tipos_entidades()
+    estado_exposicion["listo"] = db["metadata"].find_one({"tipo": "exposicion"}, {"_id": 1}) is not None
+
+
+def ruts_mas_consultados(limite):
+    return [
+        r["rut"] for r in
+        db["frecuencia_consultas"].find({}, {"rut": 1}).sort("consultas", -1).limit(limite)
+    ]
+
+
+def precalentar():
+    estado_arranque["inicio"] = datetime.now()
+    limite = time.monotonic() + SEGUNDOS_MAX_PRECALENTAR
+    try:
+        # Sin snapshot las consultas van a Mongo mientras se exporta aparte:
+        # el export completo no cuenta para el límite de tiempo
+        if fuente_snapshot and not fuente_snapshot.disponible():
+            actualizar_estado_carga("snapshot", "procesando", inicio=datetime.now())
+            threading.Thread(target=snapshot_background, kwargs={"limpiar_cache": False}, daemon=True).start()
+        for rut in ruts_mas_consultados(TOP_RUTS_PRECALENTAR):
+            if time.monotonic() > limite:
+                print("⚠ Precalentamiento cortado por tiempo")
+                break
+            consulta_rut_cacheada(rut)
+            estado_arranque["precalentados"] += 1
+    except Exception as e:
+        print("⚠ Error precalentando consultas:", e)
+    finally:
+        estado_arranque["listo"] = True
+        estado_arranque["fin"] = datetime.now()
+        print(f"✅ Precalentamiento listo ({estado_arranque['precalentados']} RUTs)")
+
+
+def reanudar_cargas():
+    """Retoma las cargas de docs/pagos que quedaron a medias (archivo aún en data/)."""
+    from scripts.cargas_reanudables import cargas_pendientes
+    try:
+        pendientes = cargas_pendientes(db)
+    except Exception as e:
+        print("⚠ No se pudieron leer los checkpoints de carga:", e)
+        return
+    for checkpoint in pendientes:
+        tipo = checkpoint["tipo"].removeprefix("checkpoint_")
+        funcion = {"docs": procesar_docs_background, "pagos": procesar_pagos_background}.get(tipo)
+        if funcion:
+            print(f"↩ Carga de {tipo} pendiente: {checkpoint['archivo']}")
+            actualizar_estado_carga(tipo, "procesando", archivo=checkpoint["archivo"], inicio=datetime.now())
+            funcion(checkpoint["ruta"], checkpoint["archivo"])
+
+
+def recalcular_ruts_cambiados(ruts, todo):
+    """
+    Lo llama el vigilante de cambios con los RUTs tocados en docs/pagos
+    (por la API o por fuera). Se rehacen sus buckets mensuales y sus
+    resultados en cache; los resultados por empresas similares dependen
+    de otros RUTs, así que esos se descartan.
+    """
+    if todo:
+        cache_consultas.limpiar()
+        print("🔄 Cambios sin RUT identificable: cache vaciado")
+        return
+
+    recalcular_estadisticas_mensuales(ruts)
+    claves = {clave_cache(r): r for r in ruts}
+    en_cache = cache_consultas.invalidar(list(claves))
+    cache_consultas.descartar_si(lambda resultado: resultado.get("empresas_similares"))
+    for clave in en_cache:
+        # Directo a Mongo: el snapshot local recién se regenera tras una carga
+        cache_consultas.guardar(clave, calcular_consulta_rut(claves[clave], fuente_mongo))
+    print(f"🔄 Recalculados {len(ruts)} RUTs modificados ({len(en_cache)} estaban en cache)")
+
+
+# Con VIGILAR_CAMBIOS=1 se escuchan los cambios de docs/pagos
+# (scripts/vigilante_cambios.py) y se recalcula solo lo afectado.
+vigilante = None
+if os.getenv("VIGILAR_CAMBIOS", "0") == "1":
+    vigilante = VigilanteCambios(
+        db, recalcular_ruts_cambiados,
+        ventana_segundos=float(os.getenv("VENTANA_CAMBIOS_SEGUNDOS", "5"))
+    )
+
+
+def conectar_mongo():
+    """Ping a Mongo hasta que responda, con espera creciente entre intentos."""
+    espera = 1.0
+    while True:
+        estado_arranque["intentos_mongo"] += 1
+        try:
+            client.admin.command("ping")
+            estado_arranque["mongo"] = True
+            print("✅ Conexión con MongoDB Atlas OK")
+            return
+        except Exception as e:
+            print(f"❌ Error al conectar con MongoDB (reintento en {espera:.0f} s):", e)
+            time.sleep(espera)
+            espera = min(espera * 2, SEGUNDOS_MAX_REINTENTO_MONGO)
+
+
+def arrancar():
+    conectar_mongo()
+    try:
+        cargar_configuracion()
+    except Exception as e:
+        print("⚠ Error leyendo la configuración guardada, se usan los valores por defecto:", e)
+    # Las listas de municipalidades/corporaciones se leen al primer uso;
+    # se leen acá para que no las pague la primera consulta
+    try:
+        listas_entidades()
+    except Exception as e:
+        print("⚠ Error leyendo las listas de entidades:", e)
+    threading.Thread(target=reanudar_cargas, daemon=True).start()
+    if HORA_PRONOSTICOS is not None:
+        threading.Thread(target=pronosticos_diarios, daemon=True).start()
+    if vigilante:
+        vigilante.iniciar()
+    precalentar()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    threading.Thread(target=arrancar, daemon=True).start()
+    yield
+    if vigilante:
+        vigilante.detener()
+    registro_consultas.vaciar()
+
+
 # ============================================================
 # ⚙️ Configuración FastAPI
 # ============================================================
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -54,10 +266,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# El histórico completo de un deudor grande pesa varios MB en JSON;
+# comprimido baja a una fracción. Respuestas chicas no se comprimen.
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 
 @app.get("/")
 def read_root():
-    return {"status": "ok"}
+    if not estado_arranque["mongo"]:
+        return JSONResponse(status_code=503, content={"status": "conectando", "intentos": estado_arranque["intentos_mongo"]})
+    if not estado_arranque["listo"]:
+        return JSONResponse(status_code=503, content={"status": "calentando"})
+    return {
+        "status": "ok",
+        "precalentados": estado_arranque["precalentados"],
+        "fuente": "snapshot" if fuente_activa() is fuente_snapshot else "mongo",
+    }
 
 
 # ============================================================
@@ -76,22 +300,38 @@ def parse_fecha(fecha):
     return None
 
 
-def es_outlier(valor, promedio, desviacion):
-    if desviacion == 0:
-        return False
-    z = (valor - promedio) / desviacion
-    return abs(z) > 2.0
+def filtro_rut(rut, campo):
+    return rut_utils.filtro_rut(rut, campo, usar_clave=USAR_RUT_NUM)
+
+
+def filtro_ruts(ruts, campo):
+    return rut_utils.filtro_ruts(ruts, campo, usar_clave=USAR_RUT_NUM)
+
+
+# Solo los campos de docs que usa el cruce; el resto de las columnas del
+# Excel original no se trae desde Mongo. En pagos no se proyecta porque
+# "Nª Doc." y "Nº Ope." llevan punto y Mongo los interpreta como rutas.
+PROYECCION_DOCS_CRUCE = proyeccion("docs", "DEUDOR", "Nº DCTO", "Nº OPE", "FEC EMISION DIG", "FECHA CES", "MONTO DOC")
+PROYECCION_DOCS_MOROSOS = proyeccion(
+    "docs", "Nº DCTO", "Nº OPE", "MONTO DOC", "SALDO", "FECHA CES", "FEC EMISION DIG", "VCTO NOM"
+)
+PROYECCION_DOCS_SIMILARES = proyeccion("docs", "Nº DCTO", "Nº OPE", "FEC EMISION DIG")
 
 
-def cruzar_facturas_pagos(rut):
+def cruzar_facturas_pagos(rut, base=None):
     """
     Cruza facturas y pagos de un RUT deudor.
     Devuelve (facturas, pagos_dict, registros_validos, registros_limpios, promedio, desviacion),
     donde registros_validos excluye plazos anómalos (<0 o >300 días) y
     registros_limpios además excluye outliers (z-score > 2 sobre registros_validos).
+    Ambos registros se devuelven como TablaPagos (columnas NumPy); se pasan
+    a dicts recién al armar la respuesta. `base` es la Database de la que
+    se lee (por defecto la primaria, ver scripts/lecturas.py).
     """
-    facturas = list(docs.find({"RUT DEUDOR": rut}))
-    pagos_deudor = list(pagos.find({"Rut Deudor": rut}))
+    base = db if base is None else base
+    facturas = list(base["docs"].find(filtro_rut(rut, "RUT DEUDOR"), PROYECCION_DOCS_CRUCE))
+    pagos_deudor = list(base["pagos"].find(filtro_rut(rut, "Rut Deudor")))
+    sumar_documentos(len(facturas) + len(pagos_deudor))
 
     pagos_dict = {}
     for p in pagos_deudor:
@@ -142,17 +382,12 @@ def cruzar_facturas_pagos(rut):
                     }
                 })
 
-    if not registros_validos:
-        return facturas, pagos_dict, [], [], None, None
+    registros_validos = TablaPagos.desde_registros(registros_validos)
 
-    plazos = [r["plazo"] for r in registros_validos]
-    promedio = np.mean(plazos)
-    desviacion = np.std(plazos)
+    if not registros_validos:
+        return facturas, pagos_dict, registros_validos, registros_validos, None, None
 
-    registros_limpios = [
-        r for r in registros_validos
-        if not es_outlier(r["plazo"], promedio, desviacion)
-    ]
+    registros_limpios, promedio, desviacion = registros_validos.sin_outliers()
 
     return facturas, pagos_dict, registros_validos, registros_limpios, promedio, desviacion
 
@@ -164,8 +399,8 @@ def cruzar_facturas_pagos(rut):
 @app.get("/debug-format")
 def debug_format(rut: str):
 
-    facturas = list(docs.find({"RUT DEUDOR": rut}))
-    pagos_deudor = list(pagos.find({"Rut Deudor": rut}))
+    facturas = list(docs.find(filtro_rut(rut, "RUT DEUDOR")))
+    pagos_deudor = list(pagos.find(filtro_rut(rut, "Rut Deudor")))
 
     def limpiar_factura(f):
         return {
@@ -189,32 +424,302 @@ def debug_format(rut: str):
 # 🔍 CONSULTAR RUT
 # ============================================================
 
-@app.get("/consultar-rut")
-def consultar_por_rut(rut: str = Query(..., alias="rut")):
+@app.get("/consultar-rut", response_class=RespuestaRapida)
+def consultar_por_rut(rut: str = Query(..., alias="rut"), x_perfilar: str = Header(None)):
+    if not rut_valido(rut):
+        return RespuestaRapida({"error": "RUT no válido (revisar dígito verificador)."}, status_code=400)
+    with registro_consultas.medir("consultar-rut", rut_utils.formatear_rut(rut)):
+        if perfilador and perfilador.toca_consulta(forzar=x_perfilar == "1"):
+            # Con el header se mide el cálculo completo, no un hit de cache
+            with perfilador.perfilar("consultar-rut", rut_utils.formatear_rut(rut)):
+                return RespuestaRapida(consulta_rut_cacheada(rut, refrescar=x_perfilar == "1"))
+        return RespuestaRapida(consulta_rut_cacheada(rut))
 
-    facturas, pagos_dict, registros_validos, registros_limpios, promedio, desviacion = cruzar_facturas_pagos(rut)
 
-    if registros_validos:
+def clave_cache(rut):
+    """
+    Clave del cache para un RUT. Con rut_num, todas las escrituras del RUT
+    dan el mismo resultado y comparten entrada; antes de la migración el
+    filtro compara el texto exacto, así que cada escritura va por separado.
+    """
+    clave = rut_utils.clave_rut(rut) if USAR_RUT_NUM else None
+    return rut if clave is None else clave
 
-        if not registros_limpios:
-            return {"error": "Todos los registros fueron considerados outliers."}
 
-        registros_limpios.sort(key=lambda x: x["fecha_pago"], reverse=True)
-        ultimos_5 = registros_limpios[:5]
+def consulta_rut_cacheada(rut, refrescar=False):
+    clave = clave_cache(rut)
+    resultado = None if refrescar else cache_consultas.obtener(clave)
+    marcar_cache(resultado is not None)
+    if resultado is None:
+        resultado = calcular_consulta_rut(rut)
+        cache_consultas.guardar(clave, resultado)
+    return resultado
 
-        promedio_ultimos = np.mean([r["plazo"] for r in ultimos_5])
-        plazo_recomendado = max(30, round(promedio_ultimos + 0.5 * desviacion))
 
-        registros_verano = [
-            r for r in registros_limpios if r["fecha_pago"].month in [11, 12, 1, 2]
-        ]
+class FuenteMongo:
+    """
+    Lecturas que necesita /consultar-rut, directo contra Mongo. La versión
+    local (scripts/snapshot_local.FuenteSnapshot) tiene la misma interfaz.
+    `base` es la Database con la preferencia de lectura de quien la usa.
+    """
+
+    def __init__(self, base):
+        self.base = base
+
+    def cruce(self, rut):
+        """Cruce del deudor, o None si no tiene pagos cruzados válidos."""
+        facturas, pagos_dict, registros_validos, registros_limpios, promedio, desviacion = cruzar_facturas_pagos(rut, self.base)
+        if not registros_validos:
+            return None
+        return {
+            "nombre": facturas[0].get("DEUDOR", "Desconocido"),
+            "registros_validos": registros_validos,
+            "registros_limpios": registros_limpios,
+            "promedio": promedio,
+            "desviacion": desviacion,
+            "facturas": facturas,
+            "pagos_dict": pagos_dict,
+        }
+
+    def morosos(self, rut, cruce):
+        """Documentos MOROSO del deudor que no tienen pago cruzado."""
+        morosos = list(self.base["docs"].find({**filtro_rut(rut, "RUT DEUDOR"), "ESTADO": "MOROSO"}, PROYECCION_DOCS_MOROSOS))
+        sumar_documentos(len(morosos))
 
-        promedio_verano = (
-            np.mean([r["plazo"] for r in registros_verano]) if registros_verano else np.nan
+        pagos_dict = cruce["pagos_dict"]
+        claves_pagadas = set(
+            normalizar_clave(f.get("Nº DCTO"), f.get("Nº OPE"))
+            for f in cruce["facturas"]
+            if normalizar_clave(f.get("Nº DCTO"), f.get("Nº OPE")) in pagos_dict
         )
-        desviacion_verano = (
-            np.std([r["plazo"] for r in registros_verano]) if registros_verano else np.nan
+
+        return [
+            {
+                "monto": m.get("MONTO DOC"),
+                "saldo": m.get("SALDO"),
+                "fecha_ces": parse_fecha(m.get("FECHA CES")),
+                "fecha_emision": parse_fecha(m.get("FEC EMISION DIG")),
+                "vcto": parse_fecha(m.get("VCTO NOM")),
+            }
+            for m in morosos
+            if normalizar_clave(m.get("Nº DCTO"), m.get("Nº OPE")) not in claves_pagadas
+        ]
+
+    def empresa(self, rut):
+        if almacen_empresas and almacen_empresas.disponible():
+            return almacen_empresas.buscar(rut)
+        return self.base["empresas"].find_one(filtro_rut(rut, "rut"))
+
+    def empresas(self, ruts):
+        """Empresas de una lista de RUTs (los que no están se omiten)."""
+        if almacen_empresas and almacen_empresas.disponible():
+            return almacen_empresas.buscar_varias(ruts)
+        return list(self.base["empresas"].find(
+            filtro_ruts(ruts, "rut"), {"rut": 1, "nombre": 1, "rubro": 1, "tramo_ventas": 1}
+        ))
+
+    def pronostico(self, rut):
+        """Pronóstico mensual precalculado (solo entidades públicas), o None."""
+        clave = rut_utils.clave_rut(rut)
+        if not estado_pronosticos["listo"] or clave not in tipos_entidades():
+            return None
+        sumar_documentos(1)
+        return self.base[pronostico_verano.COLECCION].find_one({"rut_num": clave}, {"_id": 0})
+
+    def grupos_empresas(self):
+        """Todos los (rubro, tramo) del registro de empresas."""
+        if almacen_empresas and almacen_empresas.disponible():
+            return almacen_empresas.grupos()
+        return [
+            (g["_id"].get("rubro"), g["_id"].get("tramo"))
+            for g in self.base["empresas"].aggregate([
+                {"$group": {"_id": {"rubro": "$rubro", "tramo": "$tramo_ventas"}}},
+            ], allowDiskUse=True)
+        ]
+
+    def pares_indexados(self):
+        if not estado_indice_pares["listo"]:
+            return None
+        return list(self.base[indice_pares.COLECCION].find({}, {"_id": 0, "vecinos": 0}))
+
+    def similares(self, rubro, tramo):
+        """(cantidad, promedio, desviación) de plazos de empresas similares, o None."""
+        if estado_indice_pares["listo"]:
+            pares = self.base[indice_pares.COLECCION].find_one({"rubro": rubro, "tramo": tramo})
+            sumar_documentos(1)
+            if pares:
+                return pares["cantidad"], pares["promedio"], pares["desviacion"]
+
+        # Sin índice se recorre el grupo completo: lectura analítica
+        base = lecturas.base("empresas-similares")
+        if almacen_empresas and almacen_empresas.disponible():
+            ruts_similares = almacen_empresas.ruts_grupo(rubro, tramo)
+        else:
+            similares = base["empresas"].find({"rubro": rubro, "tramo_ventas": tramo}, {"rut": 1})
+            ruts_similares = [e["rut"] for e in similares]
+
+        facturas_sim = list(base["docs"].find(filtro_ruts(ruts_similares, "RUT DEUDOR"), PROYECCION_DOCS_SIMILARES))
+        pagos_sim = list(base["pagos"].find(filtro_ruts(ruts_similares, "Rut Deudor")))
+        sumar_documentos(len(ruts_similares) + len(facturas_sim) + len(pagos_sim))
+
+        pagos_sim_dict = {
+            normalizar_clave(p.get("Nª Doc."), p.get("Nº Ope.")): p
+            for p in pagos_sim
+        }
+
+        plazos_sim = []
+        for f in facturas_sim:
+            clave = normalizar_clave(f.get("Nº DCTO"), f.get("Nº OPE"))
+            pago = pagos_sim_dict.get(clave)
+            if pago:
+                fe = parse_fecha(f.get("FEC EMISION DIG"))
+                fp = parse_fecha(pago.get("Fecha Pago"))
+                if fe and fp:
+                    plazo = (fp - fe).days
+
+                    # filtro anti-basura
+                    if plazo < 0 or plazo > 365:
+                        continue
+
+                    plazos_sim.append(plazo)
+
+        if not plazos_sim:
+            return None
+        return len(plazos_sim), float(np.mean(plazos_sim)), float(np.std(plazos_sim))
+
+
+fuente_mongo = FuenteMongo(lecturas.base("consultar-rut"))
+
+# Índice de pares precalculado (scripts/indice_pares.py). Se activa al
+# construirlo por primera vez (POST /admin/indice-pares) y desde ahí se
+# reconstruye al final de cada carga.
+estado_indice_pares = {"listo": False}
+
+
+def actualizar_indice_pares(incluir_faltantes=False, ruta="indice-pares"):
+    """
+    Reconstruye el índice desde los buckets mensuales. Con
+    incluir_faltantes se calculan antes los buckets de deudores que
+    todavía no tienen (la primera vez); después de una carga no hace
+    falta porque la carga ya recalculó los RUTs que tocó. `ruta` es la
+    de scripts/lecturas.py ("post-carga" si hay que ver lo recién escrito).
+    """
+    base = lecturas.base(ruta)
+    if incluir_faltantes:
+        con_buckets = set(base[estadisticas_mensuales.COLECCION].distinct("rut_num"))
+        faltantes = [
+            r for r in base["docs"].distinct("RUT DEUDOR")
+            if r and rut_utils.clave_rut(r) not in con_buckets
+        ]
+        recalcular_estadisticas_mensuales(faltantes)
+        if faltantes:
+            base = lecturas.base("post-carga")
+
+    fuente = FuenteMongo(base)
+    estadisticas = indice_pares.estadisticas_por_deudor(base[estadisticas_mensuales.COLECCION])
+    empresas_deudores = {}
+    ruts = [e["rut"] for e in estadisticas if e.get("rut")]
+    for i in range(0, len(ruts), 1000):
+        for e in fuente.empresas(ruts[i:i + 1000]):
+            empresas_deudores[rut_utils.clave_rut(e["rut"])] = e
+
+    deudores = []
+    for e in estadisticas:
+        empresa = empresas_deudores.get(e["_id"])
+        if empresa:
+            deudores.append({
+                "rut_num": e["_id"], "rubro": empresa.get("rubro"), "tramo": empresa.get("tramo_ventas"),
+                "n": e["n"], "suma": e["suma"], "suma_cuad": e["suma_cuad"],
+            })
+
+    documentos = indice_pares.construir_indice(fuente.grupos_empresas(), deudores)
+    grupos = indice_pares.guardar_indice(db, documentos)
+    estado_indice_pares["listo"] = True
+    cache_consultas.descartar_si(lambda resultado: resultado.get("empresas_similares"))
+    print(f"✅ Índice de pares: {grupos} grupos con {len(deudores)} deudores con historial")
+    return grupos
+
+# Con SNAPSHOT_LOCAL=<ruta.sqlite> /consultar-rut lee de una réplica local
+# que se regenera al terminar cada carga (ver scripts/snapshot_local.py).
+RUTA_SNAPSHOT = os.getenv("SNAPSHOT_LOCAL")
+fuente_snapshot = FuenteSnapshot(RUTA_SNAPSHOT, fuente_mongo) if RUTA_SNAPSHOT else None
+
+
+def fuente_activa():
+    if fuente_snapshot and fuente_snapshot.disponible():
+        return fuente_snapshot
+    return fuente_mongo
+
+
+def regenerar_snapshot(ruta="post-carga", limpiar_cache=True):
+    """
+    Réplica local completa desde Mongo; devuelve los deudores exportados.
+    Sin `limpiar_cache` (arranque sin snapshot: los mismos datos que ya
+    respondía Mongo) se conservan los resultados precalentados.
+    """
+    base = lecturas.base(ruta)
+    ruts = [r for r in base["docs"].distinct("RUT DEUDOR") if r]
+    exportados = generar_snapshot(RUTA_SNAPSHOT, ruts, FuenteMongo(base), por_clave=USAR_RUT_NUM)
+    if limpiar_cache:
+        cache_consultas.limpiar()
+    print(f"✅ Snapshot local regenerado ({exportados} deudores)")
+    return exportados
+
+
+def actualizar_derivados():
+    """
+    Regenera lo que se deriva de una carga: índice de pares y exposición
+    (si se usan) y réplica local (si está activa), leyendo de la primaria
+    para ver lo recién escrito.
+
+    Cada regeneración deja su estado en metadata ("indice_pares",
+    "exposicion", "snapshot") y se intenta aunque falle otra. Devuelve una
+    advertencia por cada una que falló.
+    """
+    regeneraciones = []
+    if estado_indice_pares["listo"]:
+        regeneraciones.append(
+            ("indice_pares", lambda: f"{actualizar_indice_pares(ruta='post-carga')} grupos (rubro, tramo)")
         )
+    if estado_exposicion["listo"]:
+        regeneraciones.append(("exposicion", lambda: mensaje_exposicion(actualizar_exposicion("post-carga"))))
+    if fuente_snapshot:
+        regeneraciones.append(("snapshot", lambda: f"{regenerar_snapshot()} deudores exportados"))
+
+    advertencias = []
+    for tipo, regenerar in regeneraciones:
+        actualizar_estado_carga(tipo, "procesando", inicio=datetime.now())
+        try:
+            actualizar_estado_carga(tipo, "listo", mensaje=regenerar(), tocar_fecha=True)
+        except Exception as e:
+            print(f"⚠️ {tipo} no regenerado: {e}")
+            actualizar_estado_carga(tipo, "error", mensaje=str(e))
+            advertencias.append(f"{tipo}: {e}")
+    return advertencias
+
+
+def calcular_consulta_rut(rut, fuente=None):
+    """Arma el resultado de /consultar-rut como dict (sin serializar)."""
+    fuente = fuente or fuente_activa()
+
+    cruce = fuente.cruce(rut)
+
+    if cruce:
+        registros_limpios = cruce["registros_limpios"]
+        promedio = cruce["promedio"]
+        desviacion = cruce["desviacion"]
+
+        if not registros_limpios:
+            return {"error": "Todos los registros fueron considerados outliers."}
+
+        idx_ultimos = registros_limpios.ultimos(5)
+
+        promedio_ultimos = registros_limpios.promedio(idx_ultimos)
+        plazo_recomendado = max(30, round(promedio_ultimos + 0.5 * desviacion))
+
+        mascara_verano = registros_limpios.mascara_verano()
+        promedio_verano = registros_limpios.promedio(mascara_verano)
+        desviacion_verano = registros_limpios.desviacion(mascara_verano)
 
         reglas = aplicar_reglas_verano(
             rut, promedio_verano, promedio, desviacion_verano, desviacion
@@ -224,44 +729,22 @@ def consultar_por_rut(rut: str = Query(..., alias="rut")):
         factor_dias = reglas.get("factor_dias", 15)
         plazo_regla = reglas.get("plazo_recomendado")
 
-        # 🔧 Sobrescribir regla si es SERVIU/MINVU
-        if tipo == "SERVIU / MINVU":
-            plazo_recomendado = 180
-            factor_dias = 7.5
-        elif plazo_regla is not None and not np.isnan(plazo_regla):
+        # La regla de la tabla (p.ej. SERVIU/MINVU 180 días) pisa al cálculo por historial
+        if plazo_regla is not None:
             plazo_recomendado = plazo_regla
 
-        morosos_data = []
-        morosos = list(docs.find({"RUT DEUDOR": rut, "ESTADO": "MOROSO"}))
-
-        claves_pagadas = set(
-            normalizar_clave(f.get("Nº DCTO"), f.get("Nº OPE"))
-            for f in facturas
-            if normalizar_clave(f.get("Nº DCTO"), f.get("Nº OPE")) in pagos_dict
-        )
-
-        for m in morosos:
-            clave_m = normalizar_clave(m.get("Nº DCTO"), m.get("Nº OPE"))
-            if clave_m in claves_pagadas:
-                continue
-
-            emision = parse_fecha(m.get("FEC EMISION DIG"))
-            cesion = parse_fecha(m.get("FECHA CES"))
-            vcto = parse_fecha(m.get("VCTO NOM"))
-            monto = m.get("MONTO DOC")
-            saldo = m.get("SALDO")
-
-            dias_vencido = (datetime.today() - emision).days if emision else None
-            dias_mora = (datetime.today() - vcto).days if vcto else None
-
-            morosos_data.append({
-                "monto": monto,
-                "saldo": saldo,
-                "fecha_ces": cesion,
-                "fecha_emision": emision,
-                "dias_vencido": dias_vencido,
-                "dias_mora": dias_mora
-            })
+        hoy = datetime.today()
+        morosos_data = [
+            {
+                "monto": m["monto"],
+                "saldo": m["saldo"],
+                "fecha_ces": m["fecha_ces"],
+                "fecha_emision": m["fecha_emision"],
+                "dias_vencido": (hoy - m["fecha_emision"]).days if m["fecha_emision"] else None,
+                "dias_mora": (hoy - m["vcto"]).days if m["vcto"] else None
+            }
+            for m in fuente.morosos(rut, cruce)
+        ]
 
         hay_riesgo = any(
             m["dias_vencido"] and m["dias_vencido"] > plazo_recomendado
@@ -274,12 +757,12 @@ def consultar_por_rut(rut: str = Query(..., alias="rut")):
             f"Se recomienda cubrir {plazo_recomendado} días entre plazo y anticipo"
         )
 
-        factura_lenta = max(registros_limpios, key=lambda x: x["plazo"])
+        factura_lenta = registros_limpios.registro(registros_limpios.mas_lentas(1)[0])
 
-        return {
-            "nombre_deudor": facturas[0].get("DEUDOR", "Desconocido"),
+        resultado = {
+            "nombre_deudor": cruce["nombre"],
             "tipo_entidad": tipo,
-            "ultimos_pagos": ultimos_5,
+            "ultimos_pagos": registros_limpios.a_registros(idx_ultimos),
             "promedio_ultimos": float(promedio_ultimos),
             "promedio_historico": float(promedio),
             "desviacion_estandar": float(desviacion),
@@ -291,35 +774,40 @@ def consultar_por_rut(rut: str = Query(..., alias="rut")):
             "morosos": morosos_data,
             "riesgo_detectado": hay_riesgo
         }
+
+        pronostico = fuente.pronostico(rut)
+        if pronostico:
+            resultado["pronostico_verano"] = pronostico_verano.temporada(pronostico, motor_reglas().meses_verano)
+        return resultado
     
     # -------------------------------------------
     # municipalidades/corp SIN historial
     # -------------------------------------------
     tipo_entidad = obtener_tipo_entidad(rut)
+    regla_sin_historial = motor_reglas().sin_historial.get(tipo_entidad)
 
-    if tipo_entidad in ["MUNICIPALIDAD", "CORP MUNICIPAL", "SERVIU / MINVU"]:
-        empresa_base = empresas_chile.find_one({"rut": rut})
+    if regla_sin_historial:
+        empresa_base = fuente.empresa(rut)
         nombre = empresa_base.get("nombre") if empresa_base else "Entidad Pública (sin nombre registrado)"
 
-        if tipo_entidad == "SERVIU / MINVU":
-            plazo_recomendado = 180
-            recomendacion = "Se recomienda cubrir 180 días entre plazo y anticipo (regla SERVIU/MINVU)."
-        else:
-            plazo_recomendado = 105
-            recomendacion = "Se recomienda cubrir 105 días entre plazo y anticipo (promedio verano municipalidades)."
+        plazo_recomendado = regla_sin_historial["plazo"]
+        recomendacion = regla_sin_historial.get(
+            "recomendacion",
+            f"Se recomienda cubrir {plazo_recomendado} días entre plazo y anticipo."
+        )
 
         return {
             "nombre_deudor": nombre,
             "tipo_entidad": tipo_entidad,
             "plazo_recomendado": plazo_recomendado,
-            "factor_dias": 7.5,
+            "factor_dias": regla_sin_historial.get("factor_dias", 7.5),
             "ultimos_pagos": [],
             "morosos": [],
             "empresas_similares": False,
             "recomendacion": recomendacion
         }
 
-    empresa = empresas_chile.find_one({"rut": rut})
+    empresa = fuente.empresa(rut)
 
     if not empresa:
         return {
@@ -331,34 +819,9 @@ def consultar_por_rut(rut: str = Query(..., alias="rut")):
     rubro = empresa.get("rubro")
     tramo = empresa.get("tramo_ventas")
 
-    similares = list(empresas_chile.find({"rubro": rubro, "tramo_ventas": tramo}))
-    ruts_similares = [e["rut"] for e in similares]
-
-    facturas_sim = list(docs.find({"RUT DEUDOR": {"$in": ruts_similares}}))
-    pagos_sim = list(pagos.find({"Rut Deudor": {"$in": ruts_similares}}))
-
-    pagos_sim_dict = {
-        normalizar_clave(p.get("Nª Doc."), p.get("Nº Ope.")): p
-        for p in pagos_sim
-    }
-
-    plazos_sim = []
-    for f in facturas_sim:
-        clave = normalizar_clave(f.get("Nº DCTO"), f.get("Nº OPE"))
-        pago = pagos_sim_dict.get(clave)
-        if pago:
-            fe = parse_fecha(f.get("FEC EMISION DIG"))
-            fp = parse_fecha(pago.get("Fecha Pago"))
-            if fe and fp:
-                plazo = (fp - fe).days
-
-                # filtro anti-basura
-                if plazo < 0 or plazo > 365:
-                    continue
-
-                plazos_sim.append(plazo)
+    estadisticas_similares = fuente.similares(rubro, tramo)
 
-    if not plazos_sim:
+    if not estadisticas_similares:
         return {
             "nombre_deudor": empresa.get("nombre", "Desconocido"),
             "error": "No se encontraron pagos de empresas similares.",
@@ -366,8 +829,7 @@ def consultar_por_rut(rut: str = Query(..., alias="rut")):
             "recomendacion": "Sin suficiente información. Plazo base 30 días."
         }
 
-    promedio = np.mean(plazos_sim)
-    desviacion = np.std(plazos_sim)
+    cantidad, promedio, desviacion = estadisticas_similares
     plazo_recomendado = max(30, round(promedio + 0.5 * desviacion))
 
     return {
@@ -377,7 +839,7 @@ def consultar_por_rut(rut: str = Query(..., alias="rut")):
         "tramo": tramo,
         "promedio_empresas_similares": float(promedio),
         "desviacion_empresas_similares": float(desviacion),
-        "cantidad_empresas_similares": len(plazos_sim),
+        "cantidad_empresas_similares": cantidad,
         "plazo_recomendado": plazo_recomendado,
         "ultimos_pagos": [],
         "morosos": [],
@@ -389,29 +851,511 @@ def consultar_por_rut(rut: str = Query(..., alias="rut")):
 # 📜 HISTÓRICO DE PAGOS (todos, no solo los últimos 5)
 # ============================================================
 
-@app.get("/historico-pagos")
-def historico_pagos(rut: str = Query(..., alias="rut")):
+CAMPOS_HISTORICO_DEFECTO = ["monto", "fecha_ces", "fecha_emision", "fecha_pago", "plazo"]
+LIMITE_HISTORICO_MAX = 5000
+
+
+@app.get("/historico-pagos", response_class=RespuestaRapida)
+def historico_pagos(
+    rut: str = Query(..., alias="rut"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=LIMITE_HISTORICO_MAX),
+    desde: datetime = Query(None),
+    hasta: datetime = Query(None),
+    campos: str = Query(None),
+    summary_only: bool = Query(False),
+):
+    """
+    Histórico de pagos limpios de un RUT, del más nuevo al más antiguo.
+
+    - offset / limit: paginación; la respuesta trae `siguiente_offset`
+      (None cuando no quedan más páginas).
+    - desde / hasta: rango (inclusive) sobre la fecha de pago.
+    - campos: lista separada por comas de los campos a devolver por pago
+      (por defecto monto, fechas y plazo; `clave_original` y
+      `clave_normalizada` solo si se piden).
+    - summary_only: devuelve solo los totales, sin la lista de pagos.
+
+    El filtro, el orden y el corte de página se hacen sobre la tabla
+    columnar; solo las filas de la página se convierten a dicts.
+    """
+    with registro_consultas.medir("historico-pagos", rut_utils.formatear_rut(rut)):
+        return armar_historico_pagos(rut, offset, limit, desde, hasta, campos, summary_only)
+
+
+def armar_historico_pagos(rut, offset, limit, desde, hasta, campos, summary_only):
+    if not rut_valido(rut):
+        return RespuestaRapida({"error": "RUT no válido (revisar dígito verificador).", "pagos": []}, status_code=400)
 
     facturas, pagos_dict, registros_validos, registros_limpios, promedio, desviacion = cruzar_facturas_pagos(rut)
 
     if not facturas:
-        return {"error": "No se encontraron documentos para este RUT.", "pagos": []}
+        return RespuestaRapida({"error": "No se encontraron documentos para este RUT.", "pagos": []})
 
     if not registros_limpios:
-        return {
+        return RespuestaRapida({
             "nombre_deudor": facturas[0].get("DEUDOR", "Desconocido"),
             "error": "No se encontraron pagos históricos válidos para este RUT.",
             "pagos": []
-        }
+        })
 
-    registros_limpios.sort(key=lambda x: x["fecha_pago"], reverse=True)
+    if desde or hasta:
+        registros_limpios = registros_limpios.seleccionar(registros_limpios.mascara_rango(desde, hasta))
 
-    return {
+    respuesta = {
         "nombre_deudor": facturas[0].get("DEUDOR", "Desconocido"),
         "cantidad": len(registros_limpios),
-        "pagos": registros_limpios
     }
 
+    if summary_only:
+        if registros_limpios:
+            orden = registros_limpios.orden_reciente()
+            respuesta.update({
+                "promedio_plazo": registros_limpios.promedio(),
+                "desviacion_plazo": registros_limpios.desviacion(),
+                "monto_total": float(np.nansum(registros_limpios.monto)),
+                "primer_pago": registros_limpios.registro(orden[-1], ["fecha_pago"])["fecha_pago"],
+                "ultimo_pago": registros_limpios.registro(orden[0], ["fecha_pago"])["fecha_pago"],
+            })
+        return RespuestaRapida(respuesta)
+
+    if campos:
+        seleccion = [c.strip() for c in campos.split(",") if c.strip()]
+        invalidos = [c for c in seleccion if c not in registros_limpios.campos_disponibles()]
+        if invalidos:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Campos no válidos: {', '.join(invalidos)}"}
+            )
+    else:
+        seleccion = CAMPOS_HISTORICO_DEFECTO
+
+    pagina = registros_limpios.orden_reciente()[offset:offset + limit]
+    siguiente = offset + limit
+
+    respuesta.update({
+        "offset": offset,
+        "limit": limit,
+        "siguiente_offset": siguiente if siguiente < len(registros_limpios) else None,
+        "pagos": registros_limpios.a_registros(pagina, seleccion),
+    })
+    return RespuestaRapida(respuesta)
+
+
+# ============================================================
+# 📈 TENDENCIA DE PAGOS (buckets mensuales por deudor)
+# ============================================================
+
+def recalcular_estadisticas_mensuales(ruts):
+    """
+    Rehace los buckets mensuales de los RUTs tocados por una carga. Se
+    llama al final de procesar_docs/pagos_background: un doc nuevo puede
+    completar un cruce con un pago ya cargado y viceversa.
+
+    Con rut_num el cruce de una grafía ya trae las de todas, así que se
+    hace una vez por clave; si no, una vez por texto distinto (cada uno
+    con sus buckets).
+    """
+    coleccion = db[estadisticas_mensuales.COLECCION]
+    coleccion.create_index([("rut_num", 1), ("mes", 1)])
+    coleccion.create_index("rut")
+    ruts = rut_utils.uno_por_clave(ruts) if USAR_RUT_NUM else list(dict.fromkeys(str(r) for r in ruts))
+    for rut in ruts:
+        _, _, registros_validos, _, _, _ = cruzar_facturas_pagos(rut)
+        estadisticas_mensuales.guardar_buckets(coleccion, rut, registros_validos, usar_clave=USAR_RUT_NUM)
+
+
+def serie_mensual(rut):
+    coleccion = db[estadisticas_mensuales.COLECCION]
+    filtro = filtro_rut(rut, "rut")
+    documentos = list(coleccion.find(filtro))
+
+    # Deudores que no han pasado por una carga desde que existen los
+    # buckets: se calculan una vez acá y quedan guardados (los sin pagos,
+    # como una marca vacía)
+    if not documentos:
+        recalcular_estadisticas_mensuales([rut])
+        documentos = list(coleccion.find(filtro))
+
+    return estadisticas_mensuales.SerieMensual(documentos)
+
+
+@app.get("/tendencia-pagos", response_class=RespuestaRapida)
+def tendencia_pagos(
+    rut: str = Query(...),
+    ventanas: str = Query("90,180,365"),
+    vida_media_meses: float = Query(6, gt=0),
+):
+    """
+    Plazos de pago de un deudor por mes, con ventanas móviles (días),
+    agregado de verano (nov–feb) y promedio con peso exponencial por
+    antigüedad. Usa los cruces válidos (plazo entre 0 y 300 días), sin
+    el filtro de outliers.
+    """
+    if not rut_valido(rut):
+        return RespuestaRapida({"error": "RUT no válido (revisar dígito verificador)."}, status_code=400)
+
+    try:
+        dias = [int(v) for v in ventanas.split(",") if v.strip()]
+    except ValueError:
+        return RespuestaRapida({"error": "ventanas debe ser una lista de días separada por comas."}, status_code=400)
+
+    serie = serie_mensual(rut)
+    if not serie:
+        return RespuestaRapida({"error": "No se encontraron pagos para este RUT.", "serie": []})
+
+    return RespuestaRapida({
+        "rut": rut,
+        "total": serie.total(),
+        "ventanas": {str(d): serie.ventana(d) for d in dias},
+        "verano": serie.estacional(),
+        "promedio_ponderado": serie.promedio_ponderado(vida_media_meses),
+        "serie": serie.serie(),
+    })
+
+
+# ============================================================
+# ☀️ PRONÓSTICO DE VERANO (entidades públicas)
+# ============================================================
+
+# Pronóstico mensual por entidad (scripts/pronostico_verano.py). Se
+# recalcula en lote: POST /admin/pronostico-verano, o todos los días a
+# la hora PRONOSTICO_HORA (0-23) si está definida. /consultar-rut lo
+# agrega a la respuesta con una sola lectura por RUT.
+
+HORA_PRONOSTICOS = int(os.getenv("PRONOSTICO_HORA")) if os.getenv("PRONOSTICO_HORA") else None
+
+estado_pronosticos = {"listo": False}
+_tipos_entidades = None
+
+
+def tipos_entidades():
+    global _tipos_entidades
+    if _tipos_entidades is None:
+        _tipos_entidades = pronostico_verano.entidades(*listas_entidades(), pronostico_verano.ruts_detectados())
+    return _tipos_entidades
+
+
+def actualizar_pronosticos():
+    tipos = tipos_entidades()
+    base = lecturas.base("pronostico-verano")
+
+    # Entidades con docs que todavía no tienen buckets
+    con_buckets = set(base[estadisticas_mensuales.COLECCION].distinct("rut_num", {"rut_num": {"$in": list(tipos)}}))
+    faltantes = [
+        r for r in base["docs"].distinct("RUT DEUDOR")
+        if r and rut_utils.clave_rut(r) in tipos and rut_utils.clave_rut(r) not in con_buckets
+    ]
+    recalcular_estadisticas_mensuales(faltantes)
+    if faltantes:
+        base = lecturas.base("post-carga")
+
+    documentos = pronostico_verano.calcular(base[estadisticas_mensuales.COLECCION], tipos, motor_reglas().meses_verano)
+    total = pronostico_verano.guardar(db, documentos)
+    estado_pronosticos["listo"] = True
+    cache_consultas.descartar_si(lambda resultado: "cantidad_historico" in resultado)
+    print(f"✅ Pronósticos de verano: {total} entidades con historial")
+    return total
+
+
+def pronostico_verano_background():
+    try:
+        total = actualizar_pronosticos()
+        actualizar_estado_carga("pronostico_verano", "listo", mensaje=f"{total} entidades", tocar_fecha=True)
+    except Exception as e:
+        actualizar_estado_carga("pronostico_verano", "error", mensaje=str(e))
+
+
+def pronosticos_diarios():
+    while True:
+        ahora = datetime.now()
+        siguiente = ahora.replace(hour=HORA_PRONOSTICOS, minute=0, second=0, microsecond=0)
+        if siguiente <= ahora:
+            siguiente += timedelta(days=1)
+        time.sleep((siguiente - ahora).total_seconds())
+        actualizar_estado_carga("pronostico_verano", "procesando", inicio=datetime.now())
+        pronostico_verano_background()
+
+
+@app.post("/admin/pronostico-verano")
+def admin_pronostico_verano(background_tasks: BackgroundTasks):
+    actualizar_estado_carga("pronostico_verano", "procesando", inicio=datetime.now())
+    background_tasks.add_task(pronostico_verano_background)
+    return {"mensaje": "Cálculo de pronósticos de verano iniciado en segundo plano."}
+
+
+# ============================================================
+# 💰 EXPOSICIÓN POR DEUDOR Y CLIENTE
+# ============================================================
+
+# Ranking de saldo moroso, documentos abiertos y días vencidos
+# (scripts/exposicion.py). Una vez calculado con POST /admin/exposicion
+# se sirve desde la colección resumen y se rehace al final de cada
+# carga; antes de eso GET /exposicion lo calcula en el momento.
+
+estado_exposicion = {"listo": False}
+
+
+def actualizar_exposicion(ruta="exposicion"):
+    resumen = exposicion.calcular(lecturas.base(ruta))
+    exposicion.guardar(db, resumen)
+    estado_exposicion["listo"] = True
+    totales = resumen["totales"]
+    print(f"✅ Exposición: {totales['deudores']} deudores, {totales['clientes']} clientes")
+    return totales
+
+
+def mensaje_exposicion(totales):
+    return f"{totales['deudores']} deudores, {totales['clientes']} clientes"
+
+
+def exposicion_background():
+    try:
+        totales = actualizar_exposicion()
+        actualizar_estado_carga("exposicion", "listo", mensaje=mensaje_exposicion(totales), tocar_fecha=True)
+    except Exception as e:
+        actualizar_estado_carga("exposicion", "error", mensaje=str(e))
+
+
+@app.get("/exposicion", response_class=RespuestaRapida)
+def ver_exposicion(
+    por: str = Query("deudor"),
+    orden: str = Query("saldo_moroso"),
+    limite: int = Query(50, ge=1, le=5000),
+):
+    if por not in ("deudor", "cliente"):
+        return JSONResponse(status_code=400, content={"mensaje": "Parámetro 'por' no válido. Usar deudor o cliente."})
+    if orden not in exposicion.ORDENES:
+        return JSONResponse(status_code=400, content={"mensaje": f"Orden no válido. Usar: {', '.join(exposicion.ORDENES)}."})
+
+    base = lecturas.base("exposicion")
+    if estado_exposicion["listo"]:
+        resultado = exposicion.leer(base, por, limite, orden)
+        if resultado:
+            return RespuestaRapida({"por": por, "fuente": "resumen", **resultado})
+
+    resumen = exposicion.calcular(base)
+    ranking = sorted(
+        resumen["deudores" if por == "deudor" else "clientes"],
+        key=lambda f: (f[orden] is not None, f[orden] or 0), reverse=True
+    )
+    return RespuestaRapida({
+        "por": por, "fuente": "en vivo", "generado": resumen["generado"],
+        "totales": resumen["totales"], "ranking": ranking[:limite],
+    })
+
+
+@app.post("/admin/exposicion")
+def admin_exposicion(background_tasks: BackgroundTasks):
+    actualizar_estado_carga("exposicion", "procesando", inicio=datetime.now())
+    background_tasks.add_task(exposicion_background)
+    return {"mensaje": "Cálculo de exposición iniciado en segundo plano."}
+
+
+# ============================================================
+# 📤 EXPORTAR (CSV / Parquet en streaming)
+# ============================================================
+
+COLUMNAS_EXPORTACION = [
+    "rut_deudor", "nombre_deudor", "n_doc", "n_ope",
+    "fecha_ces", "fecha_emision", "fecha_pago", "plazo", "monto", "outlier",
+]
+FILAS_POR_LOTE_EXPORTACION = 5000
+
+
+def ruts_a_exportar(ruts, desde, hasta):
+    """
+    RUTs deudores a exportar. Si no se indican, se toman de los pagos del
+    rango de fechas con un cursor de `distinct` (no se cargan los pagos).
+    """
+    if ruts:
+        return ruts
+
+    filtro = {}
+    if desde or hasta:
+        filtro["Fecha Pago"] = {}
+        if desde:
+            filtro["Fecha Pago"]["$gte"] = desde
+        if hasta:
+            filtro["Fecha Pago"]["$lte"] = hasta
+    return sorted(r for r in lecturas.base("exportar")["pagos"].distinct("Rut Deudor", filtro) if r)
+
+
+def filas_exportacion(ruts, desde, hasta):
+    """
+    Genera lotes de filas (listas de dicts) cruzando un RUT a la vez, así
+    la memoria queda acotada al deudor más grande y no al total exportado.
+    """
+    base = lecturas.base("exportar")
+    lote = []
+    for rut in ruts:
+        facturas, _, registros_validos, _, promedio, desviacion = cruzar_facturas_pagos(rut, base)
+        if not registros_validos:
+            continue
+
+        outliers = registros_validos.mascara_outliers(promedio, desviacion)
+        seleccion = registros_validos.mascara_rango(desde, hasta) if (desde or hasta) else None
+        nombre = facturas[0].get("DEUDOR", "Desconocido")
+
+        for i in registros_validos.orden_reciente():
+            if seleccion is not None and not seleccion[i]:
+                continue
+            r = registros_validos.registro(i)
+            lote.append({
+                "rut_deudor": rut,
+                "nombre_deudor": nombre,
+                "n_doc": r["clave_normalizada"][0],
+                "n_ope": r["clave_normalizada"][1],
+                "fecha_ces": r["fecha_ces"],
+                "fecha_emision": r["fecha_emision"],
+                "fecha_pago": r["fecha_pago"],
+                "plazo": r["plazo"],
+                "monto": r["monto"],
+                "outlier": bool(outliers[i]),
+            })
+            if len(lote) >= FILAS_POR_LOTE_EXPORTACION:
+                yield lote
+                lote = []
+
+    if lote:
+        yield lote
+
+
+def _formato_csv(valor):
+    if isinstance(valor, datetime):
+        return valor.strftime("%Y-%m-%d")
+    return "" if valor is None else valor
+
+
+def generar_csv(lotes):
+    import csv
+    import io
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNAS_EXPORTACION)
+
+    for lote in lotes:
+        for fila in lote:
+            writer.writerow([_formato_csv(fila[c]) for c in COLUMNAS_EXPORTACION])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _SalidaPorPartes:
+    """Archivo de solo escritura que acumula bytes para entregarlos por partes."""
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self):
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+
+def generar_parquet(lotes):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.schema([
+        ("rut_deudor", pa.string()),
+        ("nombre_deudor", pa.string()),
+        ("n_doc", pa.string()),
+        ("n_ope", pa.string()),
+        ("fecha_ces", pa.timestamp("s")),
+        ("fecha_emision", pa.timestamp("s")),
+        ("fecha_pago", pa.timestamp("s")),
+        ("plazo", pa.int32()),
+        ("monto", pa.float64()),
+        ("outlier", pa.bool_()),
+    ])
+
+    salida = _SalidaPorPartes()
+    writer = pq.ParquetWriter(salida, esquema)
+
+    # Cada lote se escribe como un row group y se entrega apenas está listo
+    for lote in lotes:
+        columnas = {c: [fila[c] for fila in lote] for c in COLUMNAS_EXPORTACION}
+        columnas["nombre_deudor"] = [str(v) for v in columnas["nombre_deudor"]]
+        columnas["monto"] = [float(v) if isinstance(v, (int, float)) else None for v in columnas["monto"]]
+        writer.write_table(pa.table(columnas, schema=esquema))
+        datos = salida.vaciar()
+        if datos:
+            yield datos
+
+    writer.close()
+    yield salida.vaciar()
+
+
+@app.get("/exportar")
+def exportar(
+    rut: str = Query(None),
+    ruts: str = Query(None),
+    desde: datetime = Query(None),
+    hasta: datetime = Query(None),
+    formato: str = Query("csv"),
+):
+    """
+    Exporta los cruces factura/pago (incluye la marca de outlier) como CSV
+    o Parquet, en streaming.
+
+    - rut: un deudor.
+    - ruts: varios deudores separados por coma.
+    - desde / hasta: rango de fecha de pago. Sin RUTs, exporta todos los
+      deudores con pagos en ese rango.
+    """
+    formato = formato.lower()
+    if formato not in ("csv", "parquet"):
+        return JSONResponse(status_code=400, content={"error": "Formato no soportado. Usar csv o parquet."})
+
+    lista_ruts = [r.strip() for r in (ruts or "").split(",") if r.strip()]
+    if rut:
+        lista_ruts.insert(0, rut.strip())
+
+    if not lista_ruts and not (desde or hasta):
+        return JSONResponse(status_code=400, content={"error": "Indicar rut, ruts o un rango de fechas."})
+
+    if formato == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return JSONResponse(status_code=501, content={"error": "Exportación Parquet no disponible (falta pyarrow)."})
+
+    lotes = filas_exportacion(ruts_a_exportar(lista_ruts, desde, hasta), desde, hasta)
+    nombre = f"exportacion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+
+    if formato == "csv":
+        contenido, media_type = generar_csv(lotes), "text/csv"
+    else:
+        contenido, media_type = generar_parquet(lotes), "application/vnd.apache.parquet"
+
+    return StreamingResponse(
+        contenido,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'}
+    )
+
 
 # ============================================================
 # 🔧 test-cruce
@@ -420,8 +1364,8 @@ def historico_pagos(rut: str = Query(..., alias="rut")):
 @app.get("/test-cruce")
 def test_cruce(rut: str):
 
-    facturas = list(docs.find({"RUT DEUDOR": rut}))
-    pagos_deudor = list(pagos.find({"Rut Deudor": rut}))
+    facturas = list(docs.find(filtro_rut(rut, "RUT DEUDOR")))
+    pagos_deudor = list(pagos.find(filtro_rut(rut, "Rut Deudor")))
 
     pagos_dict = {}
     for p in pagos_deudor:
@@ -466,7 +1410,7 @@ def test_cruce(rut: str):
 @app.get("/test-pagos-keys")
 def test_pagos_keys(rut: str = None):
     if rut:
-        pagos_deudor = pagos.find({"Rut Deudor": rut})
+        pagos_deudor = pagos.find(filtro_rut(rut, "Rut Deudor"))
     else:
         pagos_deudor = pagos.find().limit(20)
 
@@ -482,7 +1426,7 @@ def test_pagos_keys(rut: str = None):
 # 📂 Subida de archivos
 # ============================================================
 
-def actualizar_estado_carga(tipo, estado, mensaje=None, tocar_fecha=False, **extra):
+def actualizar_estado_carga(tipo, estado, mensaje=None, tocar_fecha=False, limpiar_cache=True, **extra):
     campos = {"tipo": tipo, "estado": estado, "mensaje": mensaje, **extra}
     if tocar_fecha:
         campos["ultima_actualizacion"] = datetime.now()
@@ -495,6 +1439,10 @@ def actualizar_estado_carga(tipo, estado, mensaje=None, tocar_fecha=False, **ext
 
     db["metadata"].update_one({"tipo": tipo}, {"$set": campos}, upsert=True)
 
+    # Cualquier carga o limpieza terminada puede cambiar resultados
+    if estado == "listo" and limpiar_cache:
+        cache_consultas.limpiar()
+
 
 def formatear_resumen(resumen):
     partes = [f"{resumen.get('nuevos', 0)} nuevos"]
@@ -515,15 +1463,56 @@ def formatear_resumen(resumen):
 # hilo aparte; el frontend consulta /estado-carga por el avance.
 # ------------------------------------------------------------
 
+# Las cargas de docs/pagos van por chunks con checkpoint en metadata
+# (scripts/cargas_reanudables.py): si la instancia se recicla a mitad de
+# un archivo, al arrancar se retoma desde el último chunk escrito.
+# CARGAS_CON_STAGING=1 escribe primero a staging y fusiona al final.
+CARGAS_CON_STAGING = os.getenv("CARGAS_CON_STAGING", "0") == "1"
+
+
+def progreso_carga(tipo):
+    def informar(filas, total):
+        actualizar_estado_carga(tipo, "procesando", mensaje=f"{filas} de {total} filas escritas")
+    return informar
+
+
+def derivados_tras_carga(ruts=None):
+    """
+    Recalcula lo que depende de la carga (buckets de los RUTs tocados y
+    actualizar_derivados). Los datos ya quedaron escritos: si algo de esto
+    falla la carga sigue "listo" y el error vuelve como advertencia.
+    """
+    advertencias = []
+    if ruts is not None:
+        try:
+            recalcular_estadisticas_mensuales(ruts)
+        except Exception as e:
+            print(f"⚠️ Estadísticas mensuales no recalculadas: {e}")
+            advertencias.append(f"estadísticas mensuales: {e}")
+    return advertencias + actualizar_derivados()
+
+
+def mensaje_con_advertencias(mensaje, advertencias):
+    return mensaje if not advertencias else f"{mensaje} (con advertencias: {'; '.join(advertencias)})"
+
+
 def procesar_docs_background(ruta, filename):
-    from scripts.cargar_datos import cargar_excel, insertar_documentos
+    from scripts.cargar_datos import cargar_excel, escribir_lote, preparar_documento
+    from scripts.cargas_reanudables import cargar_con_checkpoint
     try:
         df = cargar_excel(ruta)
         if df.empty:
             actualizar_estado_carga("docs", "error", mensaje="Archivo sin datos válidos")
             return
-        resumen = insertar_documentos(df, filename)
-        actualizar_estado_carga("docs", "listo", mensaje=formatear_resumen(resumen), tocar_fecha=True)
+        resumen = cargar_con_checkpoint(
+            db, "docs", ruta, filename, df, escribir_lote, preparar_documento,
+            staging=CARGAS_CON_STAGING, progreso=progreso_carga("docs")
+        )
+        advertencias = derivados_tras_carga(df["RUT DEUDOR"].dropna().unique() if "RUT DEUDOR" in df else [])
+        actualizar_estado_carga(
+            "docs", "listo", mensaje=mensaje_con_advertencias(formatear_resumen(resumen), advertencias),
+            tocar_fecha=True, advertencias=advertencias
+        )
     except Exception as e:
         actualizar_estado_carga("docs", "error", mensaje=str(e))
     finally:
@@ -532,14 +1521,22 @@ def procesar_docs_background(ruta, filename):
 
 
 def procesar_pagos_background(ruta, filename):
-    from scripts.cargar_pagos import cargar_y_limpiar_excel, insertar_documentos
+    from scripts.cargar_pagos import cargar_y_limpiar_excel, escribir_lote, preparar_documento
+    from scripts.cargas_reanudables import cargar_con_checkpoint
     try:
         df = cargar_y_limpiar_excel(ruta)
         if df.empty:
             actualizar_estado_carga("pagos", "error", mensaje="Archivo sin datos válidos")
             return
-        resumen = insertar_documentos(df, filename)
-        actualizar_estado_carga("pagos", "listo", mensaje=formatear_resumen(resumen), tocar_fecha=True)
+        resumen = cargar_con_checkpoint(
+            db, "pagos", ruta, filename, df, escribir_lote, preparar_documento,
+            staging=CARGAS_CON_STAGING, progreso=progreso_carga("pagos")
+        )
+        advertencias = derivados_tras_carga(df["Rut Deudor"].dropna().unique())
+        actualizar_estado_carga(
+            "pagos", "listo", mensaje=mensaje_con_advertencias(formatear_resumen(resumen), advertencias),
+            tocar_fecha=True, advertencias=advertencias
+        )
     except Exception as e:
         actualizar_estado_carga("pagos", "error", mensaje=str(e))
     finally:
@@ -551,7 +1548,11 @@ def procesar_empresas_background(ruta):
     from scripts.cargar_empresas import procesar_txt
     try:
         total = procesar_txt(ruta)
-        actualizar_estado_carga("empresas", "listo", mensaje=f"{total} empresas cargadas", tocar_fecha=True)
+        advertencias = derivados_tras_carga()
+        actualizar_estado_carga(
+            "empresas", "listo", mensaje=mensaje_con_advertencias(f"{total} empresas cargadas", advertencias),
+            tocar_fecha=True, advertencias=advertencias
+        )
     except Exception as e:
         actualizar_estado_carga("empresas", "error", mensaje=str(e))
     finally:
@@ -567,11 +1568,21 @@ def recibir_archivo(background_tasks, file, tipo, funcion_background, *args_extr
         with open(ruta, "wb") as f:
             shutil.copyfileobj(file.file, f)
 
+        # Cabecera y muestra de filas: un archivo equivocado se rechaza acá,
+        # sin lanzar la carga ni tocar el estado de la última carga buena.
+        try:
+            validar_archivo(tipo, ruta)
+        except ArchivoInvalido as e:
+            os.remove(ruta)
+            return JSONResponse(status_code=e.status_code, content={"mensaje": f"Archivo rechazado: {e}"})
+
         peso_bytes = os.path.getsize(ruta)
         actualizar_estado_carga(
             tipo, "procesando",
             archivo=filename, peso_bytes=peso_bytes, inicio=datetime.now()
         )
+        if perfilador and perfilador.toca_carga():
+            funcion_background = perfilador.envolver(funcion_background, f"carga-{tipo}", filename)
         background_tasks.add_task(funcion_background, ruta, *args_extra)
 
         return {"mensaje": f"Archivo {filename} recibido, procesando en segundo plano."}
@@ -581,13 +1592,38 @@ def recibir_archivo(background_tasks, file, tipo, funcion_background, *args_extr
         return JSONResponse(status_code=500, content={"mensaje": f"Error al subir archivo: {str(e)}"})
 
 
+# Las cargas de docs/pagos reconocen filas repetidas por el _hash
+# canónico: con filas aún en el sha256 anterior, reexportar un informe lo
+# insertaría de nuevo. Hasta que corra /admin/migrar-hash se rechazan.
+HASH_MIGRADO = False
+
+
+def hash_migrado():
+    global HASH_MIGRADO
+    if not HASH_MIGRADO:
+        from scripts.migrar_hash import migracion_lista
+        HASH_MIGRADO = migracion_lista(db)
+    return HASH_MIGRADO
+
+
+def hash_pendiente():
+    return JSONResponse(
+        status_code=409,
+        content={"mensaje": "Hay filas con el _hash anterior: correr /admin/migrar-hash antes de cargar."}
+    )
+
+
 @app.post("/subir-docs")
 async def subir_docs(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    if not hash_migrado():
+        return hash_pendiente()
     return recibir_archivo(background_tasks, file, "docs", procesar_docs_background, file.filename)
 
 
 @app.post("/subir-pagos")
 async def subir_pagos(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    if not hash_migrado():
+        return hash_pendiente()
     return recibir_archivo(background_tasks, file, "pagos", procesar_pagos_background, file.filename)
 
 
@@ -596,11 +1632,312 @@ async def subir_empresas(background_tasks: BackgroundTasks, file: UploadFile = F
     return recibir_archivo(background_tasks, file, "empresas", procesar_empresas_background)
 
 
+# ------------------------------------------------------------
+# Limpieza de duplicados (docs / pagos) como tarea de admin: se
+# agrupa en el servidor y se borra en lotes; el avance queda en
+# /estado-carga bajo "duplicados".
+#
+# Si la instancia se recicla a mitad de la limpieza el estado queda en
+# "procesando" para siempre: pasados MINUTOS_LIMPIEZA_VENCIDA sin avance
+# (cada lote informa y renueva `latido`) se considera abandonada y se
+# puede volver a lanzar.
+# ------------------------------------------------------------
+
+MINUTOS_LIMPIEZA_VENCIDA = float(os.getenv("MINUTOS_LIMPIEZA_VENCIDA", "30"))
+
+
+def limpieza_en_curso(registro):
+    if not registro or registro.get("estado") != "procesando":
+        return False
+    ultimo = registro.get("latido") or registro.get("inicio")
+    return bool(ultimo) and datetime.now() - ultimo < timedelta(minutes=MINUTOS_LIMPIEZA_VENCIDA)
+
+
+def limpiar_duplicados_background(tipo):
+    from scripts.limpieza_duplicados import eliminar_duplicados
+
+    def progreso(grupos, eliminados):
+        actualizar_estado_carga(
+            "duplicados", "procesando",
+            mensaje=f"{tipo}: {grupos} grupos revisados, {eliminados} eliminados",
+            latido=datetime.now()
+        )
+
+    try:
+        # El $group va a una secundaria si hay; los borrados, a la primaria
+        resultado = eliminar_duplicados(lecturas.base("duplicados")[tipo], tipo, progreso=progreso)
+        actualizar_estado_carga(
+            "duplicados", "listo",
+            mensaje=f"{tipo}: {resultado['eliminados']} duplicados eliminados en {resultado['grupos']} grupos",
+            tocar_fecha=True
+        )
+    except Exception as e:
+        actualizar_estado_carga("duplicados", "error", mensaje=str(e))
+
+
+@app.post("/admin/eliminar-duplicados")
+def admin_eliminar_duplicados(background_tasks: BackgroundTasks, coleccion: str = Query(...)):
+    if coleccion not in ("docs", "pagos"):
+        return JSONResponse(status_code=400, content={"mensaje": "Colección no válida. Usar docs o pagos."})
+
+    if limpieza_en_curso(db["metadata"].find_one({"tipo": "duplicados"})):
+        return JSONResponse(status_code=409, content={"mensaje": "Ya hay una limpieza de duplicados en curso."})
+
+    ahora = datetime.now()
+    actualizar_estado_carga("duplicados", "procesando", archivo=coleccion, inicio=ahora, latido=ahora)
+    background_tasks.add_task(limpiar_duplicados_background, coleccion)
+    return {"mensaje": f"Limpieza de duplicados en '{coleccion}' iniciada en segundo plano."}
+
+
+# ------------------------------------------------------------
+# Compactación al esquema de scripts/esquema.py: columnas no usadas
+# a '<colección>_archivo', campos tipados, sin NaN.
+# ------------------------------------------------------------
+
+def compactar_esquema_background():
+    from scripts.compactar_esquema import compactar
+
+    def progreso(nombre, compactados):
+        actualizar_estado_carga("compactacion_esquema", "procesando", mensaje=f"{nombre}: {compactados} compactados")
+
+    try:
+        resumen = compactar(db, progreso=progreso)
+        actualizar_estado_carga(
+            "compactacion_esquema", "listo",
+            mensaje=", ".join(f"{k}: {v}" for k, v in resumen.items()), tocar_fecha=True
+        )
+    except Exception as e:
+        actualizar_estado_carga("compactacion_esquema", "error", mensaje=str(e))
+
+
+@app.post("/admin/compactar-esquema")
+def admin_compactar_esquema(background_tasks: BackgroundTasks):
+    actualizar_estado_carga("compactacion_esquema", "procesando", inicio=datetime.now())
+    background_tasks.add_task(compactar_esquema_background)
+    return {"mensaje": "Compactación de docs y pagos iniciada en segundo plano."}
+
+
+# ------------------------------------------------------------
+# Índice de pares similares (scripts/indice_pares.py). La primera
+# construcción calcula los buckets mensuales que falten.
+# ------------------------------------------------------------
+
+def indice_pares_background():
+    try:
+        grupos = actualizar_indice_pares(incluir_faltantes=True)
+        actualizar_estado_carga("indice_pares", "listo", mensaje=f"{grupos} grupos (rubro, tramo)", tocar_fecha=True)
+    except Exception as e:
+        actualizar_estado_carga("indice_pares", "error", mensaje=str(e))
+
+
+@app.post("/admin/indice-pares")
+def admin_indice_pares(background_tasks: BackgroundTasks):
+    actualizar_estado_carga("indice_pares", "procesando", inicio=datetime.now())
+    background_tasks.add_task(indice_pares_background)
+    return {"mensaje": "Construcción del índice de pares iniciada en segundo plano."}
+
+
+# ------------------------------------------------------------
+# Migración a rut_num (clave entera del RUT). Mientras no termine,
+# las consultas siguen usando los campos de texto.
+# ------------------------------------------------------------
+
+def migrar_rut_num_background():
+    global USAR_RUT_NUM
+    from scripts.migrar_rut_num import migrar
+
+    def progreso(nombre, actualizados):
+        actualizar_estado_carga("migracion_rut_num", "procesando", mensaje=f"{nombre}: {actualizados} actualizados")
+
+    try:
+        resumen = migrar(db, progreso=progreso)
+        USAR_RUT_NUM = True
+        # Cambian los filtros y las claves del cache (texto → rut_num); el
+        # snapshot se generó por texto y se rehace por clave
+        cache_consultas.limpiar()
+        actualizar_derivados()
+        actualizar_estado_carga(
+            "migracion_rut_num", "listo",
+            mensaje=", ".join(f"{k}: {v}" for k, v in resumen.items()), tocar_fecha=True
+        )
+    except Exception as e:
+        actualizar_estado_carga("migracion_rut_num", "error", mensaje=str(e))
+
+
+@app.post("/admin/migrar-rut-num")
+def admin_migrar_rut_num(background_tasks: BackgroundTasks):
+    actualizar_estado_carga("migracion_rut_num", "procesando", inicio=datetime.now())
+    background_tasks.add_task(migrar_rut_num_background)
+    return {"mensaje": "Migración a rut_num iniciada en segundo plano."}
+
+
+# ------------------------------------------------------------
+# Migración al _hash canónico (scripts/hash_filas.py). Borra las filas
+# que resultan repetidas, así que después se limpia el cache.
+# ------------------------------------------------------------
+
+def migrar_hash_background():
+    global HASH_MIGRADO
+    from scripts.migrar_hash import migrar
+
+    def progreso(nombre, actualizados, eliminados):
+        actualizar_estado_carga(
+            "migracion_hash", "procesando",
+            mensaje=f"{nombre}: {actualizados} reescritos, {eliminados} duplicados eliminados"
+        )
+
+    try:
+        resumen = migrar(db, progreso=progreso)
+        HASH_MIGRADO = True
+        if any(r["duplicados_eliminados"] for r in resumen.values()):
+            cache_consultas.limpiar()
+        actualizar_estado_carga(
+            "migracion_hash", "listo",
+            mensaje=", ".join(
+                f"{nombre}: {r['actualizados']} reescritos, {r['duplicados_eliminados']} duplicados eliminados"
+                for nombre, r in resumen.items()
+            ),
+            tocar_fecha=True
+        )
+    except Exception as e:
+        actualizar_estado_carga("migracion_hash", "error", mensaje=str(e))
+
+
+@app.post("/admin/migrar-hash")
+def admin_migrar_hash(background_tasks: BackgroundTasks):
+    actualizar_estado_carga("migracion_hash", "procesando", inicio=datetime.now())
+    background_tasks.add_task(migrar_hash_background)
+    return {"mensaje": "Migración de _hash iniciada en segundo plano."}
+
+
+# ------------------------------------------------------------
+# Réplica local (modo SNAPSHOT_LOCAL): regeneración manual.
+# ------------------------------------------------------------
+
+def snapshot_background(limpiar_cache=True):
+    try:
+        exportados = regenerar_snapshot(ruta="snapshot", limpiar_cache=limpiar_cache)
+        actualizar_estado_carga(
+            "snapshot", "listo", mensaje=f"{exportados} deudores exportados",
+            tocar_fecha=True, limpiar_cache=limpiar_cache
+        )
+    except Exception as e:
+        actualizar_estado_carga("snapshot", "error", mensaje=str(e))
+
+
+@app.post("/admin/snapshot")
+def admin_snapshot(background_tasks: BackgroundTasks):
+    if not fuente_snapshot:
+        return JSONResponse(status_code=400, content={"mensaje": "Modo snapshot desactivado (definir SNAPSHOT_LOCAL)."})
+    actualizar_estado_carga("snapshot", "procesando", inicio=datetime.now())
+    background_tasks.add_task(snapshot_background)
+    return {"mensaje": "Regeneración del snapshot local iniciada en segundo plano."}
+
+
+# ------------------------------------------------------------
+# Analítica de consultas: top RUTs por cantidad y por latencia p95
+# (desde el log capped que llena RegistroConsultas).
+# ------------------------------------------------------------
+
+@app.get("/admin/consultas")
+def admin_consultas(dias: int = Query(7, ge=1), limite: int = Query(20, ge=1, le=500), endpoint: str = Query(None)):
+    registro_consultas.vaciar()
+    return resumen_por_rut(lecturas.base("consultas"), dias=dias, limite=limite, endpoint=endpoint)
+
+
+@app.get("/admin/lecturas")
+def admin_lecturas():
+    return lecturas.estado()
+
+
+# ------------------------------------------------------------
+# Perfilado (solo con PERFILADO=1): qué perfilar y los perfiles
+# guardados. GET /admin/perfiles/{id} devuelve el .prof; con
+# ?formato=texto, el resumen por tiempo acumulado.
+# ------------------------------------------------------------
+
+def perfilado_deshabilitado():
+    return JSONResponse(status_code=400, content={"mensaje": "Perfilado deshabilitado (definir PERFILADO=1)."})
+
+
+@app.get("/admin/perfilado")
+def admin_ver_perfilado():
+    if not perfilador:
+        return perfilado_deshabilitado()
+    return perfilador.estado()
+
+
+@app.put("/admin/perfilado")
+def admin_configurar_perfilado(muestreo: float = Body(None, embed=True), cargas: int = Body(None, embed=True)):
+    if not perfilador:
+        return perfilado_deshabilitado()
+    perfilador.configurar(muestreo=muestreo, cargas=cargas)
+    return perfilador.estado()
+
+
+@app.get("/admin/perfiles")
+def admin_perfiles(limite: int = Query(20, ge=1, le=100)):
+    if not perfilador:
+        return perfilado_deshabilitado()
+    from scripts.perfilado import listar_perfiles
+    return listar_perfiles(db, limite)
+
+
+@app.get("/admin/perfiles/{perfil_id}")
+def admin_descargar_perfil(perfil_id: str, formato: str = Query("prof")):
+    if not perfilador:
+        return perfilado_deshabilitado()
+    from bson import ObjectId
+    from bson.errors import InvalidId
+    from scripts.perfilado import COLECCION
+    try:
+        perfil = db[COLECCION].find_one({"_id": ObjectId(perfil_id)})
+    except InvalidId:
+        perfil = None
+    if not perfil:
+        return JSONResponse(status_code=404, content={"mensaje": "Perfil no encontrado."})
+
+    if formato == "texto":
+        return PlainTextResponse(perfil["resumen"])
+    nombre = f"{perfil['objetivo']}_{perfil['fecha']:%Y%m%d_%H%M%S}.prof"
+    return Response(
+        bytes(perfil["prof"]), media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'}
+    )
+
+
+# ------------------------------------------------------------
+# Tabla de reglas de plazo: se puede reemplazar en caliente sin
+# redeploy. La nueva tabla se compila antes de guardarla, así que
+# una tabla inválida no llega a reemplazar a la activa.
+# ------------------------------------------------------------
+
+@app.get("/admin/reglas")
+def admin_ver_reglas():
+    return motor_reglas().tabla
+
+
+@app.put("/admin/reglas")
+def admin_actualizar_reglas(tabla: dict = Body(...)):
+    try:
+        instalar_reglas(tabla)
+        cache_consultas.limpiar()
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"mensaje": f"Tabla de reglas no válida: {e}"})
+
+    db["metadata"].update_one(
+        {"tipo": "reglas_plazos"},
+        {"$set": {"tipo": "reglas_plazos", "tabla": tabla, "ultima_actualizacion": datetime.now()}},
+        upsert=True
+    )
+    return {"mensaje": f"Tabla de reglas actualizada ({len(tabla.get('reglas', []))} reglas)."}
+
+
 @app.get("/estado-carga")
 def estado_carga():
     registros = {
         r["tipo"]: r
-        for r in db["metadata"].find({"tipo": {"$in": ["docs", "pagos", "empresas"]}})
+        for r in db["metadata"].find({"tipo": {"$in": ["docs", "pagos", "empresas", "duplicados"]}})
     }
 
     def resumen(tipo):
@@ -612,10 +1949,13 @@ def estado_carga():
             "archivo": r.get("archivo"),
             "peso_bytes": r.get("peso_bytes"),
             "duracion_segundos": r.get("duracion_segundos"),
+            "advertencias": (r.get("advertencias") or []) if r.get("estado") == "listo" else [],
         }
 
     return {
         "docs": resumen("docs"),
         "pagos": resumen("pagos"),
         "empresas": resumen("empresas"),
+        "duplicados": resumen("duplicados"),
+        "vigilante": vigilante.estado() if vigilante else None,
     }
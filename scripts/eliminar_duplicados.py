@@ -1,38 +1,24 @@
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
+import sys
+
+from scripts.limpieza_duplicados import eliminar_duplicados
 
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 client = MongoClient(MONGO_URI)
 db = client["mi_base_datos"]
-coleccion = db["docs"]
-
-# Agrupar por claves únicas y contar duplicados
-pipeline = [
-    {
-        "$group": {
-            "_id": {
-                "RUT DEUDOR": "$RUT DEUDOR",
-                "Nº DCTO": "$Nº DCTO",
-                "Nº OPE": "$Nº OPE"
-            },
-            "ids": {"$push": "$_id"},
-            "count": {"$sum": 1}
-        }
-    },
-    {"$match": {"count": {"$gt": 1}}}
-]
-
-resultados = list(coleccion.aggregate(pipeline))
 
-eliminados = 0
+# Uso: python -m scripts.eliminar_duplicados [docs|pagos]
+tipo = sys.argv[1] if len(sys.argv) > 1 else "docs"
+coleccion = db[tipo]
 
-for grupo in resultados:
-    ids = grupo["ids"]
-    # Mantener solo el primero y eliminar el resto
-    for id_duplicado in ids[1:]:
-        coleccion.delete_one({"_id": id_duplicado})
-        eliminados += 1
+# Se agrupa en el servidor (allowDiskUse) y se borra en lotes con
+# bulk_write, manteniendo el documento más antiguo de cada grupo
+resultado = eliminar_duplicados(
+    coleccion, tipo,
+    progreso=lambda grupos, eliminados: print(f"… {grupos} grupos revisados, {eliminados} eliminados")
+)
 
-print(f"🗑️ Duplicados eliminados: {eliminados}")
+print(f"🗑️ Duplicados eliminados: {resultado['eliminados']} (en {resultado['grupos']} grupos)")
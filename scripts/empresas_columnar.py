@@ -0,0 +1,207 @@
+from datetime import datetime
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from scripts.rut import clave_rut
+
+# ------------------------------------------------------------
+# Almacén columnar de empresas del SII (alternativa a la colección
+# 'empresas' en Mongo).
+#
+# Un directorio con arreglos de ancho fijo, ordenados por RUT:
+#   rut.npy            int64   cuerpo del RUT (orden ascendente)
+#   dv.npy             uint8   dígito verificador (ASCII)
+#   rubro.npy          uint16  código de rubro (ver manifiesto)
+#   tramo.npy          uint16  código de tramo de ventas
+#   nombre_offsets.npy int64   n+1 offsets dentro de nombres.bin
+#   nombres.bin                razones sociales UTF-8 concatenadas
+#   grupo_orden.npy    int64   filas ordenadas por (rubro, tramo)
+#   manifiesto.json            catálogos de códigos y rangos de cada grupo
+#
+# La API los abre con mmap: buscar un RUT es una búsqueda binaria y el
+# grupo (rubro, tramo) es un rango precalculado de grupo_orden.
+# ------------------------------------------------------------
+
+MANIFIESTO = "manifiesto.json"
+
+
+def escribir_almacen(directorio, rut_num, dv, nombre, rubro, tramo):
+    """
+    Escribe el almacén completo a partir de columnas paralelas (una fila por
+    empresa, ya deduplicadas por RUT). Se escribe en `<directorio>.tmp` y se
+    reemplaza el directorio al final, así un lector nunca ve archivos a medias.
+    """
+    rut_num = np.asarray(rut_num, dtype=np.int64)
+    n = len(rut_num)
+
+    rubros, rubro_cod = np.unique(np.asarray(rubro, dtype=object).astype(str), return_inverse=True)
+    tramos, tramo_cod = np.unique(np.asarray(tramo, dtype=object).astype(str), return_inverse=True)
+    if len(rubros) > np.iinfo(np.uint16).max or len(tramos) > np.iinfo(np.uint16).max:
+        raise ValueError("Demasiados rubros/tramos distintos para el almacén columnar.")
+
+    orden = np.argsort(rut_num, kind="stable")
+    rut_num = rut_num[orden]
+    rubro_cod = rubro_cod[orden].astype(np.uint16)
+    tramo_cod = tramo_cod[orden].astype(np.uint16)
+    dv = np.frombuffer("".join(str(dv[i])[:1] or "0" for i in orden).encode("ascii"), dtype=np.uint8)
+
+    nombres = [str(nombre[i]).encode("utf-8") for i in orden]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in nombres], out=offsets[1:])
+
+    # Rango [inicio, fin) de cada (rubro, tramo) dentro de grupo_orden
+    grupo_orden = np.lexsort((tramo_cod, rubro_cod))
+    llaves = rubro_cod[grupo_orden].astype(np.int64) << 16 | tramo_cod[grupo_orden]
+    cortes = np.flatnonzero(np.diff(llaves)) + 1
+    inicios = np.concatenate(([0], cortes)) if n else np.array([], dtype=np.int64)
+    fines = np.concatenate((cortes, [n])) if n else np.array([], dtype=np.int64)
+    grupos = [
+        [int(rubro_cod[grupo_orden[i]]), int(tramo_cod[grupo_orden[i]]), int(i), int(f)]
+        for i, f in zip(inicios, fines)
+    ]
+
+    temporal = f"{directorio}.tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+
+    np.save(os.path.join(temporal, "rut.npy"), rut_num)
+    np.save(os.path.join(temporal, "dv.npy"), dv)
+    np.save(os.path.join(temporal, "rubro.npy"), rubro_cod)
+    np.save(os.path.join(temporal, "tramo.npy"), tramo_cod)
+    np.save(os.path.join(temporal, "nombre_offsets.npy"), offsets)
+    np.save(os.path.join(temporal, "grupo_orden.npy"), grupo_orden.astype(np.int64))
+    with open(os.path.join(temporal, "nombres.bin"), "wb") as f:
+        for b in nombres:
+            f.write(b)
+    with open(os.path.join(temporal, MANIFIESTO), "w", encoding="utf-8") as f:
+        json.dump({
+            "total": n,
+            "rubros": rubros.tolist(),
+            "tramos": tramos.tolist(),
+            "grupos": grupos,
+            "generado": datetime.now().isoformat(),
+        }, f, ensure_ascii=False)
+
+    anterior = f"{directorio}.anterior"
+    shutil.rmtree(anterior, ignore_errors=True)
+    if os.path.exists(directorio):
+        os.rename(directorio, anterior)
+    os.rename(temporal, directorio)
+    shutil.rmtree(anterior, ignore_errors=True)
+    return n
+
+
+class _Vista:
+    """Arreglos mapeados de una versión concreta del almacén."""
+
+    def __init__(self, directorio):
+        ruta = lambda nombre: os.path.join(directorio, nombre)
+        with open(ruta(MANIFIESTO), encoding="utf-8") as f:
+            manifiesto = json.load(f)
+
+        self.total = manifiesto["total"]
+        self.generado = manifiesto["generado"]
+        self.rubros = manifiesto["rubros"]
+        self.tramos = manifiesto["tramos"]
+        self.grupos = {
+            (self.rubros[r], self.tramos[t]): (inicio, fin)
+            for r, t, inicio, fin in manifiesto["grupos"]
+        }
+
+        self.rut = np.load(ruta("rut.npy"), mmap_mode="r")
+        self.dv = np.load(ruta("dv.npy"), mmap_mode="r")
+        self.rubro = np.load(ruta("rubro.npy"), mmap_mode="r")
+        self.tramo = np.load(ruta("tramo.npy"), mmap_mode="r")
+        self.offsets = np.load(ruta("nombre_offsets.npy"), mmap_mode="r")
+        self.grupo_orden = np.load(ruta("grupo_orden.npy"), mmap_mode="r")
+        # np.memmap no acepta archivos vacíos
+        self.nombres = np.memmap(ruta("nombres.bin"), dtype=np.uint8, mode="r") if self.offsets[-1] else b""
+
+    def rut_texto(self, i):
+        return f"{int(self.rut[i])}-{chr(self.dv[i])}"
+
+    def fila(self, i):
+        inicio, fin = int(self.offsets[i]), int(self.offsets[i + 1])
+        return {
+            "rut": self.rut_texto(i),
+            "rut_num": int(self.rut[i]),
+            "nombre": bytes(self.nombres[inicio:fin]).decode("utf-8"),
+            "rubro": self.rubros[int(self.rubro[i])],
+            "tramo_ventas": self.tramos[int(self.tramo[i])],
+        }
+
+
+class AlmacenEmpresas:
+    """
+    Lector del almacén columnar. Se reabre solo cuando cambia el manifiesto
+    (una carga nueva reemplaza el directorio completo).
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._vista = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def disponible(self):
+        # Entre los dos rename de escribir_almacen el directorio no está: si
+        # ya hay una versión abierta se sigue sirviendo esa (los mmap siguen
+        # válidos aunque se borren los archivos)
+        return self._vista is not None or os.path.exists(os.path.join(self.directorio, MANIFIESTO))
+
+    def _actual(self):
+        try:
+            mtime = os.stat(os.path.join(self.directorio, MANIFIESTO)).st_mtime_ns
+        except FileNotFoundError:
+            if self._vista is not None:
+                return self._vista
+            raise
+        if self._vista is None or self._mtime != mtime:
+            with self._lock:
+                if self._vista is None or self._mtime != mtime:
+                    self._vista = _Vista(self.directorio)
+                    self._mtime = mtime
+        return self._vista
+
+    def _posicion(self, vista, clave):
+        i = int(np.searchsorted(vista.rut, clave))
+        if i < vista.total and vista.rut[i] == clave:
+            return i
+        return None
+
+    def buscar(self, rut):
+        """Empresa con los mismos campos que un documento de 'empresas', o None."""
+        clave = clave_rut(rut)
+        if clave is None:
+            return None
+        vista = self._actual()
+        i = self._posicion(vista, clave)
+        return vista.fila(i) if i is not None else None
+
+    def buscar_varias(self, ruts):
+        vista = self._actual()
+        claves = np.array(sorted({c for c in (clave_rut(r) for r in ruts) if c is not None}), dtype=np.int64)
+        posiciones = np.searchsorted(vista.rut, claves)
+        encontradas = posiciones < vista.total
+        encontradas[encontradas] = vista.rut[posiciones[encontradas]] == claves[encontradas]
+        return [vista.fila(int(i)) for i in posiciones[encontradas]]
+
+    def ruts_grupo(self, rubro, tramo):
+        """RUTs ('12345678-9') de las empresas del mismo rubro y tramo."""
+        vista = self._actual()
+        rango = vista.grupos.get((rubro, tramo))
+        if not rango:
+            return []
+        return [vista.rut_texto(int(i)) for i in vista.grupo_orden[rango[0]:rango[1]]]
+
+    def grupos(self):
+        """Todos los (rubro, tramo) presentes."""
+        return list(self._actual().grupos)
+
+    def resumen(self):
+        vista = self._actual()
+        return {"total": vista.total, "generado": vista.generado, "grupos": len(vista.grupos)}
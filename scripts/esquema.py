@@ -0,0 +1,134 @@
+from datetime import datetime
+import math
+
+import numpy as np
+from pymongo import UpdateOne
+
+# ------------------------------------------------------------
+# Esquema de almacenamiento de docs y pagos.
+#
+# Los Excel traen decenas de columnas y la API usa menos de diez. En
+# las colecciones quedan solo los campos de abajo, con su tipo; el resto
+# va a '<colección>_archivo' (un documento por _hash) por si alguna vez
+# se necesita. Los NaN no se guardan.
+# ------------------------------------------------------------
+
+TEXTO, ENTERO, DECIMAL, FECHA = "texto", "entero", "decimal", "fecha"
+
+CAMPOS = {
+    "docs": {
+        "RUT DEUDOR": TEXTO,
+        "DEUDOR": TEXTO,
+        "Nº DCTO": ENTERO,
+        "Nº OPE": ENTERO,
+        "FEC EMISION DIG": FECHA,
+        "FECHA CES": FECHA,
+        "VCTO NOM": FECHA,
+        "MONTO DOC": DECIMAL,
+        "SALDO": DECIMAL,
+        "ESTADO": TEXTO,
+        "DIAS MORA": ENTERO,
+        "DIAS DESDE EMISION": ENTERO,
+    },
+    "pagos": {
+        "Rut Deudor": TEXTO,
+        "Nª Doc.": ENTERO,
+        "Nº Ope.": ENTERO,
+        "Fecha Pago": FECHA,
+        "Mto.Pagado": DECIMAL,
+        # Cliente (cedente) de la operación: scripts/exposicion.py
+        "Rut Cliente": TEXTO,
+    },
+}
+
+# Campos que agregan los loaders; siempre se conservan
+CAMPOS_INTERNOS = {"_id", "_hash", "origen_archivo", "origen_tipo", "rut_num"}
+
+FORMATOS_FECHA = ("%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y")
+
+
+def es_nulo(valor):
+    if valor is None:
+        return True
+    if isinstance(valor, (float, np.floating)):
+        return math.isnan(valor)
+    # pd.NaT es subclase de datetime pero no se puede guardar
+    return isinstance(valor, datetime) and valor != valor
+
+
+def convertir(valor, tipo):
+    """
+    Convierte sin perder información: si el valor no calza con el tipo
+    (p.ej. un número de documento con letras) se deja tal cual. Los
+    DECIMAL solo pasan de numpy a float/int de Python.
+    """
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+
+    if tipo == ENTERO:
+        if isinstance(valor, float) and valor.is_integer():
+            return int(valor)
+        return valor
+    if tipo == FECHA:
+        if hasattr(valor, "to_pydatetime"):
+            return valor.to_pydatetime()
+        if isinstance(valor, datetime):
+            return valor
+        if isinstance(valor, str):
+            for fmt in FORMATOS_FECHA:
+                try:
+                    return datetime.strptime(valor.strip(), fmt)
+                except ValueError:
+                    continue
+        return valor
+    return valor
+
+
+def separar(tipo_coleccion, doc):
+    """
+    Devuelve (doc_compacto, extras): los campos del esquema convertidos y
+    sin nulos, y las demás columnas (también sin nulos) para el archivo.
+    """
+    campos = CAMPOS[tipo_coleccion]
+    compacto, extras = {}, {}
+    for clave, valor in doc.items():
+        if clave in CAMPOS_INTERNOS:
+            compacto[clave] = valor
+        elif es_nulo(valor):
+            continue
+        elif clave in campos:
+            compacto[clave] = convertir(valor, campos[clave])
+        else:
+            extras[clave] = valor.item() if isinstance(valor, np.generic) else valor
+    return compacto, extras
+
+
+def documento_archivo(doc, extras):
+    """Documento de '<colección>_archivo' con las columnas no usadas de una fila."""
+    return {
+        "_hash": doc.get("_hash"),
+        "origen_archivo": doc.get("origen_archivo"),
+        "campos": extras,
+    }
+
+
+def guardar_archivo(coleccion_archivo, filas):
+    """Upsert por _hash de las columnas extra de cada (doc, extras) que tenga alguna."""
+    operaciones = [
+        UpdateOne({"_hash": doc.get("_hash")}, {"$set": documento_archivo(doc, extras)}, upsert=True)
+        for doc, extras in filas
+        if extras and doc.get("_hash")
+    ]
+    if operaciones:
+        coleccion_archivo.create_index("_hash", unique=True)
+        coleccion_archivo.bulk_write(operaciones, ordered=False)
+    return len(operaciones)
+
+
+def proyeccion(tipo_coleccion, *campos):
+    """
+    Proyección find() con los campos pedidos (o todo el esquema). No sirve
+    para pagos: "Nª Doc." y "Nº Ope." llevan punto y Mongo los tomaría
+    como rutas anidadas.
+    """
+    return {c: 1 for c in (campos or CAMPOS[tipo_coleccion])}
@@ -0,0 +1,175 @@
+import numpy as np
+
+MESES_VERANO = (11, 12, 1, 2)
+
+
+def _a_datetime64(fechas):
+    return np.array(
+        [np.datetime64(f, "s") if f is not None else np.datetime64("NaT") for f in fechas],
+        dtype="datetime64[s]"
+    )
+
+
+def _a_float(valores):
+    salida = np.empty(len(valores), dtype=np.float64)
+    for i, v in enumerate(valores):
+        try:
+            salida[i] = float(v) if v is not None else np.nan
+        except (TypeError, ValueError):
+            salida[i] = np.nan
+    return salida
+
+
+class TablaPagos:
+    """
+    Registros cruzados factura/pago guardados en columnas NumPy.
+
+    - plazo: int32 (días entre emisión y pago)
+    - fecha_pago: datetime64[s], usado para ordenar y para la máscara de verano
+    - monto: float64
+    - fechas / montos originales (datetime, int) se conservan en columnas de
+      objetos solo para devolverlos tal cual en la respuesta.
+
+    Los filtros (outliers, verano) y las selecciones (últimos N, más lenta)
+    trabajan sobre índices; los dicts se arman recién al final con
+    `a_registros`, y solo para las filas que se van a devolver.
+    """
+
+    def __init__(self, columnas, extras=None):
+        self.plazo = columnas["plazo"]
+        self.fecha_pago = columnas["fecha_pago"]
+        self.monto = columnas["monto"]
+        self._objetos = columnas["_objetos"]
+        self.extras = extras or {}
+
+    @classmethod
+    def desde_registros(cls, registros):
+        n = len(registros)
+        plazo = np.fromiter((r["plazo"] for r in registros), dtype=np.int32, count=n)
+
+        objetos = {campo: np.empty(n, dtype=object) for campo in ("fecha_pago", "fecha_emision", "fecha_ces", "monto")}
+        extras = {}
+        for i, r in enumerate(registros):
+            for campo, valor in r.items():
+                if campo in objetos:
+                    objetos[campo][i] = valor
+                elif campo != "plazo":
+                    extras.setdefault(campo, np.empty(n, dtype=object))[i] = valor
+
+        columnas = {
+            "plazo": plazo,
+            "fecha_pago": _a_datetime64(objetos["fecha_pago"]),
+            "monto": _a_float(objetos["monto"]),
+            "_objetos": objetos,
+        }
+        return cls(columnas, extras)
+
+    def __len__(self):
+        return len(self.plazo)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def seleccionar(self, indices):
+        """Devuelve una nueva tabla con las filas indicadas (máscara booleana o índices)."""
+        columnas = {
+            "plazo": self.plazo[indices],
+            "fecha_pago": self.fecha_pago[indices],
+            "monto": self.monto[indices],
+            "_objetos": {k: v[indices] for k, v in self._objetos.items()},
+        }
+        return TablaPagos(columnas, {k: v[indices] for k, v in self.extras.items()})
+
+    # -----------------------------
+    # Máscaras
+    # -----------------------------
+
+    def sin_outliers(self):
+        """(tabla sin outliers, promedio, desviación) con z-score > 2 sobre toda la tabla."""
+        promedio = self.promedio()
+        desviacion = self.desviacion()
+        return self.seleccionar(~self.mascara_outliers(promedio, desviacion)), promedio, desviacion
+
+    def mascara_outliers(self, promedio, desviacion, umbral=2.0):
+        if not desviacion:
+            return np.zeros(len(self), dtype=bool)
+        return np.abs(self.plazo - promedio) > umbral * desviacion
+
+    def mascara_verano(self, meses=MESES_VERANO):
+        mes = self.fecha_pago.astype("datetime64[M]").astype(np.int64) % 12 + 1
+        return np.isin(mes, meses)
+
+    def mascara_rango(self, desde=None, hasta=None):
+        """Pagos con fecha_pago dentro de [desde, hasta] (ambos opcionales, inclusive)."""
+        mascara = np.ones(len(self), dtype=bool)
+        if desde is not None:
+            mascara &= self.fecha_pago >= np.datetime64(desde, "s")
+        if hasta is not None:
+            mascara &= self.fecha_pago <= np.datetime64(hasta, "s")
+        return mascara
+
+    # -----------------------------
+    # Selecciones
+    # -----------------------------
+
+    def orden_reciente(self):
+        """Índices de todas las filas, del pago más nuevo al más antiguo."""
+        claves = self.fecha_pago.astype(np.int64)
+        return np.argsort(-claves, kind="stable")
+
+    def ultimos(self, n=5):
+        """Índices de los n pagos más recientes (más nuevo primero) sin ordenar toda la tabla."""
+        return self._top(-self.fecha_pago.astype(np.int64), n)
+
+    def mas_lentas(self, n=1):
+        """Índices de las n facturas con mayor plazo (la más lenta primero)."""
+        return self._top(-self.plazo.astype(np.int64), n)
+
+    @staticmethod
+    def _top(claves, n):
+        # argpartition deja los n menores al frente; se incluyen todos los
+        # empatados con el n-ésimo para desempatar por orden original, igual
+        # que un sort estable sobre la lista completa.
+        if len(claves) <= n:
+            return np.argsort(claves, kind="stable")[:n]
+        corte = claves[np.argpartition(claves, n - 1)[n - 1]]
+        candidatos = np.flatnonzero(claves <= corte)
+        return candidatos[np.argsort(claves[candidatos], kind="stable")][:n]
+
+    # -----------------------------
+    # Estadísticos
+    # -----------------------------
+
+    def promedio(self, indices=None):
+        valores = self.plazo if indices is None else self.plazo[indices]
+        return float(np.mean(valores)) if len(valores) else np.nan
+
+    def desviacion(self, indices=None):
+        valores = self.plazo if indices is None else self.plazo[indices]
+        return float(np.std(valores)) if len(valores) else np.nan
+
+    # -----------------------------
+    # Conversión a dicts (solo en el borde de la respuesta)
+    # -----------------------------
+
+    def campos_disponibles(self):
+        return ["fecha_ces", "fecha_emision", "fecha_pago", "plazo", "monto", *self.extras]
+
+    def registro(self, i, campos=None):
+        fila = {
+            "fecha_ces": self._objetos["fecha_ces"][i],
+            "fecha_emision": self._objetos["fecha_emision"][i],
+            "fecha_pago": self._objetos["fecha_pago"][i],
+            "plazo": int(self.plazo[i]),
+            "monto": self._objetos["monto"][i],
+        }
+        for campo, valores in self.extras.items():
+            fila[campo] = valores[i]
+        if campos is not None:
+            fila = {c: fila[c] for c in campos if c in fila}
+        return fila
+
+    def a_registros(self, indices=None, campos=None):
+        if indices is None:
+            indices = range(len(self))
+        return [self.registro(i, campos) for i in indices]
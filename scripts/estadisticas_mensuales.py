@@ -0,0 +1,129 @@
+from datetime import datetime
+import numpy as np
+from pymongo import UpdateOne
+
+from scripts.estadisticas import MESES_VERANO
+from scripts.rut import clave_rut, filtro_rut
+
+# Colección con un documento por (RUT, mes de pago):
+#   {rut, rut_num, mes: datetime(año, mes, 1), n, suma, suma_cuad}
+# suma y suma_cuad son sobre el plazo en días, así cualquier ventana se
+# arma sumando meses (promedio = suma/n, var = suma_cuad/n - promedio²).
+#
+# Un deudor sin pagos cruzados queda con una sola marca {mes: None, n: 0}:
+# así se sabe que ya se calculó y no se repite el cruce en cada consulta.
+# Quien lea meses tiene que saltarse los n == 0.
+COLECCION = "estadisticas_mensuales"
+
+
+def buckets_desde_tabla(tabla):
+    """Agrupa una TablaPagos por mes de pago → (meses datetime64[M], n, suma, suma_cuad)."""
+    if not tabla:
+        vacio = np.array([], dtype=np.float64)
+        return np.array([], dtype="datetime64[M]"), vacio, vacio, vacio
+
+    meses = tabla.fecha_pago.astype("datetime64[M]")
+    unicos, inverso = np.unique(meses, return_inverse=True)
+    plazo = tabla.plazo.astype(np.float64)
+    n = np.bincount(inverso, minlength=len(unicos)).astype(np.float64)
+    suma = np.bincount(inverso, weights=plazo, minlength=len(unicos))
+    suma_cuad = np.bincount(inverso, weights=plazo * plazo, minlength=len(unicos))
+    return unicos, n, suma, suma_cuad
+
+
+def guardar_buckets(coleccion, rut, tabla, usar_clave=True):
+    """
+    Reemplaza los buckets del RUT con los calculados desde su TablaPagos.
+    Con `usar_clave` se reemplazan los de todas sus grafías (rut_num); si
+    no, solo los de ese texto, que es lo que cruzó la consulta.
+    """
+    rut_num = clave_rut(rut)
+    filtro = filtro_rut(rut, "rut", usar_clave=usar_clave)
+
+    meses, n, suma, suma_cuad = buckets_desde_tabla(tabla)
+    documentos = [
+        {
+            "rut": rut,
+            "rut_num": rut_num,
+            "mes": meses[i].astype("datetime64[s]").astype(datetime),
+            "n": int(n[i]),
+            "suma": float(suma[i]),
+            "suma_cuad": float(suma_cuad[i]),
+        }
+        for i in range(len(meses))
+    ] or [{"rut": rut, "rut_num": rut_num, "mes": None, "n": 0, "suma": 0.0, "suma_cuad": 0.0}]
+
+    # Sin ventana vacía para los lectores (índice de pares, pronósticos,
+    # /tendencia-pagos): primero se escribe mes a mes y después se borra
+    # lo que sobra (meses que ya no están y, con rut_num, las filas de
+    # otras grafías guardadas antes de la migración). Si la escritura
+    # falla quedan los buckets anteriores.
+    coleccion.bulk_write([
+        UpdateOne({**filtro, "mes": d["mes"]}, {"$set": d}, upsert=True) for d in documentos
+    ], ordered=False)
+    coleccion.delete_many({**filtro, "$or": [
+        {"mes": {"$nin": [d["mes"] for d in documentos]}},
+        {"rut": {"$ne": rut}},
+    ]})
+    return sum(1 for d in documentos if d["n"])
+
+
+class SerieMensual:
+    """Buckets mensuales de un RUT en arreglos, con consultas O(meses)."""
+
+    def __init__(self, documentos):
+        documentos = sorted((d for d in documentos if d["n"]), key=lambda d: d["mes"])
+        self.meses = np.array([np.datetime64(d["mes"], "M") for d in documentos], dtype="datetime64[M]")
+        self.n = np.array([d["n"] for d in documentos], dtype=np.float64)
+        self.suma = np.array([d["suma"] for d in documentos], dtype=np.float64)
+        self.suma_cuad = np.array([d["suma_cuad"] for d in documentos], dtype=np.float64)
+
+    def __bool__(self):
+        return len(self.meses) > 0
+
+    @staticmethod
+    def _resumen(n, suma, suma_cuad):
+        total = n.sum()
+        if not total:
+            return {"cantidad": 0, "promedio": None, "desviacion": None}
+        promedio = suma.sum() / total
+        varianza = max(suma_cuad.sum() / total - promedio * promedio, 0.0)
+        return {"cantidad": int(total), "promedio": float(promedio), "desviacion": float(np.sqrt(varianza))}
+
+    def ventana(self, dias, hoy=None):
+        """
+        Pagos de los últimos `dias`. La granularidad es mensual: entra todo
+        mes cuyo inicio cae dentro de la ventana (truncada al mes).
+        """
+        hoy = np.datetime64(hoy or datetime.now(), "D")
+        desde = (hoy - np.timedelta64(dias, "D")).astype("datetime64[M]")
+        m = self.meses >= desde
+        return self._resumen(self.n[m], self.suma[m], self.suma_cuad[m])
+
+    def estacional(self, meses=MESES_VERANO):
+        mes = self.meses.astype(np.int64) % 12 + 1
+        m = np.isin(mes, meses)
+        return self._resumen(self.n[m], self.suma[m], self.suma_cuad[m])
+
+    def total(self):
+        return self._resumen(self.n, self.suma, self.suma_cuad)
+
+    def promedio_ponderado(self, vida_media_meses=6, hoy=None):
+        """
+        Promedio de plazo con peso exponencial por antigüedad: un pago de
+        hace `vida_media_meses` pesa la mitad que uno de este mes.
+        """
+        if not self:
+            return None
+        actual = np.datetime64(hoy or datetime.now(), "M")
+        edad = (actual - self.meses).astype(np.float64)
+        pesos = np.exp(-np.log(2) * np.maximum(edad, 0) / vida_media_meses)
+        denominador = (pesos * self.n).sum()
+        return float((pesos * self.suma).sum() / denominador) if denominador else None
+
+    def serie(self):
+        promedios = np.divide(self.suma, self.n, out=np.full(len(self.n), np.nan), where=self.n > 0)
+        return [
+            {"mes": str(self.meses[i]), "cantidad": int(self.n[i]), "promedio": float(promedios[i])}
+            for i in range(len(self.meses))
+        ]
@@ -0,0 +1,198 @@
+from datetime import datetime
+import uuid
+
+from scripts.rut import clave_rut
+
+# ------------------------------------------------------------
+# Exposición por deudor y por cliente (cedente): saldo de los documentos
+# MOROSO, documentos abiertos (SALDO > 0) y días vencidos promedio de
+# los morosos (desde la emisión, como dias_vencido de /consultar-rut).
+#
+# Antes solo se veía deudor por deudor en /consultar-rut. Acá sale de
+# una sola agregación sobre docs, agrupada por (deudor, operación): los
+# días se calculan en el servidor contra un único `hoy` y a Python
+# llegan solo los grupos, que se suman por deudor y por cliente.
+#
+# docs no trae el cliente. Cada operación (Nº OPE) es de un solo
+# cliente, así que se toma de los pagos de esa operación ("Rut Cliente"
+# de la cartola; en pagos compactados antes de guardarlo, desde
+# pagos_archivo). Las operaciones sin ningún pago quedan en
+# SIN_CLIENTE.
+#
+# El resultado completo queda en la colección 'exposicion' (un documento
+# por deudor y por cliente) y los totales en metadata.
+# ------------------------------------------------------------
+
+COLECCION = "exposicion"
+SIN_CLIENTE = "sin cliente"
+MILISEGUNDOS_DIA = 86400000
+TOP_CONCENTRACION = 10
+
+ORDENES = ("saldo_moroso", "documentos_abiertos", "documentos_morosos", "dias_vencido_promedio")
+
+
+def clave_operacion(valor):
+    """Nº OPE como entero (1000, "1000" y "1000.0" son la misma operación)."""
+    try:
+        return int(float(str(valor).strip()))
+    except (TypeError, ValueError):
+        return None
+
+
+def pipeline_exposicion(hoy):
+    moroso = {"$eq": ["$ESTADO", "MOROSO"]}
+    return [
+        {"$match": {"$or": [{"ESTADO": "MOROSO"}, {"SALDO": {"$gt": 0}}]}},
+        {
+            "$group": {
+                "_id": {"rut": "$RUT DEUDOR", "ope": "$Nº OPE"},
+                "nombre": {"$first": "$DEUDOR"},
+                "saldo_moroso": {"$sum": {"$cond": [moroso, {"$ifNull": ["$SALDO", 0]}, 0]}},
+                "documentos_morosos": {"$sum": {"$cond": [moroso, 1, 0]}},
+                "documentos_abiertos": {"$sum": {"$cond": [{"$gt": ["$SALDO", 0]}, 1, 0]}},
+                # $sum ignora los null: solo morosos con fecha de emisión
+                "suma_dias": {"$sum": {"$cond": [
+                    {"$and": [moroso, {"$eq": [{"$type": "$FEC EMISION DIG"}, "date"]}]},
+                    {"$floor": {"$divide": [{"$subtract": [hoy, "$FEC EMISION DIG"]}, MILISEGUNDOS_DIA]}},
+                    None,
+                ]}},
+                "con_dias": {"$sum": {"$cond": [
+                    {"$and": [moroso, {"$eq": [{"$type": "$FEC EMISION DIG"}, "date"]}]}, 1, 0,
+                ]}},
+            }
+        },
+    ]
+
+
+def clientes_por_operacion(base):
+    """{operación: Rut Cliente} desde pagos (y pagos_archivo para los compactados sin el campo)."""
+    ope = {"$getField": "Nº Ope."}
+    clientes = {}
+    for g in base["pagos"].aggregate([
+        {"$match": {"Rut Cliente": {"$exists": True}}},
+        {"$group": {"_id": ope, "cliente": {"$first": "$Rut Cliente"}}},
+    ], allowDiskUse=True):
+        clientes[clave_operacion(g["_id"])] = g["cliente"]
+
+    for g in base["pagos"].aggregate([
+        {"$match": {"Rut Cliente": {"$exists": False}}},
+        {"$group": {"_id": ope, "hash": {"$first": "$_hash"}}},
+        {"$lookup": {"from": "pagos_archivo", "localField": "hash", "foreignField": "_hash", "as": "archivo"}},
+        {"$project": {"cliente": {"$arrayElemAt": ["$archivo.campos.Rut Cliente", 0]}}},
+    ], allowDiskUse=True):
+        clave = clave_operacion(g["_id"])
+        if g.get("cliente") and clave not in clientes:
+            clientes[clave] = g["cliente"]
+    clientes.pop(None, None)
+    return clientes
+
+
+def _acumular(totales, clave, grupo, **datos):
+    fila = totales.get(clave)
+    if fila is None:
+        fila = totales[clave] = {
+            **datos, "saldo_moroso": 0, "documentos_morosos": 0, "documentos_abiertos": 0,
+            "suma_dias": 0, "con_dias": 0, "operaciones": 0,
+        }
+    for campo in ("saldo_moroso", "documentos_morosos", "documentos_abiertos", "suma_dias", "con_dias"):
+        fila[campo] += grupo[campo]
+    fila["operaciones"] += 1
+    return fila
+
+
+def _ranking(totales, saldo_total):
+    filas = []
+    for fila in totales.values():
+        suma_dias, con_dias = fila.pop("suma_dias"), fila.pop("con_dias")
+        fila["dias_vencido_promedio"] = round(suma_dias / con_dias, 1) if con_dias else None
+        fila["participacion"] = round(fila["saldo_moroso"] / saldo_total, 6) if saldo_total else 0.0
+        if isinstance(fila.get("deudores"), set):
+            fila["deudores"] = len(fila["deudores"])
+        filas.append(fila)
+    filas.sort(key=lambda f: f["saldo_moroso"], reverse=True)
+    return filas
+
+
+def concentracion(ranking, saldo_total):
+    """Participación de los TOP_CONCENTRACION mayores e índice Herfindahl (0-1)."""
+    if not saldo_total:
+        return {"top": 0.0, "hhi": 0.0}
+    return {
+        "top": round(sum(f["saldo_moroso"] for f in ranking[:TOP_CONCENTRACION]) / saldo_total, 4),
+        "hhi": round(sum((f["saldo_moroso"] / saldo_total) ** 2 for f in ranking), 4),
+    }
+
+
+def calcular(base, hoy=None):
+    """
+    Exposición completa: {generado, totales, deudores: [...], clientes: [...]},
+    ambos rankings por saldo moroso descendente.
+    """
+    hoy = hoy or datetime.now()
+    grupos = list(base["docs"].aggregate(pipeline_exposicion(hoy), allowDiskUse=True))
+    clientes = clientes_por_operacion(base) if grupos else {}
+
+    por_deudor, por_cliente = {}, {}
+    for g in grupos:
+        rut = g["_id"].get("rut")
+        clave = clave_rut(rut) or rut
+        _acumular(por_deudor, clave, g, rut=rut, rut_num=clave_rut(rut), nombre=g.get("nombre"))
+        cliente = clientes.get(clave_operacion(g["_id"].get("ope")), SIN_CLIENTE)
+        fila = _acumular(por_cliente, clave_rut(cliente) or cliente, g, rut=cliente, rut_num=clave_rut(cliente), deudores=set())
+        fila["deudores"].add(clave)
+
+    saldo_total = sum(g["saldo_moroso"] for g in grupos)
+    deudores = _ranking(por_deudor, saldo_total)
+    clientes_ranking = _ranking(por_cliente, saldo_total)
+    return {
+        "generado": hoy,
+        "totales": {
+            "saldo_moroso": saldo_total,
+            "documentos_morosos": sum(g["documentos_morosos"] for g in grupos),
+            "documentos_abiertos": sum(g["documentos_abiertos"] for g in grupos),
+            "deudores": len(deudores),
+            "clientes": len(clientes_ranking),
+            "concentracion_deudores": concentracion(deudores, saldo_total),
+            "concentracion_clientes": concentracion(clientes_ranking, saldo_total),
+        },
+        "deudores": deudores,
+        "clientes": clientes_ranking,
+    }
+
+
+def guardar(db, resumen):
+    """
+    Reemplaza la colección completa (staging + rename) y deja los totales
+    en metadata. El staging tiene nombre propio por llamada: una carga y
+    /admin/exposicion pueden guardar a la vez sin borrarse el staging.
+    """
+    staging = db[f"{COLECCION}_staging_{uuid.uuid4().hex[:12]}"]
+    documentos = (
+        [{"por": "deudor", **f} for f in resumen["deudores"]]
+        + [{"por": "cliente", **f} for f in resumen["clientes"]]
+    )
+    try:
+        if documentos:
+            staging.insert_many(documentos)
+        staging.create_index([("por", 1), ("saldo_moroso", -1)])
+        staging.rename(COLECCION, dropTarget=True)
+    except Exception:
+        staging.drop()
+        raise
+    db["metadata"].update_one(
+        {"tipo": "exposicion"},
+        {"$set": {"tipo": "exposicion", "generado": resumen["generado"], "totales": resumen["totales"]}},
+        upsert=True
+    )
+    return len(documentos)
+
+
+def leer(db, por, limite, orden="saldo_moroso"):
+    """Ranking guardado ({generado, totales, ranking}), o None si nunca se calculó."""
+    registro = db["metadata"].find_one({"tipo": "exposicion"})
+    if not registro:
+        return None
+    ranking = list(
+        db[COLECCION].find({"por": por}, {"_id": 0, "por": 0}).sort(orden, -1).limit(limite)
+    )
+    return {"generado": registro["generado"], "totales": registro["totales"], "ranking": ranking}
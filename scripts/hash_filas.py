@@ -0,0 +1,136 @@
+from datetime import date, datetime
+import hashlib
+import math
+
+import numpy as np
+import pandas as pd
+
+from scripts.esquema import CAMPOS, DECIMAL, ENTERO, FECHA, TEXTO, convertir, es_nulo
+
+# ------------------------------------------------------------
+# _hash de docs y pagos sobre una codificación canónica de la fila.
+#
+# Antes era sha256(str(sorted(fila))): 5 y 5.0, un NaN o un espacio de
+# más daban otro hash, y en pagos entraban todas las columnas, así que
+# reexportar el mismo informe duplicaba pagos. Ahora:
+#   - solo entran los campos de la clave natural (los mismos de
+#     scripts/limpieza_duplicados.py), que son campos del esquema y
+#     quedan guardados: el hash se puede recalcular desde Mongo;
+#   - cada valor se normaliza según el tipo del esquema (fechas en texto
+#     a fecha, números en texto a número) y se codifica con
+#     prefijo de tipo: n (nulo), i (entero, también 5.0), f (decimal),
+#     t (fecha al milisegundo, lo que guarda Mongo), s (texto sin
+#     espacios en los bordes);
+#   - el digest es blake2b de 128 bits (hashlib, en C).
+#
+# `hashes_dataframe` hace lo mismo por columnas sobre un chunk entero;
+# `hash_fila` es la versión por fila (migración, filas sueltas). Las dos
+# dan exactamente el mismo resultado.
+# ------------------------------------------------------------
+
+CAMPOS_HASH = {
+    "docs": ["RUT DEUDOR", "Nº DCTO", "Nº OPE"],
+    "pagos": ["Rut Deudor", "Nª Doc.", "Nº Ope.", "Fecha Pago", "Mto.Pagado"],
+}
+
+SEPARADOR = "\x1f"
+NULO = "n:"
+
+# Más allá de 2**53 un float ya no representa enteros exactos
+MAXIMO_ENTERO = 2 ** 53
+
+
+def _numero(valor):
+    if isinstance(valor, float):
+        if math.isnan(valor):
+            return NULO
+        if valor.is_integer() and abs(valor) < MAXIMO_ENTERO:
+            return f"i:{int(valor)}"
+        return f"f:{valor!r}"
+    return f"i:{valor}"
+
+
+def _fecha(valor):
+    return f"t:{valor:%Y-%m-%dT%H:%M:%S}.{valor.microsecond // 1000:03d}"
+
+
+def valor_canonico(valor, tipo):
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if valor is pd.NA or es_nulo(valor):
+        return NULO
+
+    if tipo == FECHA:
+        valor = convertir(valor, tipo)
+    elif tipo in (ENTERO, DECIMAL) and isinstance(valor, str):
+        try:
+            valor = float(valor.strip().replace(",", "."))
+        except ValueError:
+            pass
+
+    if isinstance(valor, bool):
+        return f"s:{valor}"
+    if isinstance(valor, (int, float)):
+        return _numero(valor)
+    if isinstance(valor, datetime):
+        return _fecha(valor)
+    if isinstance(valor, date):
+        return _fecha(datetime(valor.year, valor.month, valor.day))
+    return f"s:{str(valor).strip()}"
+
+
+def _digest(texto):
+    return hashlib.blake2b(texto.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def hash_fila(fila, tipo_coleccion):
+    """_hash de un dict (fila del Excel o documento ya guardado)."""
+    tipos = CAMPOS[tipo_coleccion]
+    return _digest(SEPARADOR.join(
+        f"{campo}={valor_canonico(fila.get(campo), tipos[campo])}"
+        for campo in CAMPOS_HASH[tipo_coleccion]
+    ))
+
+
+def _columna_canonica(serie, tipo):
+    """Codificación canónica de una columna completa (mismo resultado que valor_canonico)."""
+    if pd.api.types.is_datetime64_any_dtype(serie) and serie.dt.tz is None:
+        milisegundos = serie.to_numpy(dtype="datetime64[ns]").astype("datetime64[ms]")
+        texto = pd.Series(np.char.add("t:", np.datetime_as_string(milisegundos, unit="ms")), index=serie.index)
+        return texto.where(serie.notna(), NULO)
+
+    if pd.api.types.is_integer_dtype(serie) and not serie.hasnans:
+        return "i:" + serie.astype(str)
+
+    if pd.api.types.is_float_dtype(serie):
+        valores = serie.to_numpy(dtype=np.float64)
+        enteros = np.isfinite(valores) & (valores == np.floor(valores)) & (np.abs(valores) < MAXIMO_ENTERO)
+        salida = pd.Series(NULO, index=serie.index, dtype=object)
+        salida[enteros] = "i:" + pd.Series(valores[enteros].astype(np.int64)).astype(str).to_numpy()
+        resto = ~enteros & ~np.isnan(valores)
+        if resto.any():
+            salida[resto] = [f"f:{v!r}" for v in valores[resto].tolist()]
+        return salida
+
+    if tipo == TEXTO and pd.api.types.infer_dtype(serie, skipna=True) == "string":
+        return ("s:" + serie.str.strip()).where(serie.notna(), NULO)
+
+    # object (mezclas, números o fechas como texto): valor por valor
+    return serie.map(lambda v: valor_canonico(v, tipo))
+
+
+def hashes_dataframe(df, tipo_coleccion):
+    """Lista con el _hash de cada fila de `df`, en orden."""
+    if df.empty:
+        return []
+    tipos = CAMPOS[tipo_coleccion]
+    partes = []
+    for campo in CAMPOS_HASH[tipo_coleccion]:
+        columna = (
+            _columna_canonica(df[campo], tipos[campo])
+            if campo in df.columns else pd.Series(NULO, index=df.index)
+        )
+        partes.append(f"{campo}=" + columna.astype(str))
+    texto = partes[0].str.cat(partes[1:], sep=SEPARADOR)
+    return [_digest(t) for t in texto.tolist()]
+
@@ -0,0 +1,161 @@
+from datetime import datetime
+import re
+import uuid
+
+import numpy as np
+
+# ------------------------------------------------------------
+# Índice de empresas similares (pares) para deudores sin historial.
+#
+# Antes se usaban solo las empresas con exactamente el mismo rubro y
+# tramo: si ese grupo no tenía pagos no había respuesta, y si era
+# grande el $in era enorme. Acá cada (rubro, tramo) se codifica como
+# números —sección del rubro (la letra antes de " - "), rubro y tramo
+# ordinal— y se precalculan los K deudores con historial más cercanos,
+# guardando solo sus estadísticas agregadas.
+#
+# Como los rasgos son solo (rubro, tramo), todas las empresas de un
+# mismo grupo tienen los mismos pares: se guarda un documento por grupo
+# en vez de uno por empresa.
+#
+# Las estadísticas salen de los buckets mensuales, es decir de los
+# cruces válidos del deudor (plazo entre 0 y 300 días). El cálculo en
+# vivo de FuenteMongo.similares, que queda para cuando no hay índice,
+# acepta hasta 365: con el índice los plazos de 301 a 365 ya no entran.
+# ------------------------------------------------------------
+
+COLECCION = "pares_similares"
+
+K_VECINOS = 25
+MIN_PAGOS = 30
+
+# Distancia = |Δtramo| + PESO_RUBRO si cambia el rubro + PESO_SECCION si
+# además cambia la sección. Con 13 tramos, cambiar de sección pesa más
+# que casi cualquier diferencia de tamaño.
+PESO_RUBRO = 3
+PESO_SECCION = 10
+
+VECINOS_GUARDADOS = 50
+
+
+def seccion_rubro(rubro):
+    """'G - COMERCIO AL POR MAYOR...' → 'G'. Sin código, el rubro completo."""
+    texto = str(rubro or "").strip()
+    codigo, separador, _ = texto.partition(" - ")
+    return codigo.upper() if separador else texto.upper()
+
+
+def codificar_tramos(tramos):
+    """Tramo → número: el primer entero del texto ('13' o 'Tramo 5'), o el orden alfabético si no hay."""
+    sin_numero = sorted({t for t in tramos if not re.search(r"\d+", str(t))}, key=str)
+    codigos = {}
+    for t in tramos:
+        m = re.search(r"\d+", str(t))
+        codigos[t] = int(m.group()) if m else 1000 + sin_numero.index(t)
+    return codigos
+
+
+def _codificar(valores):
+    unicos = {v: i for i, v in enumerate(sorted(set(valores), key=str))}
+    return np.array([unicos[v] for v in valores], dtype=np.int64), unicos
+
+
+def construir_indice(grupos, deudores, k=K_VECINOS, min_pagos=MIN_PAGOS):
+    """
+    - grupos: iterable de (rubro, tramo) a indexar (todos los de 'empresas').
+    - deudores: lista de dicts {rut_num, rubro, tramo, n, suma, suma_cuad},
+      con n/suma/suma_cuad de los plazos válidos de cada deudor.
+
+    Para cada grupo se toman todos los deudores del mismo rubro y tramo
+    (distancia 0) y, si no alcanzan `k` deudores o `min_pagos` pagos, se
+    completa con los más cercanos (incluyendo empates en el corte).
+    """
+    grupos = list(grupos)
+    deudores = [d for d in deudores if d["n"] > 0]
+    if not deudores:
+        return []
+
+    tramos = codificar_tramos({t for _, t in grupos} | {d["tramo"] for d in deudores})
+    rubros = [d["rubro"] for d in deudores] + [r for r, _ in grupos]
+    codigos_rubro, mapa_rubro = _codificar(rubros)
+    codigos_seccion, mapa_seccion = _codificar([seccion_rubro(r) for r in rubros])
+
+    n_deudores = len(deudores)
+    d_rubro = codigos_rubro[:n_deudores]
+    d_seccion = codigos_seccion[:n_deudores]
+    d_tramo = np.array([tramos[d["tramo"]] for d in deudores], dtype=np.int64)
+    n = np.array([d["n"] for d in deudores], dtype=np.float64)
+    suma = np.array([d["suma"] for d in deudores], dtype=np.float64)
+    suma_cuad = np.array([d["suma_cuad"] for d in deudores], dtype=np.float64)
+    ruts = np.array([d["rut_num"] for d in deudores])
+
+    documentos = []
+    ahora = datetime.now()
+    for rubro, tramo in grupos:
+        distancia = (
+            np.abs(d_tramo - tramos[tramo])
+            + PESO_RUBRO * (d_rubro != mapa_rubro[rubro])
+            + PESO_SECCION * (d_seccion != mapa_seccion[seccion_rubro(rubro)])
+        )
+        orden = np.argsort(distancia, kind="stable")
+        pagos = np.cumsum(n[orden])
+
+        exactos = int((distancia == 0).sum())
+        # Primer corte que cumple ambos mínimos (o todos si no se alcanza)
+        suficientes = np.flatnonzero((np.arange(1, n_deudores + 1) >= k) & (pagos >= min_pagos))
+        corte = max(exactos, int(suficientes[0]) + 1 if len(suficientes) else n_deudores)
+        # Empates en la distancia del último elegido también entran
+        distancia_max = int(distancia[orden[corte - 1]])
+        elegidos = orden[distancia[orden] <= distancia_max]
+
+        total = n[elegidos].sum()
+        promedio = suma[elegidos].sum() / total
+        varianza = max(suma_cuad[elegidos].sum() / total - promedio * promedio, 0.0)
+        documentos.append({
+            "rubro": rubro,
+            "tramo": tramo,
+            "cantidad": int(total),
+            "deudores": int(len(elegidos)),
+            "exactos": exactos,
+            "distancia_max": distancia_max,
+            "promedio": float(promedio),
+            "desviacion": float(np.sqrt(varianza)),
+            "vecinos": [int(r) for r in ruts[elegidos[:VECINOS_GUARDADOS]]],
+            "generado": ahora,
+        })
+    return documentos
+
+
+def guardar_indice(db, documentos):
+    """
+    Reemplaza la colección completa (staging + rename, como 'empresas').
+    Staging propio por llamada: la reconstrucción tras una carga y
+    /admin/indice-pares pueden coincidir.
+    """
+    staging = db[f"{COLECCION}_staging_{uuid.uuid4().hex[:12]}"]
+    try:
+        if documentos:
+            staging.insert_many(documentos)
+        staging.create_index([("rubro", 1), ("tramo", 1)], unique=True)
+        staging.rename(COLECCION, dropTarget=True)
+    except Exception:
+        staging.drop()
+        raise
+    return len(documentos)
+
+
+def indice_disponible(db):
+    return COLECCION in db.list_collection_names()
+
+
+def estadisticas_por_deudor(coleccion_buckets):
+    """Suma los buckets mensuales (scripts/estadisticas_mensuales.py) por deudor."""
+    return list(coleccion_buckets.aggregate([
+        {"$group": {
+            "_id": "$rut_num",
+            "rut": {"$first": "$rut"},
+            "n": {"$sum": "$n"},
+            "suma": {"$sum": "$suma"},
+            "suma_cuad": {"$sum": "$suma_cuad"},
+        }},
+    ], allowDiskUse=True))
@@ -0,0 +1,66 @@
+from pymongo.read_preferences import SecondaryPreferred
+
+# ------------------------------------------------------------
+# A qué nodo del replica set va cada lectura.
+#
+# /consultar-rut y las escrituras usan la primaria. Los recorridos
+# grandes (exportaciones, búsqueda de duplicados, estadísticas de pares,
+# snapshot, pronósticos, exposición) compiten con esas consultas por la
+# misma primaria. Con LECTURAS_SECUNDARIAS=1 van a una secundaria
+# (secondaryPreferred: si no hay ninguna disponible, a la primaria),
+# siempre que no esté más de `max_staleness` segundos atrasada.
+#
+# Lo que se deriva justo después de escribir (buckets, índice de pares
+# y snapshot al terminar una carga) tiene que ver lo recién escrito:
+# va por la ruta "post-carga", en la primaria. Lo mismo /admin/consultas,
+# que vacía el buffer del registro justo antes de leer.
+#
+# La tabla RUTAS es el único lugar donde se decide: el código pide la
+# base de su ruta con `lecturas.base("exportar")`.
+# ------------------------------------------------------------
+
+PRIMARIA = "primaria"
+SECUNDARIA = "secundaria"
+
+RUTAS = {
+    # Interactivas y de consistencia fuerte
+    "consultar-rut": PRIMARIA,
+    "historico-pagos": PRIMARIA,
+    "tendencia-pagos": PRIMARIA,
+    "post-carga": PRIMARIA,
+    "consultas": PRIMARIA,
+    # Analíticas y de lote
+    "exportar": SECUNDARIA,
+    "duplicados": SECUNDARIA,
+    "empresas-similares": SECUNDARIA,
+    "indice-pares": SECUNDARIA,
+    "snapshot": SECUNDARIA,
+    "pronostico-verano": SECUNDARIA,
+    "exposicion": SECUNDARIA,
+}
+
+# Mínimo que acepta el servidor para maxStalenessSeconds
+MIN_STALENESS = 90
+
+
+class Lecturas:
+
+    def __init__(self, db, secundarias=False, max_staleness=120):
+        self.secundarias = secundarias
+        self.max_staleness = max(int(max_staleness), MIN_STALENESS)
+        self._bases = {PRIMARIA: db, SECUNDARIA: db}
+        if secundarias:
+            self._bases[SECUNDARIA] = db.with_options(
+                read_preference=SecondaryPreferred(max_staleness=self.max_staleness)
+            )
+
+    def base(self, ruta):
+        """Database con la preferencia de lectura de `ruta` (KeyError si no está en RUTAS)."""
+        return self._bases[RUTAS[ruta]]
+
+    def estado(self):
+        return {
+            "secundarias": self.secundarias,
+            "max_staleness_segundos": self.max_staleness if self.secundarias else None,
+            "rutas": {ruta: nodo if self.secundarias else PRIMARIA for ruta, nodo in RUTAS.items()},
+        }
@@ -0,0 +1,87 @@
+from pymongo import DeleteMany
+
+# Clave natural de cada colección. En pagos los nombres de columna llevan
+# punto ("Nª Doc.", "Nº Ope.", "Mto.Pagado"), así que se leen con
+# $getField en vez de "$campo" (que Mongo interpretaría como ruta anidada).
+CLAVES_NATURALES = {
+    "docs": {
+        "rut": "$RUT DEUDOR",
+        "doc": "$Nº DCTO",
+        "ope": "$Nº OPE",
+    },
+    "pagos": {
+        "rut": "$Rut Deudor",
+        "doc": {"$getField": "Nª Doc."},
+        "ope": {"$getField": "Nº Ope."},
+        "fecha": "$Fecha Pago",
+        "monto": {"$getField": "Mto.Pagado"},
+    },
+}
+
+# Índices que sirven al $sort inicial. Las cargas ya no los usan: buscan
+# las filas existentes por _hash (cargar_datos.escribir_lote).
+INDICES_CLAVE = {
+    "docs": [("RUT DEUDOR", 1), ("Nº DCTO", 1), ("Nº OPE", 1)],
+    "pagos": [("Rut Deudor", 1)],
+}
+
+TAMANO_LOTE = 1000
+
+
+def pipeline_duplicados(tipo):
+    """
+    Agrupa por la clave natural y devuelve solo los grupos repetidos, con
+    los _id a borrar (todos menos el más antiguo). El $sort previo va por
+    el índice de la clave, y allowDiskUse permite que el $group se vaya a
+    disco en vez de chocar con el límite de 100MB.
+    """
+    orden = {campo: 1 for campo, _ in INDICES_CLAVE[tipo]}
+    orden["_id"] = 1
+    return [
+        {"$sort": orden},
+        {
+            "$group": {
+                "_id": CLAVES_NATURALES[tipo],
+                "conservar": {"$first": "$_id"},
+                "ids": {"$push": "$_id"},
+                "conteo": {"$sum": 1},
+            }
+        },
+        {"$match": {"conteo": {"$gt": 1}}},
+    ]
+
+
+def buscar_duplicados(coleccion, tipo):
+    coleccion.create_index(INDICES_CLAVE[tipo])
+    return coleccion.aggregate(pipeline_duplicados(tipo), allowDiskUse=True, batchSize=TAMANO_LOTE)
+
+
+def eliminar_duplicados(coleccion, tipo, progreso=None, tamano_lote=TAMANO_LOTE):
+    """
+    Elimina duplicados por clave natural en lotes de bulk_write.
+
+    `progreso(grupos, eliminados)` se llama después de cada lote. Devuelve
+    {"grupos": ..., "eliminados": ...}.
+    """
+    grupos = 0
+    eliminados = 0
+    pendientes = []
+
+    def enviar():
+        nonlocal eliminados
+        if not pendientes:
+            return
+        resultado = coleccion.bulk_write([DeleteMany({"_id": {"$in": pendientes}})], ordered=False)
+        eliminados += resultado.deleted_count
+        pendientes.clear()
+        if progreso:
+            progreso(grupos, eliminados)
+
+    for grupo in buscar_duplicados(coleccion, tipo):
+        grupos += 1
+        pendientes.extend(i for i in grupo["ids"] if i != grupo["conservar"])
+        if len(pendientes) >= tamano_lote:
+            enviar()
+
+    enviar()
+    return {"grupos": grupos, "eliminados": eliminados}
@@ -0,0 +1,150 @@
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+import os
+
+from scripts.hash_filas import hash_fila
+
+# ------------------------------------------------------------
+# Reescribe los _hash sha256 de docs y pagos con el hash canónico de
+# scripts/hash_filas.py (y los de '<colección>_archivo', que se enlazan
+# por _hash).
+#
+# Dos documentos que ahora dan el mismo hash son la misma fila natural
+# cargada dos veces (típicamente un informe reexportado): se conserva el
+# de _id más antiguo y se borra el otro, como /admin/eliminar-duplicados.
+# En docs el hash es solo la clave (RUT, documento, operación) y el resto
+# de la fila cambia entre informes (ESTADO, SALDO): el conservado se queda
+# con el contenido de la carga más reciente antes de borrar el repetido.
+#
+# Avanza por _id y solo toma hashes de 64 caracteres, así que se puede
+# cortar y volver a correr.
+# ------------------------------------------------------------
+
+COLECCIONES = ("docs", "pagos")
+FILTRO_ANTERIOR = {"_hash": {"$regex": "^[0-9a-f]{64}$"}}
+TAMANO_LOTE = 1000
+CODIGO_DUPLICADO = 11000
+
+# Colecciones donde el repetido (más nuevo) pisa el contenido del conservado
+CONSERVAR_ULTIMA_CARGA = ("docs",)
+
+
+def _fallidos_por_duplicado(error):
+    """Índices de operación que chocaron con el índice único; otro error se relanza."""
+    errores = error.details.get("writeErrors", [])
+    if any(e.get("code") != CODIGO_DUPLICADO for e in errores):
+        raise error
+    return {e["index"] for e in errores}
+
+
+def _renombrar_archivo(archivo, cambios):
+    """Lleva las columnas archivadas al hash nuevo; si el nuevo ya tiene, sobra la vieja."""
+    if not cambios:
+        return
+    try:
+        archivo.bulk_write([
+            UpdateOne({"_hash": anterior}, {"$set": {"_hash": nuevo}}) for anterior, nuevo in cambios
+        ], ordered=False)
+    except BulkWriteError as e:
+        repetidos = [cambios[i][0] for i in _fallidos_por_duplicado(e)]
+        archivo.delete_many({"_hash": {"$in": repetidos}})
+
+
+def _copiar_ultima_carga(coleccion, repetidos):
+    """
+    Pasa el contenido de cada repetido al documento que se conserva con
+    su mismo hash, en orden de _id (el último cargado gana). Solo si el
+    conservado es más antiguo: uno cargado ya con el hash nuevo es más
+    reciente que el repetido.
+    """
+    operaciones = [
+        UpdateOne(
+            {"_hash": nuevo, "_id": {"$lt": doc["_id"]}},
+            {"$set": {campo: valor for campo, valor in doc.items() if campo not in ("_id", "_hash")}}
+        )
+        for doc, nuevo in sorted(repetidos, key=lambda r: r[0]["_id"])
+    ]
+    if operaciones:
+        coleccion.bulk_write(operaciones, ordered=True)
+
+
+def migrar_coleccion(db, nombre, progreso=None, tamano_lote=TAMANO_LOTE):
+    coleccion = db[nombre]
+    archivo = db[f"{nombre}_archivo"]
+    actualizados, eliminados, ultimo = 0, 0, None
+
+    while True:
+        filtro = dict(FILTRO_ANTERIOR)
+        if ultimo is not None:
+            filtro["_id"] = {"$gt": ultimo}
+        # Sin proyección: los campos de pagos llevan punto en el nombre
+        lote = list(coleccion.find(filtro).sort("_id", 1).limit(tamano_lote))
+        if not lote:
+            break
+        ultimo = lote[-1]["_id"]
+
+        vistos, operaciones, cambios, repetidos = set(), [], [], []
+        for doc in lote:
+            nuevo = hash_fila(doc, nombre)
+            if nuevo in vistos:
+                repetidos.append((doc, nuevo))
+                continue
+            vistos.add(nuevo)
+            operaciones.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"_hash": nuevo}}))
+            cambios.append((doc, nuevo))
+
+        try:
+            coleccion.bulk_write(operaciones, ordered=False)
+            fallidos = set()
+        except BulkWriteError as e:
+            # El hash nuevo ya lo tiene un documento migrado antes
+            fallidos = _fallidos_por_duplicado(e)
+            repetidos += [cambios[i] for i in fallidos]
+
+        if nombre in CONSERVAR_ULTIMA_CARGA:
+            _copiar_ultima_carga(coleccion, repetidos)
+        if repetidos:
+            coleccion.delete_many({"_id": {"$in": [doc["_id"] for doc, _ in repetidos]}})
+        # Primero los conservados; el archivo de un repetido solo pasa si el
+        # conservado no tenía
+        _renombrar_archivo(archivo, [(doc["_hash"], nuevo) for i, (doc, nuevo) in enumerate(cambios) if i not in fallidos])
+        _renombrar_archivo(archivo, [(doc["_hash"], nuevo) for doc, nuevo in repetidos])
+
+        actualizados += len(operaciones) - len(fallidos)
+        eliminados += len(repetidos)
+        if progreso:
+            progreso(nombre, actualizados, eliminados)
+
+    return {"actualizados": actualizados, "duplicados_eliminados": eliminados}
+
+
+def migracion_lista(db):
+    """
+    True si ya no quedan _hash sha256: la migración terminó o no había
+    nada que migrar (base nueva). Mientras no, las cargas no reconocen
+    como repetidas las filas guardadas con el hash anterior.
+    """
+    if db["metadata"].find_one({"tipo": "migracion_hash", "estado": "listo"}) is not None:
+        return True
+    return not any(db[nombre].find_one(FILTRO_ANTERIOR, {"_id": 1}) for nombre in COLECCIONES)
+
+
+def migrar(db, progreso=None):
+    resumen = {nombre: migrar_coleccion(db, nombre, progreso) for nombre in COLECCIONES}
+    db["metadata"].update_one(
+        {"tipo": "migracion_hash"},
+        {"$set": {"tipo": "migracion_hash", "estado": "listo", "resumen": resumen}},
+        upsert=True
+    )
+    return resumen
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    client = MongoClient(os.getenv("MONGO_URI"))
+    resumen = migrar(
+        client["mi_base_datos"],
+        progreso=lambda nombre, n, e: print(f"… {nombre}: {n} hashes reescritos, {e} duplicados eliminados")
+    )
+    print(f"✅ _hash canónico: {resumen}")
@@ -0,0 +1,66 @@
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+import os
+
+from scripts.rut import clave_rut
+
+# Campo de texto con el RUT en cada colección → se agrega "rut_num" (int)
+CAMPOS_RUT = {
+    "docs": "RUT DEUDOR",
+    "pagos": "Rut Deudor",
+    "empresas": "rut",
+}
+
+TAMANO_LOTE = 1000
+
+
+def migrar_coleccion(coleccion, campo, progreso=None):
+    """
+    Agrega `rut_num` a los documentos que aún no lo tienen y crea el índice.
+    Solo se leen _id y el campo del RUT; las escrituras van en bulk_write.
+    """
+    actualizados = 0
+    operaciones = []
+
+    cursor = coleccion.find({"rut_num": {"$exists": False}}, {campo: 1}, batch_size=TAMANO_LOTE)
+    for doc in cursor:
+        operaciones.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"rut_num": clave_rut(doc.get(campo))}}))
+        if len(operaciones) >= TAMANO_LOTE:
+            actualizados += coleccion.bulk_write(operaciones, ordered=False).modified_count
+            operaciones = []
+            if progreso:
+                progreso(coleccion.name, actualizados)
+
+    if operaciones:
+        actualizados += coleccion.bulk_write(operaciones, ordered=False).modified_count
+
+    coleccion.create_index("rut_num")
+    return actualizados
+
+
+def migrar(db, progreso=None):
+    resumen = {
+        nombre: migrar_coleccion(db[nombre], campo, progreso)
+        for nombre, campo in CAMPOS_RUT.items()
+    }
+    db["metadata"].update_one(
+        {"tipo": "migracion_rut_num"},
+        {"$set": {"tipo": "migracion_rut_num", "estado": "listo", "resumen": resumen}},
+        upsert=True
+    )
+    return resumen
+
+
+def migracion_lista(db):
+    """True si todas las colecciones ya tienen `rut_num` y se puede consultar por él."""
+    return db["metadata"].find_one({"tipo": "migracion_rut_num", "estado": "listo"}) is not None
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    client = MongoClient(os.getenv("MONGO_URI"))
+    resumen = migrar(
+        client["mi_base_datos"],
+        progreso=lambda nombre, n: print(f"… {nombre}: {n} documentos actualizados")
+    )
+    print(f"✅ rut_num agregado: {resumen}")
@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+from datetime import datetime
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import threading
+import time
+
+from bson import Binary
+
+# ------------------------------------------------------------
+# Perfilado a pedido de /consultar-rut y de las cargas.
+#
+# Apagado no cuesta nada: la API ni siquiera crea el Perfilador si no
+# está PERFILADO=1. Encendido, se perfila con cProfile:
+#   - una consulta con el header "X-Perfilar: 1" (sin pasar por cache),
+#   - una fracción `muestreo` de las consultas normales,
+#   - las próximas `cargas` subidas de docs/pagos/empresas.
+# Cada perfil queda en la colección 'perfiles' (los últimos
+# MAX_PERFILES) con un resumen en texto y las estadísticas en formato
+# .prof, que se abren con `python -m pstats` o snakeviz.
+#
+# cProfile solo mide el hilo donde se activa. Las cargas leen, preparan
+# y escriben en hilos propios (scripts/pipeline_carga.py): esos hilos
+# toman la sesión del que los lanza (`sesion_actual`) y se perfilan con
+# `perfilar_hilo`; al guardar se suman todos en un solo perfil.
+# ------------------------------------------------------------
+
+COLECCION = "perfiles"
+MAX_PERFILES = 50
+LINEAS_RESUMEN = 40
+
+_sesion = threading.local()
+
+
+def resumen_texto(estadisticas, lineas=LINEAS_RESUMEN):
+    """Top por tiempo acumulado de un pstats.Stats (lo reordena)."""
+    salida = io.StringIO()
+    estadisticas.stream = salida
+    estadisticas.sort_stats("cumulative").print_stats(lineas)
+    return salida.getvalue()
+
+
+def sesion_actual():
+    """Perfiles de la tarea perfilada en este hilo, o None si no se está perfilando."""
+    return getattr(_sesion, "perfiles", None)
+
+
+@contextmanager
+def perfilar_hilo(perfiles):
+    """Perfila el hilo actual y suma su perfil a `perfiles` (la sesión de quien lo lanzó)."""
+    if perfiles is None:
+        yield
+        return
+    perfil = cProfile.Profile()
+    try:
+        perfil.enable()
+    except ValueError:
+        # Python 3.12+: un solo perfilador activo por proceso
+        yield
+        return
+    _sesion.perfiles = perfiles
+    try:
+        yield
+    finally:
+        perfil.disable()
+        _sesion.perfiles = None
+        perfiles.append(perfil)
+
+
+class Perfilador:
+
+    def __init__(self, db, muestreo=0.0, maximo=MAX_PERFILES):
+        self.db = db
+        self.muestreo = muestreo
+        self.cargas = 0
+        self.maximo = maximo
+        self._lock = threading.Lock()
+
+    def estado(self):
+        return {"muestreo": self.muestreo, "cargas_pendientes": self.cargas}
+
+    def configurar(self, muestreo=None, cargas=None):
+        with self._lock:
+            if muestreo is not None:
+                self.muestreo = min(max(float(muestreo), 0.0), 1.0)
+            if cargas is not None:
+                self.cargas = max(int(cargas), 0)
+
+    # --- qué se perfila --------------------------------------------------
+
+    def toca_consulta(self, forzar=False):
+        return forzar or (self.muestreo > 0 and random.random() < self.muestreo)
+
+    def toca_carga(self):
+        with self._lock:
+            if self.cargas <= 0:
+                return False
+            self.cargas -= 1
+            return True
+
+    # --- perfilar ----------------------------------------------------------
+
+    @contextmanager
+    def perfilar(self, objetivo, detalle=None):
+        perfil = cProfile.Profile()
+        perfiles = [perfil]
+        inicio = time.perf_counter()
+        _sesion.perfiles = perfiles
+        perfil.enable()
+        try:
+            yield
+        finally:
+            perfil.disable()
+            _sesion.perfiles = None
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+            # Guardar (y formatear) fuera del request perfilado
+            threading.Thread(
+                target=self.guardar, args=(perfiles, objetivo, detalle, duracion_ms), daemon=True
+            ).start()
+
+    def envolver(self, funcion, objetivo, detalle=None):
+        def perfilada(*args, **kwargs):
+            with self.perfilar(objetivo, detalle):
+                return funcion(*args, **kwargs)
+        return perfilada
+
+    def guardar(self, perfiles, objetivo, detalle, duracion_ms):
+        try:
+            # El hilo que se perfiló más los que lanzó, sumados
+            perfil = pstats.Stats(*perfiles)
+            # Mismo contenido que escribe Profile.dump_stats()
+            estadisticas = marshal.dumps(perfil.stats)
+            coleccion = self.db[COLECCION]
+            coleccion.insert_one({
+                "objetivo": objetivo,
+                "detalle": detalle,
+                "fecha": datetime.now(),
+                "duracion_ms": round(duracion_ms, 2),
+                "resumen": resumen_texto(perfil),
+                "prof": Binary(estadisticas),
+            })
+            viejos = [p["_id"] for p in coleccion.find({}, {"_id": 1}).sort("fecha", -1).skip(self.maximo)]
+            if viejos:
+                coleccion.delete_many({"_id": {"$in": viejos}})
+        except Exception as e:
+            print(f"⚠ No se pudo guardar el perfil de {objetivo}:", e)
+
+
+def listar_perfiles(db, limite=20):
+    return [
+        {**p, "_id": str(p["_id"])}
+        for p in db[COLECCION].find({}, {"prof": 0, "resumen": 0}).sort("fecha", -1).limit(limite)
+    ]
@@ -0,0 +1,132 @@
+import queue
+import threading
+
+from scripts.perfilado import perfilar_hilo, sesion_actual
+
+# ------------------------------------------------------------
+# Pipeline de carga: lector → preparación (hash/esquema) → escritores.
+#
+# Antes cada chunk se preparaba y se escribía en el mismo hilo, uno
+# detrás del otro: mientras Mongo escribía no se preparaba nada y al
+# revés. Acá cada etapa corre en su hilo y se pasan los chunks por colas
+# acotadas (`capacidad`): si Mongo va lento, la cola se llena y la
+# preparación espera, así en memoria nunca hay más de unos pocos chunks
+# fuera del DataFrame y el ritmo lo marca la etapa más lenta.
+#
+# La preparación es CPU (un solo hilo, por el GIL); la escritura es I/O
+# y puede ir en varios hilos. Con más de un escritor los chunks terminan
+# en desorden: el checkpoint avanza solo hasta el último chunk con todos
+# los anteriores confirmados.
+#
+# Si la carga se está perfilando (scripts/perfilado.py), cada etapa se
+# perfila en su hilo y se suma al perfil de la carga.
+# ------------------------------------------------------------
+
+_FIN = object()
+
+
+class _Detenido(Exception):
+    pass
+
+
+def _poner(cola, item, detener):
+    while True:
+        if detener.is_set():
+            raise _Detenido()
+        try:
+            cola.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def _sacar(cola, detener):
+    while True:
+        if detener.is_set():
+            raise _Detenido()
+        try:
+            return cola.get(timeout=0.5)
+        except queue.Empty:
+            continue
+
+
+def ejecutar_pipeline(chunks, preparar, escribir, desde=0, escritores=1, capacidad=4, al_confirmar=None):
+    """
+    - chunks: iterable de (indice, chunk) en orden, empezando en `desde`;
+      se lee en un hilo aparte.
+    - preparar(indice, chunk) -> lote: etapa de CPU.
+    - escribir(indice, lote) -> resultado: etapa de I/O, en `escritores` hilos.
+    - al_confirmar(indice, resultado): se llama en el hilo que invoca, en
+      orden de índice, cuando ese chunk y todos los anteriores terminaron.
+
+    Si una etapa falla se detienen todas y el error se relanza acá.
+    """
+    crudos = queue.Queue(maxsize=capacidad)
+    preparados = queue.Queue(maxsize=capacidad)
+    resultados = queue.Queue()
+    detener = threading.Event()
+    errores = []
+    perfiles = sesion_actual()
+
+    def etapa(funcion):
+        def correr():
+            try:
+                with perfilar_hilo(perfiles):
+                    funcion()
+            except _Detenido:
+                pass
+            except BaseException as e:
+                errores.append(e)
+                detener.set()
+                resultados.put(_FIN)
+        return correr
+
+    @etapa
+    def lector():
+        for item in chunks:
+            _poner(crudos, item, detener)
+        _poner(crudos, _FIN, detener)
+
+    @etapa
+    def preparador():
+        while (item := _sacar(crudos, detener)) is not _FIN:
+            indice, chunk = item
+            _poner(preparados, (indice, preparar(indice, chunk)), detener)
+        for _ in range(escritores):
+            _poner(preparados, _FIN, detener)
+
+    @etapa
+    def escritor():
+        while (item := _sacar(preparados, detener)) is not _FIN:
+            indice, lote = item
+            resultados.put((indice, escribir(indice, lote)))
+        resultados.put(_FIN)
+
+    hilos = [threading.Thread(target=lector, daemon=True), threading.Thread(target=preparador, daemon=True)]
+    hilos += [threading.Thread(target=escritor, daemon=True) for _ in range(escritores)]
+    for hilo in hilos:
+        hilo.start()
+
+    terminados, listos, siguiente = 0, {}, desde
+    try:
+        while terminados < escritores and not errores:
+            item = resultados.get()
+            if item is _FIN:
+                terminados += 1
+                continue
+            indice, resultado = item
+            listos[indice] = resultado
+            # Confirmar en orden: solo el prefijo contiguo ya escrito
+            while siguiente in listos:
+                if al_confirmar:
+                    al_confirmar(siguiente, listos.pop(siguiente))
+                else:
+                    listos.pop(siguiente)
+                siguiente += 1
+    finally:
+        detener.set()
+        for hilo in hilos:
+            hilo.join()
+
+    if errores:
+        raise errores[0]
@@ -0,0 +1,172 @@
+from datetime import datetime
+import csv
+import os
+import uuid
+
+import numpy as np
+
+from scripts.rut import clave_rut
+
+# ------------------------------------------------------------
+# Pronóstico de plazo por mes para entidades públicas (municipalidades,
+# corporaciones, SERVIU/MINVU y los RUTs de ruts_municipales_detectados.csv).
+#
+# Se calcula en lote desde los buckets mensuales
+# (scripts/estadisticas_mensuales.py) y queda un documento por entidad
+# en 'pronostico_verano':
+#   {rut_num, tipo, meses: [{mes 1..12, cantidad, esperado,
+#    banda_inferior, banda_superior}], verano: {...}, generado}
+#
+# Cada mes calendario junta todos los años de historial. Un mes con
+# pocos pagos se acerca al promedio general de la entidad (con PESO_PREVIO
+# pagos "ficticios" del promedio general), así un mes con un solo pago no
+# manda. La banda es la de un pago individual: esperado ± Z_BANDA
+# desviaciones (80%).
+# ------------------------------------------------------------
+
+COLECCION = "pronostico_verano"
+
+PATH_DETECTADOS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ruts_municipales_detectados.csv")
+
+PESO_PREVIO = 10
+Z_BANDA = 1.2816
+
+
+def ruts_detectados(path=PATH_DETECTADOS):
+    """{clave_rut: clasificación} de ruts_municipales_detectados.csv."""
+    if not os.path.exists(path):
+        print(f"⚠ Archivo no encontrado: {path}")
+        return {}
+    with open(path, encoding="utf-8", newline="") as f:
+        return {
+            clave: (fila.get("CLASIFICACION") or "").strip() or None
+            for fila in csv.DictReader(f)
+            if (clave := clave_rut(fila.get("RUT"))) is not None
+        }
+
+
+def entidades(muni, corp, serviu, detectados):
+    """{clave_rut: tipo}. Las listas oficiales mandan sobre el CSV detectado."""
+    tipos = dict(detectados)
+    tipos.update({c: "SERVIU / MINVU" for c in serviu})
+    tipos.update({c: "CORP MUNICIPAL" for c in corp})
+    tipos.update({c: "MUNICIPALIDAD" for c in muni})
+    return tipos
+
+
+def _estadistica(n, suma, suma_cuad, previo):
+    """Promedio y varianza encogidos hacia `previo` (promedio, varianza) según n."""
+    peso = n / (n + PESO_PREVIO)
+    promedio = suma / n if n else 0.0
+    varianza = max(suma_cuad / n - promedio * promedio, 0.0) if n else 0.0
+    esperado = peso * promedio + (1 - peso) * previo[0]
+    varianza = peso * varianza + (1 - peso) * previo[1]
+    desviacion = float(np.sqrt(varianza))
+    return {
+        "cantidad": int(n),
+        "esperado": round(float(esperado), 1),
+        "banda_inferior": round(max(float(esperado) - Z_BANDA * desviacion, 0.0), 1),
+        "banda_superior": round(float(esperado) + Z_BANDA * desviacion, 1),
+    }
+
+
+def pronosticar(buckets, meses_verano):
+    """
+    Pronóstico de una entidad desde sus buckets ({mes, n, suma, suma_cuad}),
+    o None si no tiene pagos.
+    """
+    if not buckets:
+        return None
+    mes = np.array([b["mes"].month for b in buckets])
+    n = np.array([b["n"] for b in buckets], dtype=np.float64)
+    suma = np.array([b["suma"] for b in buckets], dtype=np.float64)
+    suma_cuad = np.array([b["suma_cuad"] for b in buckets], dtype=np.float64)
+
+    total = n.sum()
+    if not total:
+        return None
+    promedio = suma.sum() / total
+    previo = (promedio, max(suma_cuad.sum() / total - promedio * promedio, 0.0))
+
+    n_mes = np.bincount(mes, weights=n, minlength=13)
+    suma_mes = np.bincount(mes, weights=suma, minlength=13)
+    cuad_mes = np.bincount(mes, weights=suma_cuad, minlength=13)
+
+    verano = np.isin(np.arange(13), meses_verano)
+    return {
+        "meses": [
+            {"mes": m, **_estadistica(n_mes[m], suma_mes[m], cuad_mes[m], previo)}
+            for m in range(1, 13)
+        ],
+        "verano": _estadistica(n_mes[verano].sum(), suma_mes[verano].sum(), cuad_mes[verano].sum(), previo),
+        "general": _estadistica(total, suma.sum(), suma_cuad.sum(), previo),
+    }
+
+
+def calcular(coleccion_buckets, tipos, meses_verano, tamano_lote=1000):
+    """Documentos de pronóstico para las entidades de `tipos` que tienen buckets."""
+    claves = list(tipos)
+    documentos = []
+    ahora = datetime.now()
+    for i in range(0, len(claves), tamano_lote):
+        por_rut = {}
+        for b in coleccion_buckets.find({"rut_num": {"$in": claves[i:i + tamano_lote]}, "n": {"$gt": 0}}):
+            por_rut.setdefault(b["rut_num"], []).append(b)
+        for clave, buckets in por_rut.items():
+            pronostico = pronosticar(buckets, meses_verano)
+            if pronostico:
+                documentos.append({"rut_num": clave, "tipo": tipos[clave], **pronostico, "generado": ahora})
+    return documentos
+
+
+def guardar(db, documentos):
+    """
+    Reemplaza la colección completa (staging + rename). Staging propio por
+    llamada: la corrida diaria y /admin/pronostico-verano pueden coincidir.
+    """
+    staging = db[f"{COLECCION}_staging_{uuid.uuid4().hex[:12]}"]
+    try:
+        if documentos:
+            staging.insert_many(documentos)
+        staging.create_index("rut_num", unique=True)
+        staging.rename(COLECCION, dropTarget=True)
+    except Exception:
+        staging.drop()
+        raise
+    return len(documentos)
+
+
+def temporada(pronostico, meses_verano, hoy=None):
+    """
+    Vista para la consulta: si el verano está en curso, los meses que
+    quedan de él; si no, el próximo verano completo.
+    """
+    mes_actual = (hoy or datetime.now()).month
+    en_curso = mes_actual in meses_verano
+    meses = list(meses_verano)
+    if en_curso:
+        meses = meses[meses.index(mes_actual):]
+    por_mes = {m["mes"]: m for m in pronostico["meses"]}
+    seleccion = [por_mes[m] for m in meses]
+    return {
+        "temporada": "verano en curso" if en_curso else "próximo verano",
+        "meses": seleccion,
+        "verano": pronostico["verano"],
+        "plazo_sugerido": max(m["banda_superior"] for m in seleccion),
+        "generado": pronostico["generado"],
+    }
+
+
+if __name__ == "__main__":
+    # Solo con los buckets ya calculados; la API además completa los que faltan
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    from scripts.consultor import listas_entidades
+    from scripts.estadisticas_mensuales import COLECCION as COLECCION_BUCKETS
+    from scripts.reglas import motor_reglas
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI"))["mi_base_datos"]
+    tipos = entidades(*listas_entidades(), ruts_detectados())
+    total = guardar(db, calcular(db[COLECCION_BUCKETS], tipos, motor_reglas().meses_verano))
+    print(f"✅ Pronósticos de verano: {total} entidades con historial")
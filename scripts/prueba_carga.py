@@ -0,0 +1,407 @@
+"""
+Prueba de carga de la API con reporte de latencias y SLOs.
+
+Levanta la app en local contra un Mongo local (o usa --url), repite
+una mezcla de RUTs sobre los endpoints de consulta con N hilos
+concurrentes y, opcionalmente, sube un archivo de docs a la vez para
+medir cómo afecta una carga en segundo plano. Reporta throughput y
+p50/p95/p99 por endpoint y termina con código 1 si no se cumple algún
+SLO.
+
+Uso:
+    # Mongo local (p.ej. docker run -p 27017:27017 mongo:7)
+    python -m scripts.prueba_carga --mongo-uri mongodb://localhost:27017 \\
+        --sembrar 300 --concurrencia 16 --duracion 30 --con-carga 20000 \\
+        --slo consultar-rut:p99=800 --slo errores=0.01
+
+    # Sin servidor Mongo, en el mismo proceso (requiere mongomock). Sirve
+    # para probar la herramienta, no para medir: mongomock no es seguro
+    # entre hilos (aparecen errores sueltos) y no admite --con-carga
+    # porque no implementa bulk_write completo.
+    python -m scripts.prueba_carga --mongomock --sembrar 200
+
+    # Contra una instancia ya levantada
+    python -m scripts.prueba_carga --url http://localhost:8000 --ruts ruts.txt
+
+--sembrar BORRA docs, pagos y empresas de 'mi_base_datos' en el Mongo
+indicado, por eso solo se permite contra localhost.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlparse
+import argparse
+import http.client
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from scripts.rut import calcular_dv
+
+ENDPOINTS = {
+    "consultar-rut": lambda rut: ("/consultar-rut", {"rut": rut}),
+    "historico-pagos": lambda rut: ("/historico-pagos", {"rut": rut, "limit": 200}),
+    "tendencia-pagos": lambda rut: ("/tendencia-pagos", {"rut": rut}),
+}
+
+HOSTS_LOCALES = {"localhost", "127.0.0.1", "::1"}
+
+
+# ------------------------------------------------------------
+# Datos sintéticos
+# ------------------------------------------------------------
+
+def rut_sintetico(i):
+    cuerpo = 76000000 + i
+    return f"{cuerpo}-{calcular_dv(cuerpo)}"
+
+
+def sembrar(db, n_deudores, docs_por_deudor=60, semilla=1):
+    """Deudores con docs, pagos (~85% cruzados) y empresas en 4 rubros x 3 tramos."""
+    rnd = random.Random(semilla)
+    for nombre in ("docs", "pagos", "empresas"):
+        db[nombre].drop()
+
+    ruts = [rut_sintetico(i) for i in range(n_deudores)]
+    for i, rut in enumerate(ruts):
+        rut_num = int(rut.split("-")[0])
+        docs, pagos = [], []
+        for j in range(docs_por_deudor):
+            emision = datetime(2022, 1, 1) + timedelta(days=rnd.randint(0, 900))
+            doc, ope = i * 1000 + j, 500000 + i * 1000 + j
+            pagado = rnd.random() < 0.85
+            docs.append({
+                "RUT DEUDOR": rut, "rut_num": rut_num, "DEUDOR": f"DEUDOR {i}",
+                "Nº DCTO": doc, "Nº OPE": ope, "FEC EMISION DIG": emision, "FECHA CES": emision,
+                "VCTO NOM": emision + timedelta(days=30), "MONTO DOC": rnd.randint(100, 5000) * 1000,
+                "SALDO": 0 if pagado else 1000, "ESTADO": "PAGADO" if pagado else "MOROSO",
+                "_hash": uuid.uuid4().hex,
+            })
+            if pagado:
+                pagos.append({
+                    "Rut Deudor": rut, "rut_num": rut_num, "Nª Doc.": doc, "Nº Ope.": ope,
+                    "Fecha Pago": emision + timedelta(days=int(rnd.gammavariate(4, 15))),
+                    "Mto.Pagado": 1000.0, "_hash": uuid.uuid4().hex,
+                })
+        db.docs.insert_many(docs)
+        if pagos:
+            db.pagos.insert_many(pagos)
+
+    # Los deudores y otro tanto de empresas sin historial (camino por similares)
+    empresas = [
+        {"rut": rut_sintetico(i), "rut_num": 76000000 + i, "nombre": f"EMPRESA {i}",
+         "rubro": f"R{i % 4}", "tramo_ventas": f"T{i % 3}"}
+        for i in range(2 * n_deudores)
+    ]
+    db.empresas.insert_many(empresas)
+    for nombre, campo in (("docs", "RUT DEUDOR"), ("pagos", "Rut Deudor"), ("empresas", "rut")):
+        db[nombre].create_index("rut_num")
+        db[nombre].create_index(campo)
+    db.empresas.create_index([("rubro", 1), ("tramo_ventas", 1)])
+    return [e["rut"] for e in empresas]
+
+
+def excel_docs(filas, semilla=2):
+    """Excel de docs en memoria para la carga concurrente."""
+    import pandas as pd
+
+    rnd = random.Random(semilla)
+    base = 900000000
+    df = pd.DataFrame({
+        "RUT DEUDOR": [rut_sintetico(rnd.randint(0, 999)) for _ in range(filas)],
+        "DEUDOR": "CARGA PRUEBA",
+        "Nº DCTO": range(base, base + filas),
+        "Nº OPE": range(base, base + filas),
+        "FEC EMISION DIG": [datetime(2023, 1, 1) + timedelta(days=i % 365) for i in range(filas)],
+        "MONTO DOC": 1000,
+        "ESTADO": "VIGENTE",
+    })
+    salida = io.BytesIO()
+    df.to_excel(salida, index=False)
+    return salida.getvalue()
+
+
+# ------------------------------------------------------------
+# App local
+# ------------------------------------------------------------
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def levantar_subproceso(mongo_uri, puerto):
+    entorno = {**os.environ, "MONGO_URI": mongo_uri}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "scripts.consultor_api:app", "--port", str(puerto), "--log-level", "warning"],
+        env=entorno
+    )
+
+
+def levantar_en_proceso(puerto):
+    import uvicorn
+    from scripts.consultor_api import app
+
+    servidor = uvicorn.Server(uvicorn.Config(app, port=puerto, log_level="warning"))
+    threading.Thread(target=servidor.run, daemon=True).start()
+    return servidor
+
+
+def esperar_listo(base, timeout=120):
+    """Espera a que "/" responda 200 (la app termina de precalentar)."""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            estado, _ = pedir(conexion(base), "GET", "/")
+            if estado == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"La app en {base} no quedó lista en {timeout} s")
+
+
+# ------------------------------------------------------------
+# Cliente HTTP
+# ------------------------------------------------------------
+
+def conexion(base):
+    url = urlparse(base)
+    clase = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+    return clase(url.hostname, url.port, timeout=60)
+
+
+def pedir(con, metodo, ruta, cuerpo=None, cabeceras=None):
+    con.request(metodo, ruta, body=cuerpo, headers=cabeceras or {})
+    respuesta = con.getresponse()
+    return respuesta.status, respuesta.read()
+
+
+def subir_archivo(base, ruta, nombre, contenido):
+    limite = uuid.uuid4().hex
+    cuerpo = (
+        f"--{limite}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{nombre}\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + contenido + f"\r\n--{limite}--\r\n".encode()
+    return pedir(conexion(base), "POST", ruta, cuerpo, {"Content-Type": f"multipart/form-data; boundary={limite}"})
+
+
+# ------------------------------------------------------------
+# Generador de carga
+# ------------------------------------------------------------
+
+class Mezcla:
+    """RUTs con sesgo tipo Zipf (pocos RUTs muy consultados) y endpoints con pesos."""
+
+    def __init__(self, ruts, pesos_endpoints, sesgo=1.0, semilla=3):
+        self.ruts = list(ruts)
+        rango = np.arange(1, len(self.ruts) + 1, dtype=np.float64)
+        self._acumulada_ruts = np.cumsum(rango ** -sesgo)
+        self.endpoints = list(pesos_endpoints)
+        self._acumulada_endpoints = np.cumsum([pesos_endpoints[e] for e in self.endpoints])
+        self._rnd = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def _elegir(self, acumulada):
+        return int(np.searchsorted(acumulada, self._rnd.random() * acumulada[-1], side="right"))
+
+    def siguiente(self):
+        with self._lock:
+            rut = self.ruts[self._elegir(self._acumulada_ruts)]
+            endpoint = self.endpoints[self._elegir(self._acumulada_endpoints)]
+        return endpoint, rut
+
+
+def trabajador(base, mezcla, hasta, resultados):
+    con = conexion(base)
+    while time.monotonic() < hasta:
+        endpoint, rut = mezcla.siguiente()
+        ruta, params = ENDPOINTS[endpoint](rut)
+        inicio = time.perf_counter()
+        try:
+            estado, _ = pedir(con, "GET", f"{ruta}?{urlencode(params)}")
+        except (OSError, http.client.HTTPException):
+            estado = None
+            con.close()
+            con = conexion(base)
+        resultados.append((endpoint, (time.perf_counter() - inicio) * 1000, estado))
+
+
+def resumir(resultados, segundos):
+    reporte = {}
+    for endpoint in sorted({r[0] for r in resultados}):
+        filas = [r for r in resultados if r[0] == endpoint]
+        latencias = np.array([r[1] for r in filas])
+        errores = sum(1 for r in filas if r[2] is None or r[2] >= 500)
+        reporte[endpoint] = {
+            "peticiones": len(filas),
+            "rps": len(filas) / segundos,
+            "p50": float(np.percentile(latencias, 50)),
+            "p95": float(np.percentile(latencias, 95)),
+            "p99": float(np.percentile(latencias, 99)),
+            "max": float(latencias.max()),
+            "errores": errores / len(filas),
+        }
+    total = len(resultados)
+    reporte["total"] = {
+        "peticiones": total,
+        "rps": total / segundos,
+        "errores": sum(r["errores"] * r["peticiones"] for r in reporte.values()) / total if total else 0.0,
+    }
+    return reporte
+
+
+def evaluar_slos(reporte, slos):
+    """slos: lista de 'endpoint:p99=800' (ms) o 'errores=0.01' (fracción). Devuelve los incumplidos."""
+    incumplidos = []
+    for slo in slos:
+        objetivo, _, limite = slo.partition("=")
+        limite = float(limite)
+        if objetivo == "errores":
+            valor = reporte["total"]["errores"]
+        else:
+            endpoint, _, metrica = objetivo.partition(":")
+            if endpoint not in reporte:
+                incumplidos.append(f"{slo} (sin peticiones a {endpoint})")
+                continue
+            valor = reporte[endpoint][metrica]
+        if valor > limite:
+            incumplidos.append(f"{slo} (medido: {valor:.3f})")
+    return incumplidos
+
+
+def imprimir(reporte, carga):
+    print(f"\n{'endpoint':<18}{'pet.':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'err%':>7}")
+    for endpoint, r in reporte.items():
+        if endpoint == "total":
+            continue
+        print(f"{endpoint:<18}{r['peticiones']:>8}{r['rps']:>9.1f}{r['p50']:>9.1f}{r['p95']:>9.1f}"
+              f"{r['p99']:>9.1f}{r['max']:>9.1f}{r['errores'] * 100:>7.2f}")
+    t = reporte["total"]
+    print(f"{'total':<18}{t['peticiones']:>8}{t['rps']:>9.1f}{'':>36}{t['errores'] * 100:>7.2f}")
+    if carga:
+        print(f"\nCarga concurrente de docs: {carga}")
+
+
+def seguir_carga(base, inicio, hasta, salida):
+    """Sondea /estado-carga hasta que la carga de docs termina (o se acaba la prueba)."""
+    con = conexion(base)
+    while time.monotonic() < hasta:
+        _, cuerpo = pedir(con, "GET", "/estado-carga")
+        docs = json.loads(cuerpo)["docs"]
+        if docs["estado"] in ("listo", "error"):
+            salida.update(estado=docs["estado"], mensaje=docs["mensaje"], segundos=round(time.monotonic() - inicio, 1))
+            return
+        time.sleep(1)
+    salida.update(estado="sin terminar al cierre de la prueba")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API de plazos")
+    destino = parser.add_mutually_exclusive_group(required=True)
+    destino.add_argument("--url", help="Instancia ya levantada (no se siembra nada)")
+    destino.add_argument("--mongo-uri", help="Mongo local contra el que se levanta la app")
+    destino.add_argument("--mongomock", action="store_true", help="App en este proceso sobre mongomock")
+    parser.add_argument("--sembrar", type=int, default=0, metavar="N", help="Crear N deudores sintéticos (borra datos)")
+    parser.add_argument("--ruts", help="Archivo con un RUT por línea (por defecto: los sembrados o los de docs)")
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--duracion", type=float, default=20, help="Segundos de prueba")
+    parser.add_argument("--mezcla", default="consultar-rut=8,historico-pagos=1,tendencia-pagos=1")
+    parser.add_argument("--sesgo", type=float, default=1.0, help="Exponente Zipf de popularidad de RUTs")
+    parser.add_argument("--con-carga", type=int, default=0, metavar="FILAS", help="Subir un Excel de docs al empezar")
+    parser.add_argument("--slo", action="append", default=[], help="p.ej. consultar-rut:p99=800 o errores=0.01")
+    parser.add_argument("--json", help="Guardar el reporte en este archivo")
+    args = parser.parse_args(argv)
+
+    if args.mongo_uri and urlparse(args.mongo_uri).hostname not in HOSTS_LOCALES and args.sembrar:
+        parser.error("--sembrar solo se permite contra un Mongo en localhost")
+    if args.mongomock and args.con_carga:
+        parser.error("--con-carga necesita un Mongo real (--mongo-uri)")
+
+    proceso = None
+    ruts = []
+    if args.url:
+        base = args.url.rstrip("/")
+    else:
+        puerto = puerto_libre()
+        base = f"http://127.0.0.1:{puerto}"
+        if args.mongomock:
+            import mongomock
+            import pymongo
+            compartido = mongomock.MongoClient()
+            pymongo.MongoClient = lambda *a, **k: compartido
+            os.environ["MONGO_URI"] = "mongodb://mongomock"
+            db = compartido["mi_base_datos"]
+        else:
+            from pymongo import MongoClient
+            db = MongoClient(args.mongo_uri)["mi_base_datos"]
+        if args.sembrar:
+            print(f"🌱 Sembrando {args.sembrar} deudores…")
+            ruts = sembrar(db, args.sembrar)
+        elif not args.ruts:
+            ruts = [r for r in db.docs.distinct("RUT DEUDOR") if r]
+
+        if args.mongomock:
+            levantar_en_proceso(puerto)
+        else:
+            proceso = levantar_subproceso(args.mongo_uri, puerto)
+
+    if args.ruts:
+        with open(args.ruts, encoding="utf-8") as f:
+            ruts = [linea.strip() for linea in f if linea.strip()]
+    if not ruts:
+        parser.error("No hay RUTs para consultar (usar --sembrar o --ruts)")
+
+    try:
+        esperar_listo(base)
+        pesos = {e: float(p) for e, _, p in (x.partition("=") for x in args.mezcla.split(","))}
+        desconocidos = set(pesos) - set(ENDPOINTS)
+        if desconocidos:
+            parser.error(f"Endpoints desconocidos en --mezcla: {', '.join(desconocidos)}")
+        mezcla = Mezcla(ruts, pesos, sesgo=args.sesgo)
+
+        carga = {}
+        inicio = time.monotonic()
+        hasta = inicio + args.duracion
+        if args.con_carga:
+            estado, cuerpo = subir_archivo(base, "/subir-docs", "prueba_carga_docs.xlsx", excel_docs(args.con_carga))
+            if estado != 200:
+                raise RuntimeError(f"La subida de docs falló ({estado}): {cuerpo[:200]!r}")
+            threading.Thread(target=seguir_carga, args=(base, inicio, hasta, carga), daemon=True).start()
+
+        resultados = []
+        print(f"🚀 {args.concurrencia} hilos durante {args.duracion:.0f} s sobre {len(ruts)} RUTs…")
+        with ThreadPoolExecutor(args.concurrencia) as pool:
+            for _ in range(args.concurrencia):
+                pool.submit(trabajador, base, mezcla, hasta, resultados)
+        segundos = time.monotonic() - inicio
+
+        reporte = resumir(resultados, segundos)
+        imprimir(reporte, carga)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"reporte": reporte, "carga": carga, "parametros": vars(args)}, f, indent=2)
+
+        incumplidos = evaluar_slos(reporte, args.slo)
+        for slo in incumplidos:
+            print(f"❌ SLO incumplido: {slo}")
+        if args.slo and not incumplidos:
+            print("✅ SLOs cumplidos")
+        return 1 if incumplidos else 0
+    finally:
+        if proceso:
+            proceso.terminate()
+            proceso.wait(10)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
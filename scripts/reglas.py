@@ -0,0 +1,142 @@
+from datetime import datetime
+import json
+import numpy as np
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PATH_REGLAS = os.path.join(BASE_DIR, "data", "reglas_plazos.json")
+
+TEMPORADAS = ("verano", "resto")
+
+
+def _numero(valor):
+    # 15.0 → 15, para que la respuesta no cambie de forma respecto de las
+    # reglas fijas que había antes (factor_dias: 15 / 7.5)
+    valor = float(valor)
+    return int(valor) if valor.is_integer() else valor
+
+
+class MotorReglas:
+    """
+    Tabla de reglas (tipo de entidad × temporada × rango de base → plazo,
+    factor) compilada a una búsqueda directa.
+
+    Al compilar, cada par (tipo, temporada) queda con un arreglo ordenado de
+    límites superiores de la base y los plazos/factores correspondientes;
+    las reglas "todas" se expanden a ambas temporadas. Evaluar es un dict
+    lookup + `searchsorted`, tanto para un RUT como para un lote completo.
+    """
+
+    def __init__(self, tabla):
+        self.tabla = tabla
+        self.meses_verano = tuple(tabla.get("meses_verano", (11, 12, 1, 2)))
+        self.factor_defecto = _numero(tabla.get("factor_dias_defecto", 15))
+        self._tramos = self._compilar(tabla.get("reglas", []))
+        self.sin_historial = self._validar_sin_historial(tabla.get("sin_historial", []))
+
+    @staticmethod
+    def _validar_sin_historial(reglas):
+        # Se usan tal cual en /consultar-rut: una regla sin tipo o sin plazo
+        # numérico tiene que fallar al instalar la tabla, no en la consulta
+        por_tipo = {}
+        for regla in reglas:
+            if not regla.get("tipo"):
+                raise ValueError(f"Regla sin_historial sin tipo: {regla}")
+            for campo in ("plazo", "factor_dias"):
+                valor = regla.get(campo, 0 if campo == "factor_dias" else None)
+                if isinstance(valor, bool) or not isinstance(valor, (int, float)) or valor != valor:
+                    raise ValueError(f"Regla sin_historial con {campo} no numérico: {regla}")
+            por_tipo[regla["tipo"]] = regla
+        return por_tipo
+
+    @staticmethod
+    def _compilar(reglas):
+        agrupadas = {}
+        for regla in reglas:
+            temporada = regla.get("temporada", "todas")
+            if temporada not in (*TEMPORADAS, "todas"):
+                raise ValueError(f"Temporada no válida en regla: {regla}")
+            destinos = TEMPORADAS if temporada == "todas" else (temporada,)
+            for t in destinos:
+                # Una regla específica de temporada pisa a la de "todas"
+                clave = (regla["tipo"], t)
+                prioridad = 0 if temporada == "todas" else 1
+                agrupadas.setdefault(clave, {}).setdefault(prioridad, []).append(regla)
+
+        tramos = {}
+        for clave, por_prioridad in agrupadas.items():
+            seleccion = por_prioridad[max(por_prioridad)]
+            seleccion = sorted(
+                seleccion,
+                key=lambda r: np.inf if r.get("base_hasta") is None else float(r["base_hasta"])
+            )
+            limites = np.array(
+                [np.inf if r.get("base_hasta") is None else float(r["base_hasta"]) for r in seleccion]
+            )
+            # El último tramo cubre cualquier base mayor
+            limites[-1] = np.inf
+            plazos = np.array([np.nan if r.get("plazo") is None else float(r["plazo"]) for r in seleccion])
+            factores = np.array([float(r.get("factor_dias", 15)) for r in seleccion])
+            tramos[clave] = (limites, plazos, factores)
+        return tramos
+
+    # -----------------------------
+    # Evaluación
+    # -----------------------------
+
+    def es_verano(self, mes=None):
+        return (mes or datetime.now().month) in self.meses_verano
+
+    def evaluar(self, tipo, base, mes=None):
+        """Devuelve (plazo_recomendado o None, factor_dias) para un RUT."""
+        plazos, factores = self.evaluar_lote([tipo], [np.nan if base is None else base], mes)
+        return (None if np.isnan(plazos[0]) else int(plazos[0])), _numero(factores[0])
+
+    def evaluar_lote(self, tipos, bases, mes=None):
+        """
+        Evalúa un lote de RUTs de una vez. `tipos` y `bases` son secuencias
+        del mismo largo; devuelve (plazos, factores) como arreglos float64,
+        con NaN donde no hay plazo recomendado.
+        """
+        tipos = np.asarray(tipos, dtype=object)
+        bases = np.asarray(bases, dtype=np.float64)
+        temporada = "verano" if self.es_verano(mes) else "resto"
+
+        plazos = np.full(len(tipos), np.nan)
+        factores = np.full(len(tipos), float(self.factor_defecto))
+
+        for tipo in set(tipos.tolist()):
+            tramo = self._tramos.get((tipo, temporada))
+            if tramo is None:
+                continue
+            limites, plazos_tramo, factores_tramo = tramo
+            filas = np.flatnonzero(tipos == tipo)
+            b = bases[filas]
+            idx = np.searchsorted(limites, np.where(np.isnan(b), np.inf, b), side="left")
+            plazos[filas] = plazos_tramo[idx]
+            factores[filas] = factores_tramo[idx]
+
+        return plazos, factores
+
+
+def leer_tabla(path=PATH_REGLAS):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+MOTOR = MotorReglas(leer_tabla())
+
+
+def instalar_reglas(tabla):
+    """
+    Compila y reemplaza la tabla activa. Si la tabla no es válida lanza la
+    excepción antes de tocar el motor actual.
+    """
+    global MOTOR
+    nuevo = MotorReglas(tabla)
+    MOTOR = nuevo
+    return nuevo
+
+
+def motor_reglas():
+    return MOTOR
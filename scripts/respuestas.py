@@ -0,0 +1,65 @@
+from datetime import date, datetime
+from fastapi.responses import JSONResponse
+import json
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional; sin él se usa json estándar
+    orjson = None
+
+
+def _convertir(valor):
+    """Tipos que ni orjson ni json saben serializar por sí solos."""
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+        if isinstance(valor, float) and valor != valor:
+            return None
+        return valor
+    if isinstance(valor, np.ndarray):
+        return valor.tolist()
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, (set, frozenset)):
+        return list(valor)
+    return str(valor)
+
+
+def _limpiar_nan(valor):
+    # json.dumps escribe NaN (JSON inválido); orjson ya lo pasa a null.
+    if isinstance(valor, float) and valor != valor:
+        return None
+    if isinstance(valor, dict):
+        return {k: _limpiar_nan(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_limpiar_nan(v) for v in valor]
+    return valor
+
+
+def serializar(contenido):
+    if orjson is not None:
+        return orjson.dumps(
+            contenido,
+            default=_convertir,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(
+        _limpiar_nan(contenido),
+        default=_convertir,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class RespuestaRapida(JSONResponse):
+    """
+    JSONResponse que serializa directo con orjson (si está instalado).
+
+    Los endpoints que la devuelven explícitamente se saltan
+    `jsonable_encoder`, que recorre recursivamente cada registro de
+    `ultimos_pagos`, `morosos` y del histórico. Maneja numpy (escalares y
+    arrays), datetime y NaN (→ null) sin conversión previa.
+    """
+
+    def render(self, content):
+        return serializar(content)
@@ -0,0 +1,117 @@
+from typing import NamedTuple
+
+
+class Rut(NamedTuple):
+    """RUT canónico: cuerpo entero (sin puntos) + dígito verificador ('0'-'9' o 'K')."""
+    cuerpo: int
+    dv: str
+
+    def __str__(self):
+        return f"{self.cuerpo}-{self.dv}"
+
+
+def calcular_dv(cuerpo):
+    """Dígito verificador por módulo 11."""
+    suma, factor = 0, 2
+    for digito in reversed(str(int(cuerpo))):
+        suma += int(digito) * factor
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - suma % 11
+    if resto == 11:
+        return "0"
+    if resto == 10:
+        return "K"
+    return str(resto)
+
+
+def parsear_rut(valor, validar=True):
+    """
+    Convierte un RUT en cualquier formato habitual a `Rut`.
+
+    Acepta '61.202.000-0', '61202000-0', '612020000', ' 61202000 - 0 ',
+    con 'k' minúscula y también números (cuerpo + DV pegados, incluso
+    como float: 612020000.0, lo que deja pandas en una columna con NaN).
+    Devuelve None si no se puede interpretar o, con validar=True, si el
+    dígito verificador no corresponde.
+
+    Sin guion no hay forma de distinguir un DV mal digitado de un RUT sin
+    DV (12345678 puede ser 1234567-8 o 12345678 sin DV), así que en ese
+    caso el DV se exige siempre, aunque validar=False.
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, float):
+        if valor != valor or not valor.is_integer():
+            return None
+        valor = int(valor)
+
+    s = str(valor).strip().upper().replace(" ", "")
+    if s.endswith(".0"):
+        s = s[:-2]
+    s = s.replace(".", "")
+    con_guion = "-" in s
+    if con_guion:
+        cuerpo, _, dv = s.rpartition("-")
+    else:
+        cuerpo, dv = s[:-1], s[-1:]
+
+    if not cuerpo.isdigit() or len(dv) != 1 or dv not in "0123456789K":
+        return None
+
+    rut = Rut(int(cuerpo), dv)
+    if (validar or not con_guion) and calcular_dv(rut.cuerpo) != rut.dv:
+        return None
+    return rut
+
+
+def rut_valido(valor):
+    return parsear_rut(valor) is not None
+
+
+def clave_rut(valor, validar=False):
+    """
+    Clave entera del RUT (el cuerpo), que es lo que se guarda en `rut_num`
+    e indexa. Por defecto no se exige DV válido: hay RUTs históricos mal
+    digitados en los Excel y se prefiere no perder el cruce.
+    """
+    rut = parsear_rut(valor, validar=validar)
+    return rut.cuerpo if rut else None
+
+
+def formatear_rut(valor):
+    """Forma canónica '12345678-9' o None si no es interpretable."""
+    rut = parsear_rut(valor, validar=False)
+    return str(rut) if rut else None
+
+
+def filtro_rut(rut, campo, usar_clave=True):
+    """
+    Filtro Mongo para un RUT. Con `usar_clave` (colecciones ya migradas a
+    `rut_num`) se compara la clave entera, así no importa si el RUT viene
+    con puntos, sin guion, etc.; si no, se usa el campo de texto original.
+    """
+    if usar_clave:
+        clave = clave_rut(rut)
+        if clave is not None:
+            return {"rut_num": clave}
+    return {campo: rut}
+
+
+def filtro_ruts(ruts, campo, usar_clave=True):
+    if usar_clave:
+        claves = [c for c in (clave_rut(r) for r in ruts) if c is not None]
+        return {"rut_num": {"$in": claves}}
+    return {campo: {"$in": list(ruts)}}
+
+
+def uno_por_clave(ruts):
+    """
+    Un RUT por clave, en el orden de llegada: '61.202.000-0' y '61202000-0'
+    son el mismo deudor y se procesan una sola vez (con la primera grafía
+    que aparece). Los que no tienen clave se dejan tal cual.
+    """
+    unicos = {}
+    for rut in ruts:
+        rut = str(rut)
+        unicos.setdefault(clave_rut(rut) or rut, rut)
+    return list(unicos.values())
@@ -0,0 +1,305 @@
+from datetime import datetime
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+
+from scripts.estadisticas import TablaPagos
+from scripts.rut import clave_rut, uno_por_clave
+
+# ------------------------------------------------------------
+# Réplica local de solo lectura (SQLite) para /consultar-rut.
+#
+# Después de cada carga se exportan los cruces factura/pago válidos,
+# los morosos impagos, las empresas de los deudores y las estadísticas
+# por (rubro, tramo). La consulta lee de aquí sin cruzar la red a
+# Atlas; solo las empresas que no son deudores se buscan en Mongo.
+# ------------------------------------------------------------
+
+ESQUEMA = """
+CREATE TABLE deudores (rut_num INTEGER, rut TEXT, nombre TEXT);
+CREATE TABLE hechos (
+    rut_num INTEGER, rut TEXT, doc TEXT, ope TEXT, clave_original TEXT,
+    fecha_ces TEXT, fecha_emision TEXT, fecha_pago TEXT, plazo INTEGER, monto
+);
+CREATE TABLE morosos (
+    rut_num INTEGER, rut TEXT, monto, saldo, fecha_ces TEXT, fecha_emision TEXT, vcto TEXT
+);
+CREATE TABLE empresas (rut_num INTEGER, rut TEXT, nombre TEXT, rubro TEXT, tramo TEXT);
+CREATE TABLE pares (rubro TEXT, tramo TEXT, cantidad INTEGER, suma REAL, suma_cuad REAL, PRIMARY KEY (rubro, tramo));
+CREATE TABLE info (clave TEXT PRIMARY KEY, valor TEXT);
+"""
+
+INDICES = """
+CREATE INDEX idx_deudores_rut ON deudores (rut_num, rut);
+CREATE INDEX idx_hechos_rut ON hechos (rut_num, rut);
+CREATE INDEX idx_morosos_rut ON morosos (rut_num, rut);
+CREATE INDEX idx_empresas_rut ON empresas (rut_num, rut);
+CREATE INDEX idx_deudores_texto ON deudores (rut);
+CREATE INDEX idx_hechos_texto ON hechos (rut);
+CREATE INDEX idx_morosos_texto ON morosos (rut);
+CREATE INDEX idx_empresas_texto ON empresas (rut);
+"""
+
+LOTE_EMPRESAS = 1000
+
+
+def _fecha(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else None
+
+
+def _leer_fecha(valor):
+    return datetime.fromisoformat(valor) if valor else None
+
+
+def _valor(valor):
+    # numpy / Decimal / etc. → tipos que SQLite guarda tal cual
+    if hasattr(valor, "item"):
+        valor = valor.item()
+    if isinstance(valor, float) and valor != valor:
+        return None
+    return valor if isinstance(valor, (int, float, str)) or valor is None else str(valor)
+
+
+def generar_snapshot(ruta, ruts, fuente, progreso=None, por_clave=True):
+    """
+    Escribe el snapshot completo en `ruta` (vía archivo temporal + rename
+    atómico, así los lectores nunca ven un archivo a medias).
+
+    - ruts: RUTs deudores a exportar.
+    - fuente: FuenteMongo (cruce / morosos / empresas de los deudores / pares).
+    - por_clave: igual que la fuente (USAR_RUT_NUM). Con rut_num las
+      grafías de un RUT se exportan una sola vez y se consulta por clave;
+      sin él, cada texto por separado y se consulta por texto, como Mongo.
+    """
+    # Temporal propio por llamada: una regeneración tras una carga y otra
+    # manual (o la del arranque) pueden correr a la vez
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(prefix=f"{os.path.basename(ruta)}.", suffix=".tmp", dir=directorio)
+    os.close(descriptor)
+    try:
+        exportados = _escribir_snapshot(temporal, ruts, fuente, progreso, por_clave)
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return exportados
+
+
+def _escribir_snapshot(temporal, ruts, fuente, progreso, por_clave):
+    con = sqlite3.connect(temporal)
+    con.executescript(ESQUEMA)
+
+    plazos_por_rut = {}
+    plazos_por_clave = {}
+    exportados = 0
+
+    ruts = uno_por_clave(ruts) if por_clave else list(dict.fromkeys(str(r) for r in ruts))
+    for rut in ruts:
+        cruce = fuente.cruce(rut)
+        if not cruce:
+            continue
+
+        rut_num = clave_rut(rut)
+        tabla = cruce["registros_validos"]
+        registros = tabla.a_registros()
+
+        con.execute("INSERT INTO deudores VALUES (?, ?, ?)", (rut_num, rut, str(cruce["nombre"])))
+        con.executemany(
+            "INSERT INTO hechos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    rut_num, rut,
+                    r["clave_normalizada"][0], r["clave_normalizada"][1],
+                    json.dumps(r["clave_original"], default=str),
+                    _fecha(r["fecha_ces"]), _fecha(r["fecha_emision"]), _fecha(r["fecha_pago"]),
+                    r["plazo"], _valor(r["monto"]),
+                )
+                for r in registros
+            ]
+        )
+        con.executemany(
+            "INSERT INTO morosos VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    rut_num, rut, _valor(m["monto"]), _valor(m["saldo"]),
+                    _fecha(m["fecha_ces"]), _fecha(m["fecha_emision"]), _fecha(m["vcto"]),
+                )
+                for m in fuente.morosos(rut, cruce)
+            ]
+        )
+        plazos_por_rut[rut] = tabla.plazo.astype(float)
+        plazos_por_clave[rut_num] = plazos_por_rut[rut]
+
+        exportados += 1
+        if progreso and exportados % 200 == 0:
+            progreso(exportados)
+
+    # Empresas de los deudores + estadísticas por (rubro, tramo)
+    pares = {}
+    deudores = list(plazos_por_rut)
+    for i in range(0, len(deudores), LOTE_EMPRESAS):
+        lote = deudores[i:i + LOTE_EMPRESAS]
+        for e in fuente.empresas(lote):
+            rubro, tramo = e.get("rubro"), e.get("tramo_ventas")
+            con.execute(
+                "INSERT INTO empresas VALUES (?, ?, ?, ?, ?)",
+                (clave_rut(e["rut"]), e["rut"], e.get("nombre"), rubro, tramo)
+            )
+            # El almacén columnar devuelve el RUT canónico; se cruza por clave
+            plazos = plazos_por_rut.get(e["rut"])
+            if plazos is None:
+                plazos = plazos_por_clave.get(clave_rut(e["rut"]))
+            if plazos is None:
+                continue
+            acumulado = pares.setdefault((rubro, tramo), [0, 0.0, 0.0])
+            acumulado[0] += len(plazos)
+            acumulado[1] += float(plazos.sum())
+            acumulado[2] += float((plazos * plazos).sum())
+
+    # Con el índice de pares (scripts/indice_pares.py) se usan sus grupos,
+    # así el snapshot responde igual que Mongo para deudores sin historial
+    indexados = fuente.pares_indexados()
+    if indexados:
+        pares = {
+            (p["rubro"], p["tramo"]): [
+                p["cantidad"],
+                p["promedio"] * p["cantidad"],
+                (p["desviacion"] ** 2 + p["promedio"] ** 2) * p["cantidad"],
+            ]
+            for p in indexados
+        }
+
+    con.executemany(
+        "INSERT INTO pares VALUES (?, ?, ?, ?, ?)",
+        [(rubro, tramo, n, suma, suma_cuad) for (rubro, tramo), (n, suma, suma_cuad) in pares.items()]
+    )
+    con.execute("INSERT INTO info VALUES ('generado', ?)", (datetime.now().isoformat(),))
+    con.execute("INSERT INTO info VALUES ('por_clave', ?)", ("1" if por_clave else "0",))
+    con.executescript(INDICES)
+    con.commit()
+    con.close()
+    return exportados
+
+
+class FuenteSnapshot:
+    """
+    Misma interfaz que FuenteMongo, leyendo del snapshot SQLite. Las
+    empresas que no son deudores no están en el snapshot: para esas se
+    usa `respaldo` (normalmente FuenteMongo).
+    """
+
+    def __init__(self, ruta, respaldo):
+        self.ruta = ruta
+        self.respaldo = respaldo
+        self._local = threading.local()
+
+    def disponible(self):
+        return os.path.exists(self.ruta)
+
+    def _conexion(self):
+        # Una conexión por hilo (el threadpool de FastAPI); se reabre si el
+        # archivo fue reemplazado por un snapshot nuevo.
+        mtime = os.path.getmtime(self.ruta)
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.mtime != mtime:
+            if con is not None:
+                con.close()
+            con = sqlite3.connect(f"file:{self.ruta}?mode=ro", uri=True, check_same_thread=False)
+            fila = con.execute("SELECT valor FROM info WHERE clave = 'por_clave'").fetchone()
+            self._local.con = con
+            self._local.mtime = mtime
+            self._local.por_clave = fila is None or fila[0] == "1"
+        return con
+
+    def _filtro(self, rut):
+        # Mismo criterio con que se generó el archivo (ver generar_snapshot);
+        # se llama después de _conexion()
+        clave = clave_rut(rut) if self._local.por_clave else None
+        if clave is not None:
+            return "rut_num = ?", (clave,)
+        return "rut = ?", (rut,)
+
+    def generado(self):
+        fila = self._conexion().execute("SELECT valor FROM info WHERE clave = 'generado'").fetchone()
+        return fila[0] if fila else None
+
+    def cruce(self, rut):
+        con = self._conexion()
+        condicion, parametros = self._filtro(rut)
+
+        deudor = con.execute(f"SELECT nombre FROM deudores WHERE {condicion}", parametros).fetchone()
+        if not deudor:
+            return None
+
+        filas = con.execute(
+            f"SELECT doc, ope, clave_original, fecha_ces, fecha_emision, fecha_pago, plazo, monto "
+            f"FROM hechos WHERE {condicion} ORDER BY rowid",
+            parametros
+        ).fetchall()
+
+        registros_validos = TablaPagos.desde_registros([
+            {
+                "fecha_ces": _leer_fecha(f[3]),
+                "fecha_emision": _leer_fecha(f[4]),
+                "fecha_pago": _leer_fecha(f[5]),
+                "plazo": f[6],
+                "monto": f[7],
+                "clave_normalizada": (f[0], f[1]),
+                "clave_original": json.loads(f[2]),
+            }
+            for f in filas
+        ])
+        registros_limpios, promedio, desviacion = registros_validos.sin_outliers()
+
+        return {
+            "nombre": deudor[0],
+            "registros_validos": registros_validos,
+            "registros_limpios": registros_limpios,
+            "promedio": promedio,
+            "desviacion": desviacion,
+        }
+
+    def morosos(self, rut, cruce):
+        con = self._conexion()
+        condicion, parametros = self._filtro(rut)
+        filas = con.execute(
+            f"SELECT monto, saldo, fecha_ces, fecha_emision, vcto FROM morosos WHERE {condicion} ORDER BY rowid",
+            parametros
+        ).fetchall()
+        return [
+            {
+                "monto": f[0],
+                "saldo": f[1],
+                "fecha_ces": _leer_fecha(f[2]),
+                "fecha_emision": _leer_fecha(f[3]),
+                "vcto": _leer_fecha(f[4]),
+            }
+            for f in filas
+        ]
+
+    def pronostico(self, rut):
+        return self.respaldo.pronostico(rut)
+
+    def empresa(self, rut):
+        con = self._conexion()
+        condicion, parametros = self._filtro(rut)
+        fila = con.execute(
+            f"SELECT rut, nombre, rubro, tramo FROM empresas WHERE {condicion}", parametros
+        ).fetchone()
+        if fila:
+            return {"rut": fila[0], "nombre": fila[1], "rubro": fila[2], "tramo_ventas": fila[3]}
+        return self.respaldo.empresa(rut)
+
+    def similares(self, rubro, tramo):
+        fila = self._conexion().execute(
+            "SELECT cantidad, suma, suma_cuad FROM pares WHERE rubro IS ? AND tramo IS ?", (rubro, tramo)
+        ).fetchone()
+        if not fila or not fila[0]:
+            return None
+        cantidad, suma, suma_cuad = fila
+        promedio = suma / cantidad
+        return cantidad, promedio, max(suma_cuad / cantidad - promedio * promedio, 0.0) ** 0.5
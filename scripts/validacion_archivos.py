@@ -0,0 +1,124 @@
+from scripts.rut import clave_rut
+
+# ------------------------------------------------------------
+# Validación previa de archivos subidos.
+#
+# Se lee solo la cabecera y unas pocas filas (pandas corta la lectura
+# en `nrows`) para rechazar de inmediato un archivo equivocado, antes de
+# lanzar la carga en segundo plano y de parsear el libro completo.
+# pandas se importa al validar, no al importar el módulo (lo importa la
+# API al arrancar).
+# ------------------------------------------------------------
+
+FILAS_MUESTRA = 50
+
+# Columnas que usa el cruce factura/pago (docs)
+COLUMNAS_DOCS = ["RUT DEUDOR", "Nº DCTO", "Nº OPE", "FEC EMISION DIG"]
+
+# Cartola de pagos: hoja "cartola" (o la primera), encabezado en la fila 5
+COLUMNAS_PAGOS = ["Tipo Pago", "Det. Pago", "Tipo Prod.", "Rut Cliente", "Rut Deudor", "Fecha Pago", "Mto.Pagado"]
+FILA_ENCABEZADO_PAGOS = 4
+
+COLUMNAS_EMPRESAS = [
+    "Año comercial", "RUT", "DV", "Razón social",
+    "Tramo según ventas", "Rubro económico"
+]
+
+
+class ArchivoInvalido(ValueError):
+    """Archivo rechazado por la validación previa (status_code: 400 ilegible, 422 contenido)."""
+
+    def __init__(self, mensaje, status_code=422):
+        super().__init__(mensaje)
+        self.status_code = status_code
+
+
+def hoja_pagos(nombres_hojas):
+    return next((h for h in nombres_hojas if "cartola" in h.lower()), nombres_hojas[0])
+
+
+def normalizar_columnas(columnas):
+    return columnas.astype(str).str.strip().str.replace(r'\s+', ' ', regex=True)
+
+
+def _muestra_excel(ruta, header=0, elegir_hoja=None, normalizar=False):
+    import pandas as pd
+    try:
+        xls = pd.ExcelFile(ruta)
+    except Exception as e:
+        raise ArchivoInvalido(f"No se pudo leer el archivo como Excel: {e}", status_code=400)
+    with xls:
+        hoja = elegir_hoja(xls.sheet_names) if elegir_hoja else 0
+        try:
+            df = pd.read_excel(xls, sheet_name=hoja, header=header, nrows=FILAS_MUESTRA)
+        except Exception as e:
+            # Típicamente: la hoja tiene menos filas que la del encabezado
+            raise ArchivoInvalido(f"La hoja '{hoja}' no tiene el formato esperado: {e}")
+    if normalizar:
+        df.columns = normalizar_columnas(df.columns)
+    return df
+
+
+def _exigir_columnas(df, requeridas):
+    faltantes = [c for c in requeridas if c not in df.columns]
+    if faltantes:
+        raise ArchivoInvalido(f"Faltan columnas requeridas: {', '.join(faltantes)}")
+
+
+def _exigir_ruts(serie, columna):
+    valores = serie.dropna()
+    if valores.empty:
+        return
+    validos = sum(clave_rut(v) is not None for v in valores)
+    if validos * 2 < len(valores):
+        raise ArchivoInvalido(f"La columna '{columna}' no parece contener RUTs")
+
+
+def _exigir_fechas(serie, columna):
+    import pandas as pd
+    valores = serie.dropna()
+    if valores.empty:
+        return
+    fechas = pd.to_datetime(valores, errors="coerce", dayfirst=True, format="mixed")
+    if fechas.notna().sum() * 2 < len(valores):
+        raise ArchivoInvalido(f"La columna '{columna}' no parece contener fechas")
+
+
+def validar_docs(ruta):
+    df = _muestra_excel(ruta)
+    _exigir_columnas(df, COLUMNAS_DOCS)
+    _exigir_ruts(df["RUT DEUDOR"], "RUT DEUDOR")
+    _exigir_fechas(df["FEC EMISION DIG"], "FEC EMISION DIG")
+
+
+def validar_pagos(ruta):
+    df = _muestra_excel(ruta, header=FILA_ENCABEZADO_PAGOS, elegir_hoja=hoja_pagos, normalizar=True)
+    _exigir_columnas(df, COLUMNAS_PAGOS)
+    _exigir_ruts(df["Rut Deudor"], "Rut Deudor")
+    _exigir_fechas(df["Fecha Pago"], "Fecha Pago")
+
+
+def validar_empresas(ruta):
+    import pandas as pd
+    try:
+        df = pd.read_csv(ruta, sep="\t", encoding="utf-8", nrows=FILAS_MUESTRA)
+    except Exception as e:
+        raise ArchivoInvalido(f"No se pudo leer el archivo como TXT del SII: {e}", status_code=400)
+    _exigir_columnas(df, COLUMNAS_EMPRESAS)
+    for columna in ["Año comercial", "RUT"]:
+        if pd.to_numeric(df[columna], errors="coerce").isna().any():
+            raise ArchivoInvalido(f"La columna '{columna}' debe ser numérica")
+
+
+VALIDADORES = {
+    "docs": validar_docs,
+    "pagos": validar_pagos,
+    "empresas": validar_empresas,
+}
+
+
+def validar_archivo(tipo, ruta):
+    """Lanza ArchivoInvalido si el archivo no sirve para la carga `tipo`."""
+    validador = VALIDADORES.get(tipo)
+    if validador:
+        validador(ruta)
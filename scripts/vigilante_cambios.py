@@ -0,0 +1,154 @@
+import queue
+import threading
+import time
+
+# ------------------------------------------------------------
+# Vigilante de cambios en docs y pagos.
+#
+# Escucha el change stream de Mongo (Atlas es replica set) y junta los
+# RUTs tocados durante `ventana_segundos`; al cerrar la ventana pasa el
+# lote a un hilo trabajador que recalcula solo esos RUTs. Así también
+# se enteran la API y sus derivados de cambios hechos fuera de ella
+# (scripts/, arreglos a mano).
+#
+# Sin change streams (Mongo standalone local, mongomock) se cae a
+# sondear por _id: solo ve inserciones. Los borrados que llegan sin el
+# documento previo marcan `todo=True` (hay que invalidar todo).
+# ------------------------------------------------------------
+
+CAMPOS_RUT = {"docs": "RUT DEUDOR", "pagos": "Rut Deudor"}
+
+
+class VigilanteCambios:
+
+    def __init__(self, db, al_cambiar, ventana_segundos=5, intervalo_sondeo=10, colecciones=CAMPOS_RUT):
+        """al_cambiar(ruts: set, todo: bool) se llama en el hilo trabajador."""
+        self.db = db
+        self.al_cambiar = al_cambiar
+        self.ventana_segundos = ventana_segundos
+        self.intervalo_sondeo = intervalo_sondeo
+        self.colecciones = colecciones
+
+        self.modo = None  # "change_stream" | "sondeo"
+        self._pre_imagenes = True
+        self.lotes_procesados = 0
+        self._pendientes = set()
+        self._todo = False
+        self._primer_cambio = None
+        self._cola = queue.Queue()
+        self._detener = threading.Event()
+
+    # --- ciclo de vida -------------------------------------------------
+
+    def iniciar(self):
+        threading.Thread(target=self._vigilar, daemon=True).start()
+        threading.Thread(target=self._trabajar, daemon=True).start()
+
+    def detener(self):
+        self._detener.set()
+        self._cola.put(None)
+
+    def estado(self):
+        return {
+            "modo": self.modo,
+            "pendientes": len(self._pendientes),
+            "lotes_procesados": self.lotes_procesados,
+        }
+
+    # --- acumulación con ventana ---------------------------------------
+
+    def _anotar(self, rut=None, todo=False):
+        if rut:
+            self._pendientes.add(str(rut))
+        self._todo = self._todo or todo
+        if self._primer_cambio is None and (self._pendientes or self._todo):
+            self._primer_cambio = time.monotonic()
+
+    def _vaciar_si_corresponde(self, forzar=False):
+        if self._primer_cambio is None:
+            return
+        if not forzar and time.monotonic() - self._primer_cambio < self.ventana_segundos:
+            return
+        self._cola.put((self._pendientes, self._todo))
+        self._pendientes, self._todo, self._primer_cambio = set(), False, None
+
+    def _trabajar(self):
+        while True:
+            lote = self._cola.get()
+            if lote is None:
+                return
+            ruts, todo = lote
+            try:
+                self.al_cambiar(ruts, todo)
+                self.lotes_procesados += 1
+            except Exception as e:
+                print(f"⚠ Error recalculando {len(ruts)} RUTs tras cambios:", e)
+
+    # --- fuentes de cambios --------------------------------------------
+
+    def _vigilar(self):
+        while not self._detener.is_set():
+            try:
+                self._escuchar_change_stream()
+            except Exception as e:
+                if self._pre_imagenes and "fullDocumentBeforeChange" in str(e):
+                    # Mongo < 6.0: sin pre-imágenes, los borrados invalidan todo
+                    self._pre_imagenes = False
+                    continue
+                if self.modo is None and _sin_change_streams(e):
+                    print("ℹ Change streams no disponibles, se sondea por _id:", e)
+                    self._sondear()
+                    return
+                print("⚠ Change stream interrumpido, reintentando:", e)
+                self._vaciar_si_corresponde(forzar=True)
+                self._detener.wait(5)
+
+    def _escuchar_change_stream(self):
+        pipeline = [
+            {"$match": {
+                "ns.coll": {"$in": list(self.colecciones)},
+                "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+            }},
+            {"$project": {
+                "operationType": 1, "ns": 1,
+                **{f"fullDocument.{campo}": 1 for campo in self.colecciones.values()},
+                **{f"fullDocumentBeforeChange.{campo}": 1 for campo in self.colecciones.values()},
+            }},
+        ]
+        opciones = {"full_document": "updateLookup", "max_await_time_ms": 1000}
+        if self._pre_imagenes:
+            opciones["full_document_before_change"] = "whenAvailable"
+        with self.db.watch(pipeline, **opciones) as stream:
+            self.modo = "change_stream"
+            while not self._detener.is_set():
+                cambio = stream.try_next()
+                if cambio is not None:
+                    campo = self.colecciones[cambio["ns"]["coll"]]
+                    documento = cambio.get("fullDocument") or cambio.get("fullDocumentBeforeChange")
+                    if documento and documento.get(campo):
+                        self._anotar(documento[campo])
+                    else:
+                        # Borrado sin pre-imagen: no se sabe qué RUT era
+                        self._anotar(todo=True)
+                self._vaciar_si_corresponde()
+
+    def _sondear(self):
+        self.modo = "sondeo"
+        ultimos = {}
+        for nombre in self.colecciones:
+            ultimo = self.db[nombre].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+            ultimos[nombre] = ultimo["_id"] if ultimo else None
+
+        while not self._detener.wait(self.intervalo_sondeo):
+            for nombre, campo in self.colecciones.items():
+                filtro = {"_id": {"$gt": ultimos[nombre]}} if ultimos[nombre] is not None else {}
+                for doc in self.db[nombre].find(filtro, {campo: 1}).sort("_id", 1):
+                    ultimos[nombre] = doc["_id"]
+                    self._anotar(doc.get(campo))
+            self._vaciar_si_corresponde()
+
+
+def _sin_change_streams(error):
+    # 40573: "The $changeStream stage is only supported on replica sets".
+    # mongomock no tiene watch(): TypeError / NotImplementedError.
+    return getattr(error, "code", None) in (40573, 40324) or isinstance(error, (NotImplementedError, TypeError))